@@ -0,0 +1,49 @@
+"""Benchmark da atribuição ótima especialista → fazenda em dados sintéticos.
+
+Uso: python benchmarks/bench_atribuicao.py [--casos 100x5000 300x20000 500x50000] [--folgas 1.5 1.1]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from raio_atuacao.atribuicao import SEM_ATRIBUICAO, atribuir_fazendas
+
+
+def gerar_pontos(n_esp, n_faz, seed=0):
+    """Bases e centróides uniformes numa caixa do Centro-Oeste (lon, lat em graus)."""
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(-60, -45, n_esp), rng.uniform(-20, -8, n_esp),
+            rng.uniform(-60, -45, n_faz), rng.uniform(-20, -8, n_faz))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--casos", nargs="+", default=["100x5000", "300x20000", "500x50000"],
+                        help="Especialistas x fazendas")
+    parser.add_argument("--folgas", type=float, nargs="+", default=[1.5, 1.1],
+                        help="Capacidade total / número de fazendas")
+    parser.add_argument("--raio", type=float, default=None, help="Raio máximo (km)")
+    args = parser.parse_args()
+
+    print(f"{'esp':>6} {'fazendas':>9} {'folga':>6} {'tempo (s)':>10} {'sem esp.':>9} {'média (km)':>11} {'mais próximo (km)':>18}")
+    for caso in args.casos:
+        n_esp, n_faz = map(int, caso.split("x"))
+        lon_e, lat_e, lon_f, lat_f = gerar_pontos(n_esp, n_faz)
+        for folga in args.folgas:
+            capacidade = int(np.ceil(folga * n_faz / n_esp))
+            inicio = time.perf_counter()
+            atribuido, distancias = atribuir_fazendas(lon_e, lat_e, lon_f, lat_f, capacidade, args.raio)
+            segundos = time.perf_counter() - inicio
+            # Limite inferior: cada fazenda no especialista mais próximo, sem capacidade
+            _, livre = atribuir_fazendas(lon_e, lat_e, lon_f, lat_f, n_faz, args.raio, k=1)
+            print(f"{n_esp:>6} {n_faz:>9} {folga:>6.2f} {segundos:>10.2f} "
+                  f"{(atribuido == SEM_ATRIBUICAO).sum():>9} {np.nanmean(distancias):>11.1f} {np.nanmean(livre):>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
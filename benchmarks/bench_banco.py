@@ -0,0 +1,101 @@
+"""Benchmark das consultas espaciais de mapa_dados.db (R*Tree + WKB) contra a leitura completa.
+
+Grava `--fazendas` fazendas sintéticas com migrar_dados e mede a latência de
+fazendas_na_caixa, fazendas_no_raio e fazendas_do_especialista em pontos aleatórios,
+comparando com ler e decodificar a tabela inteira, como era preciso com geometria_json.
+
+Uso: python benchmarks/bench_banco.py [--fazendas 200000] [--consultas 200] [--raio 30]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from raio_atuacao.analistas import preparar_analistas
+from raio_atuacao.banco import (conectar, criar_tabelas, fazendas_do_especialista, fazendas_na_caixa,
+                                fazendas_no_raio, migrar_dados)
+from raio_atuacao.texto import normalizar_serie
+from sinteticos import CAIXA, centros_fazendas, gerar_analistas, nomes_fazendas
+
+# Raio dos polígonos sintéticos, em graus (~2 km)
+RAIO_FAZENDA_GRAUS = 0.02
+
+
+def gdf_sintetico(n):
+    """Fazendas como octógonos em EPSG:4326, sem passar por KML (mais rápido para n grande)."""
+    lon, lat = centros_fazendas(n)
+    nomes = nomes_fazendas(n)
+    return gpd.GeoDataFrame({
+        "NOME_FAZ": nomes,
+        "UNIDADE_normalized": normalizar_serie(pd.Series(nomes)).to_numpy(),
+    }, geometry=shapely.buffer(shapely.points(lon, lat), RAIO_FAZENDA_GRAUS, quad_segs=2), crs="EPSG:4326")
+
+
+def latencias(funcao, argumentos):
+    tempos, linhas = [], 0
+    for args in argumentos:
+        inicio = time.perf_counter()
+        linhas += len(funcao(*args))
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos), np.percentile(tempos, 95), linhas / len(argumentos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fazendas", type=int, default=200_000)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--raio", type=float, default=30.0, help="Raio (km) de fazendas_no_raio e meia-largura da caixa")
+    args = parser.parse_args()
+
+    gdf_kml = gdf_sintetico(args.fazendas)
+    df_analistas = preparar_analistas(gerar_analistas(args.fazendas))
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, "bench.db")
+        conn = conectar(caminho)
+        criar_tabelas(conn)
+        gravacao = migrar_dados(conn, df_analistas, gdf_kml)
+        print(f"{gravacao['fazendas']} fazendas gravadas em {gravacao['segundos']:.2f} s; "
+              f"banco com {os.path.getsize(caminho) / 1e6:.1f} MB")
+
+        rng = np.random.default_rng(1)
+        lon_min, lat_min, lon_max, lat_max = CAIXA
+        lon, lat = rng.uniform(lon_min, lon_max, args.consultas), rng.uniform(lat_min, lat_max, args.consultas)
+        meia = args.raio / 110.0
+        ids = [linha[0] for linha in conn.execute("SELECT id FROM especialistas ORDER BY random() LIMIT ?", (args.consultas,))]
+
+        print(f"{'Consulta':<26}{'mediana':>10}{'p95':>10}{'linhas':>10}")
+        for nome, funcao, argumentos in [
+            ("fazendas_na_caixa", fazendas_na_caixa,
+             [(conn, x - meia, y - meia, x + meia, y + meia) for x, y in zip(lon, lat)]),
+            ("fazendas_no_raio", fazendas_no_raio, [(conn, y, x, args.raio) for x, y in zip(lon, lat)]),
+            ("fazendas_do_especialista", fazendas_do_especialista, [(conn, i) for i in ids]),
+        ]:
+            mediana, p95, linhas = latencias(funcao, argumentos)
+            print(f"{nome:<26}{mediana:>8.2f}ms{p95:>8.2f}ms{linhas:>10.0f}")
+
+        inicio = time.perf_counter()
+        blobs = [linha[0] for linha in conn.execute("SELECT geometria_wkb FROM fazendas")]
+        geometrias = shapely.from_wkb(blobs)
+        wkb_s = time.perf_counter() - inicio
+        textos = shapely.to_geojson(geometrias)
+        inicio = time.perf_counter()
+        shapely.from_geojson(textos)
+        json_s = time.perf_counter() - inicio
+        print(f"Leitura completa da tabela: {wkb_s * 1000:.0f} ms em WKB; decodificar as mesmas geometrias "
+              f"de GeoJSON: {json_s * 1000:.0f} ms")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
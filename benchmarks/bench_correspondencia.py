@@ -0,0 +1,74 @@
+"""Benchmark da correspondência aproximada UNIDADE ↔ NOME_FAZ em dados sintéticos.
+
+Uso: python benchmarks/bench_correspondencia.py [--tamanhos 1000 10000 30000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Levenshtein
+
+from raio_atuacao.correspondencia import corresponder, normalizar_chave
+
+PREFIXOS = ["FAZENDA", "FAZ.", "SÍTIO", "AGROPECUÁRIA", "ESTÂNCIA"]
+NOMES = ["SÃO JOÃO", "SANTA RITA", "BOA VISTA", "PARAÍSO", "ÁGUA LIMPA", "SÃO JOSÉ", "ESPERANÇA",
+         "TRÊS IRMÃOS", "PALMEIRAS", "CAPÃO BONITO", "RIO VERDE", "SERRA AZUL", "BURITI", "JATOBÁ"]
+
+
+def gerar_nomes(n, seed=0):
+    """Gera `n` nomes de fazendas distintos e versões com acentos removidos, typos e palavras trocadas."""
+    rnd = random.Random(seed)
+    originais = [f"{rnd.choice(PREFIXOS)} {rnd.choice(NOMES)} {i}" for i in range(n)]
+    alterados = []
+    for nome in originais:
+        r = rnd.random()
+        if r < 0.3:
+            nome = nome.replace("Ã", "A").replace("Í", "I").replace("É", "E").replace("Á", "A").replace("Ê", "E")
+        elif r < 0.5:
+            pos = rnd.randrange(len(nome))
+            nome = nome[:pos] + rnd.choice("ABCDEFGHIJKLMNOPRSTUV") + nome[pos + 1:]
+        elif r < 0.6:
+            partes = nome.split()
+            nome = " ".join(partes[1:] + partes[:1])
+        alterados.append(nome.lower() if rnd.random() < 0.2 else nome)
+    return alterados, originais
+
+
+def todos_os_pares(esquerda, direita):
+    """Referência ingênua O(n·m): compara cada item com todos os da direita."""
+    chaves = [normalizar_chave(v) for v in direita]
+    resultado = []
+    for valor in esquerda:
+        chave = normalizar_chave(valor)
+        resultado.append(max(range(len(direita)), key=lambda j: Levenshtein.ratio(chave, chaves[j])))
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000, 30000])
+    parser.add_argument("--ingenuo-ate", type=int, default=2000, help="Maior tamanho em que a referência O(n·m) é medida")
+    args = parser.parse_args()
+
+    print(f"{'n':>8} {'blocagem (s)':>13} {'itens/s':>9} {'casados':>8} {'corretos':>9} {'ingênuo (s)':>12}")
+    for n in args.tamanhos:
+        excel, kml = gerar_nomes(n)
+        inicio = time.perf_counter()
+        correspondencias, _ = corresponder(excel, kml)
+        segundos = time.perf_counter() - inicio
+        esperado = dict(zip(excel, kml))
+        corretos = (correspondencias["direita"] == correspondencias["esquerda"].map(esperado)).sum()
+        ingenuo = "-"
+        if n <= args.ingenuo_ate:
+            inicio = time.perf_counter()
+            todos_os_pares(excel, kml)
+            ingenuo = f"{time.perf_counter() - inicio:.2f}"
+        print(f"{n:>8} {segundos:>13.2f} {n / segundos:>9.0f} {len(correspondencias):>8} {corretos:>9} {ingenuo:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark da ingestão incremental (migrar_incremental) contra a migração completa.
+
+Gera `--fazendas` fazendas sintéticas, migra uma vez e aplica uma atualização
+semanal com `--fracao` das fazendas removidas, alteradas e novas (e linhas da
+planilha trocadas de especialista). Mede a ingestão completa da atualização num
+banco vazio e a incremental sobre o banco anterior, com e sem mudança na planilha,
+e confere que o banco e o dataset preparado resultantes são iguais.
+
+Uso: python benchmarks/bench_ingestao.py [--fazendas 20000] [--fracao 0.01] [--repeticoes 3]
+"""
+import argparse
+import io
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+from raio_atuacao.migracao import migrar_incremental
+from sinteticos import atualizar_entradas, gerar_analistas, gerar_kml
+
+# Vínculos comparados entre a ingestão completa e a incremental
+SQL_VINCULOS = """
+    SELECT f.nome_fazenda, e.nome, e.gestor, e.latitude_base, e.longitude_base,
+           f.latitude_centroide, f.longitude_centroide, f.geometria_wkb
+    FROM fazendas f JOIN especialistas e ON e.id = f.especialista_id
+    ORDER BY f.nome_fazenda, e.nome
+"""
+
+
+def para_excel(df):
+    saida = io.BytesIO()
+    df.to_excel(saida, index=False)
+    return saida.getvalue()
+
+
+def vinculos(caminho):
+    conn = sqlite3.connect(caminho)
+    try:
+        return conn.execute(SQL_VINCULOS).fetchall()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fazendas", type=int, default=20_000)
+    parser.add_argument("--fracao", type=float, default=0.01)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    kml_1, df_1 = gerar_kml(args.fazendas), gerar_analistas(args.fazendas)
+    kml_2, df_2 = atualizar_entradas(kml_1, df_1, args.fracao)
+    xlsx_1, xlsx_2 = para_excel(df_1), para_excel(df_2)
+
+    diretorio = tempfile.mkdtemp()
+    os.environ["RAIO_DADOS_PREPARADOS"] = os.path.join(diretorio, "preparados")
+    try:
+        cenarios = [
+            ("completa (banco vazio)", None, kml_2, xlsx_2),
+            ("incremental, KML e planilha", (kml_1, xlsx_1), kml_2, xlsx_2),
+            ("incremental, só KML", (kml_1, xlsx_2), kml_2, xlsx_2),
+            ("incremental, sem mudanças", (kml_2, xlsx_2), kml_2, xlsx_2),
+        ]
+        print(f"{'Ingestão':<30}{'mediana':>10}{'gravados':>10}{'removidos':>10}  fazendas (novas/alteradas/removidas)")
+        finais = {}
+        for nome, anterior, kml, xlsx in cenarios:
+            tempos = []
+            for _ in range(args.repeticoes):
+                shutil.rmtree(os.environ["RAIO_DADOS_PREPARADOS"], ignore_errors=True)
+                caminho = os.path.join(diretorio, "bench.db")
+                if os.path.exists(caminho):
+                    os.remove(caminho)
+                if anterior is not None:
+                    migrar_incremental(*anterior, caminho_banco=caminho)
+                inicio = time.perf_counter()
+                resultado = migrar_incremental(kml, xlsx, caminho_banco=caminho)
+                tempos.append(time.perf_counter() - inicio)
+            delta = resultado["delta"]
+            print(f"{nome:<30}{statistics.median(tempos):>9.2f}s{delta['vinculos_gravados']:>10}"
+                  f"{delta['vinculos_removidos']:>10}  {delta['fazendas']['novas']}/{delta['fazendas']['alteradas']}/"
+                  f"{delta['fazendas']['removidas']}")
+            chave = ["ESPECIALISTA", "UNIDADE", "UNIDADE_normalized"]
+            finais[nome] = (vinculos(caminho),
+                            resultado["df_analistas"].sort_values(chave)[chave + ["DISTANCIA_KM"]].reset_index(drop=True))
+
+        referencia = finais[cenarios[0][0]]
+        for nome, (banco, df) in finais.items():
+            iguais = banco == referencia[0] and df.equals(referencia[1])
+            if not iguais:
+                print(f"ATENÇÃO: '{nome}' difere da ingestão completa")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
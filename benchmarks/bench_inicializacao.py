@@ -0,0 +1,91 @@
+"""Benchmark de inicialização: import do núcleo e primeira renderização do app, sempre em processo novo.
+
+Mede (1) o tempo de import de raio_atuacao e quais módulos pesados ele carrega, (2) a
+primeira execução do streamlit_app.py sem dados, como num contêiner recém-criado, e
+(3) a primeira execução com um dataset preparado sintético já gravado.
+
+Uso: python benchmarks/bench_inicializacao.py [--repeticoes 3] [--fazendas 1000]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+PESADOS = ["streamlit", "geopandas", "shapely", "folium", "pyproj", "requests", "sqlite3", "Levenshtein", "pyarrow"]
+
+SCRIPT_IMPORT = """
+import json, sys, time
+inicio = time.perf_counter()
+import raio_atuacao, raio_atuacao.lote, raio_atuacao.texto, raio_atuacao.distancia
+segundos = time.perf_counter() - inicio
+print(json.dumps({"segundos": segundos, "pesados": [m for m in %r if m in sys.modules]}))
+"""
+
+SCRIPT_APP = """
+import json, logging, time, warnings
+warnings.filterwarnings("ignore")
+logging.disable(logging.CRITICAL)
+from streamlit.testing.v1 import AppTest
+inicio = time.perf_counter()
+at = AppTest.from_file(%r, default_timeout=600)
+at.run()
+print(json.dumps({"segundos": time.perf_counter() - inicio, "excecoes": len(at.exception)}))
+"""
+
+
+def rodar(script, env=None):
+    saida = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=RAIZ,
+                           env={**os.environ, **(env or {})}, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def preparar_dataset_sintetico(n, diretorio):
+    """Grava um dataset preparado com `n` fazendas para a sessão abrir já com dados."""
+    import io
+    import pandas as pd
+    from raio_atuacao.analistas import preparar_analistas
+    from raio_atuacao.kml import ler_kml, reprojetar_utm
+    from raio_atuacao.preparados import hash_conteudo, preparar_dataset, salvar_preparados
+    from sinteticos import gerar_excel, gerar_kml
+
+    kml, xlsx = gerar_kml(n), gerar_excel(n)
+    gdf_kml, _ = reprojetar_utm(ler_kml(kml))
+    df_analistas = preparar_analistas(pd.read_excel(io.BytesIO(xlsx)))
+    df_analistas, gdf_kml = preparar_dataset(df_analistas, gdf_kml)
+    salvar_preparados(hash_conteudo(kml, xlsx), df_analistas, gdf_kml, diretorio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--fazendas", type=int, default=1000, help="Fazendas do dataset preparado")
+    parser.add_argument("--app", default=os.path.join(RAIZ, "streamlit_app.py"))
+    args = parser.parse_args()
+
+    importacoes = [rodar(SCRIPT_IMPORT % PESADOS) for _ in range(args.repeticoes)]
+    print(f"import raio_atuacao (+lote, texto, distancia): {statistics.median(i['segundos'] for i in importacoes):.2f} s; "
+          f"módulos pesados carregados: {', '.join(importacoes[0]['pesados']) or 'nenhum'}")
+
+    with tempfile.TemporaryDirectory() as vazio, tempfile.TemporaryDirectory() as preparados:
+        env_vazio = {"RAIO_DADOS_PREPARADOS": vazio, "RAIO_ROTAS_CACHE": os.path.join(vazio, "rotas.db")}
+        sem_dados = [rodar(SCRIPT_APP % args.app, env_vazio) for _ in range(args.repeticoes)]
+        print(f"primeira renderização sem dados: {statistics.median(r['segundos'] for r in sem_dados):.2f} s")
+
+        preparar_dataset_sintetico(args.fazendas, preparados)
+        env_dados = {"RAIO_DADOS_PREPARADOS": preparados, "RAIO_ROTAS_CACHE": os.path.join(preparados, "rotas.db")}
+        com_dados = [rodar(SCRIPT_APP % args.app, env_dados) for _ in range(args.repeticoes)]
+        print(f"primeira renderização com {args.fazendas} fazendas preparadas: "
+              f"{statistics.median(r['segundos'] for r in com_dados):.2f} s")
+        if any(r["excecoes"] for r in sem_dados + com_dados):
+            print("ATENÇÃO: o app levantou exceções durante a renderização")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark da leitura de vários KMLs (ler_kmls) contra um KML único com as mesmas fazendas.
+
+Gera `--fazendas` fazendas sintéticas, divide o KML em `--arquivos` arquivos (com
+fazendas partidas entre arquivos vizinhos) e mede ler_kml no arquivo único e
+ler_kmls com 1 processo e com `--processos`, conferindo que o resultado é o mesmo.
+
+Uso: python benchmarks/bench_kmls.py [--fazendas 20000] [--arquivos 4] [--processos 4] [--repeticoes 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+from raio_atuacao.kml import ler_kml
+from raio_atuacao.migracao import ler_kmls
+from sinteticos import dividir_kml, gerar_kml
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fazendas", type=int, default=20_000)
+    parser.add_argument("--arquivos", type=int, default=4)
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    kml = gerar_kml(args.fazendas)
+    arquivos = dividir_kml(kml, args.arquivos)
+    print(f"{os.cpu_count()} CPUs, {args.fazendas} fazendas em {len(kml) / 1e6:.0f} MB")
+    print(f"{'Leitura':<34}{'mediana':>10}{'fazendas':>10}")
+    segundos, referencia = medir(lambda: ler_kml(kml), args.repeticoes)
+    print(f"{'ler_kml, 1 arquivo':<34}{segundos:>9.2f}s{len(referencia):>10}")
+    for processos in sorted({1, args.processos}):
+        segundos, (gdf, _, _) = medir(lambda: ler_kmls(arquivos, processos=processos), args.repeticoes)
+        print(f"{f'ler_kmls, {len(arquivos)} arquivos, {processos} proc.':<34}{segundos:>9.2f}s{len(gdf):>10}")
+        iguais = (gdf["UNIDADE_normalized"].equals(referencia["UNIDADE_normalized"])
+                  and gdf.geometry.geom_equals(referencia.geometry, align=False).all())
+        if not iguais:
+            print("ATENÇÃO: resultado difere do arquivo único")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark da malha viária offline: conversão, busca em lote, tempos até fazendas e isócronas.
+
+Gera uma malha sintética de `--lado`² cruzamentos com gerar_malha, converte-a com
+GrafoViario.de_linhas e mede a busca por lote de origens (sem limite e com `--limite`
+minutos), os tempos de direção de bases aleatórias até `--fazendas` fazendas e o
+contorno das isócronas.
+
+Uso: python benchmarks/bench_malha.py [--lado 700] [--fazendas 20000] [--bases 100] [--limite 240]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+import numpy as np
+
+from raio_atuacao.malha import ORIGENS_POR_LOTE, GrafoViario, isocronas, tempos_ate_fazendas
+from sinteticos import CAIXA, centros_fazendas, gerar_malha
+
+
+def cronometrar(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lado", type=int, default=700, help="Cruzamentos por lado da malha sintética")
+    parser.add_argument("--fazendas", type=int, default=20_000)
+    parser.add_argument("--bases", type=int, default=100)
+    parser.add_argument("--limite", type=float, default=240.0, help="Limite (min) da busca limitada e das isócronas")
+    args = parser.parse_args()
+
+    linhas, gerar_s = cronometrar(gerar_malha, args.lado)
+    grafo, construir_s = cronometrar(GrafoViario.de_linhas, linhas)
+    with tempfile.TemporaryDirectory() as diretorio:
+        grafo.salvar(diretorio)
+        disco = sum(os.path.getsize(os.path.join(diretorio, nome)) for nome in os.listdir(diretorio))
+        grafo, carregar_s = cronometrar(GrafoViario.carregar, diretorio)
+        print(f"{len(linhas)} segmentos gerados em {gerar_s:.1f} s; grafo com {len(grafo)} nós e "
+              f"{grafo.n_arestas} arestas convertido em {construir_s:.1f} s, {disco / 1e6:.1f} MB em disco, "
+              f"carregado em {carregar_s * 1000:.0f} ms")
+
+        rng = np.random.default_rng(2)
+        lon_min, lat_min, lon_max, lat_max = CAIXA
+        lon_base = rng.uniform(lon_min, lon_max, args.bases)
+        lat_base = rng.uniform(lat_min, lat_max, args.bases)
+        _, indice_s = cronometrar(grafo.mais_proximos, lon_base, lat_base)
+        origens, _ = grafo.mais_proximos(lon_base[:ORIGENS_POR_LOTE], lat_base[:ORIGENS_POR_LOTE])
+
+        print(f"{'Medida':<40}{'tempo':>10}")
+        print(f"{'índice de nós (STRtree)':<40}{indice_s:>9.2f}s")
+        _, livre_s = cronometrar(grafo.tempos_a_partir, origens)
+        print(f"{f'busca, {origens.size} origens, sem limite':<40}{livre_s:>9.2f}s")
+        _, limitada_s = cronometrar(grafo.tempos_a_partir, origens, limite_s=args.limite * 60)
+        print(f"{f'busca, {origens.size} origens, {args.limite:.0f} min':<40}{limitada_s:>9.2f}s")
+
+        lon_faz, lat_faz = centros_fazendas(args.fazendas)
+        qual = rng.integers(0, args.bases, args.fazendas)
+        minutos, tempos_s = cronometrar(tempos_ate_fazendas, grafo, lon_base[qual], lat_base[qual], lon_faz, lat_faz)
+        print(f"{f'tempos de {args.bases} bases a {args.fazendas} fazendas':<40}{tempos_s:>9.2f}s")
+        poligonos, isocronas_s = cronometrar(isocronas, grafo, lon_base, lat_base, np.full(args.bases, args.limite))
+        print(f"{f'{args.bases} isócronas de {args.limite:.0f} min':<40}{isocronas_s:>9.2f}s")
+        print(f"Fazendas alcançáveis: {np.isfinite(minutos).mean():.1%}; mediana de {np.nanmedian(minutos):.0f} min; "
+              f"isócronas vazias: {sum(p is None for p in poligonos)}")
+
+
+if __name__ == "__main__":
+    main()
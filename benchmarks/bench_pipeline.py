@@ -0,0 +1,186 @@
+"""Benchmark das etapas do pipeline (KML, migração, mapas, Cidades Próximas) em várias escalas.
+
+Roda sem Streamlit e sem rede, sobre entradas de benchmarks/sinteticos.py, e grava
+tempo de parede e pico de memória de cada etapa num baseline JSON. Com --comparar,
+aponta as etapas que ficaram mais lentas que o baseline anterior além da tolerância.
+
+Uso: python benchmarks/bench_pipeline.py [--tamanhos 1000 10000 100000] [--saida baseline.json]
+                                         [--comparar baseline_anterior.json]
+"""
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+from raio_atuacao.analistas import preparar_analistas
+from raio_atuacao.banco import conectar, criar_tabelas, migrar_dados
+from raio_atuacao.correspondencia import alinhar_unidades
+from raio_atuacao.indice import IndicePontos, preparar_cidades
+from raio_atuacao.kml import ler_kml, reprojetar_utm
+from raio_atuacao.hexagonos import GradeHexagonal
+from raio_atuacao.mapa import base_mapa_analistas, construir_mapa_analistas, construir_mapa_densidade, medir_mapa
+from raio_atuacao.preparados import preparar_dataset
+
+from sinteticos import gerar_cidades, gerar_excel, gerar_kml
+
+# Consultas de Cidades Próximas por escala (fazendas sorteadas)
+CONSULTAS_CIDADES = 200
+RAIO_CIDADES_KM = 50
+
+
+def medir(funcao, *args, memoria=True):
+    """Executa `funcao` e retorna (resultado, segundos, pico em MB).
+
+    O pico vem do tracemalloc (alocações do Python e do numpy) numa segunda
+    execução, para que o rastreamento não distorça o tempo.
+    """
+    gc.collect()
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    segundos = time.perf_counter() - inicio
+    pico = None
+    if memoria:
+        del resultado
+        gc.collect()
+        tracemalloc.start()
+        resultado = funcao(*args)
+        pico = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return resultado, segundos, pico
+
+
+def etapa_kml(kml_bytes):
+    """Equivalente a extrair_dados_kml: leitura do KML e reprojeção para UTM."""
+    gdf, _ = reprojetar_utm(ler_kml(kml_bytes))
+    return gdf
+
+
+def etapa_migrar(xlsx_bytes, gdf_kml, caminho_banco):
+    """Equivalente a migrar: planilha, correspondência, gravação no SQLite e dataset preparado."""
+    df_analistas = preparar_analistas(pd.read_excel(io.BytesIO(xlsx_bytes)))
+    df_analistas, _, _ = alinhar_unidades(df_analistas, gdf_kml)
+    conn = conectar(caminho_banco)
+    try:
+        criar_tabelas(conn)
+        migrar_dados(conn, df_analistas, gdf_kml)
+    finally:
+        conn.close()
+    return preparar_dataset(df_analistas, gdf_kml)
+
+
+def etapa_mapa(df_analistas, gdf_kml):
+    """Mapa de Analistas de todas as fazendas no modo leve, como no app: base, construção e HTML renderizado."""
+    base = base_mapa_analistas(df_analistas, gdf_kml)
+    mapa = construir_mapa_analistas(df_analistas, gdf_kml, "Todos", "Todos", modo_leve=True, base=base)
+    tamanho, _ = medir_mapa(mapa)
+    return tamanho
+
+
+def etapa_densidade(df_analistas, gdf_kml):
+    """Grade hexagonal com agregados de todas as resoluções e mapa de densidade renderizado em HTML."""
+    grade = GradeHexagonal(base_mapa_analistas(df_analistas, gdf_kml), gdf_kml)
+    tamanho, _ = medir_mapa(construir_mapa_densidade(grade))
+    return tamanho
+
+
+def etapa_cidades(geojson_bytes, gdf_kml, consultas):
+    """Leitura/índice das cidades e consultas de raio a partir de fazendas, como na aba Cidades Próximas."""
+    cidades = preparar_cidades(gpd.read_file(io.BytesIO(geojson_bytes)))
+    indice = IndicePontos(cidades["LON_CENTROIDE"], cidades["LAT_CENTROIDE"])
+    geometrias = gdf_kml.geometry.to_numpy()
+    return sum(len(indice.perto_da_geometria(geometrias[i], gdf_kml.crs, RAIO_CIDADES_KM)) for i in consultas)
+
+
+def rodar_escala(n, vertices, n_cidades, memoria, diretorio):
+    """Mede as cinco etapas para `n` fazendas; retorna a lista de resultados."""
+    kml_bytes, xlsx_bytes = gerar_kml(n, vertices), gerar_excel(n)
+    geojson_bytes = gerar_cidades(n_cidades)
+    resultados = []
+
+    def registrar(etapa, segundos, pico, **extras):
+        resultados.append({"etapa": etapa, "fazendas": n, "segundos": round(segundos, 4),
+                           "pico_mb": None if pico is None else round(pico, 1), **extras})
+        print(f"{etapa:>18} {n:>8} {segundos:>10.2f} {'-' if pico is None else f'{pico:.0f}':>10}", flush=True)
+
+    gdf_kml, segundos, pico = medir(etapa_kml, kml_bytes, memoria=memoria)
+    registrar("extrair_kml", segundos, pico, bytes_entrada=len(kml_bytes), linhas=len(gdf_kml))
+
+    caminho_banco = os.path.join(diretorio, f"bench_{n}.db")
+    (df_analistas, gdf_prep), segundos, pico = medir(etapa_migrar, xlsx_bytes, gdf_kml, caminho_banco, memoria=memoria)
+    registrar("migrar", segundos, pico, bytes_entrada=len(xlsx_bytes), linhas=len(df_analistas))
+
+    tamanho, segundos, pico = medir(etapa_mapa, df_analistas, gdf_prep, memoria=memoria)
+    registrar("mapa_leve", segundos, pico, bytes_html=tamanho)
+
+    tamanho, segundos, pico = medir(etapa_densidade, df_analistas, gdf_prep, memoria=memoria)
+    registrar("mapa_densidade", segundos, pico, bytes_html=tamanho)
+
+    consultas = np.random.default_rng(0).choice(len(gdf_kml), min(CONSULTAS_CIDADES, len(gdf_kml)), replace=False)
+    encontradas, segundos, pico = medir(etapa_cidades, geojson_bytes, gdf_kml, consultas, memoria=memoria)
+    registrar("cidades_proximas", segundos, pico, consultas=len(consultas), cidades_encontradas=int(encontradas))
+    return resultados
+
+
+def comparar(resultados, anterior, tolerancia):
+    """Etapas mais lentas que o baseline anterior por mais de `tolerancia` (fração)."""
+    base = {(r["etapa"], r["fazendas"]): r["segundos"] for r in anterior["resultados"]}
+    regressoes = []
+    for r in resultados:
+        antes = base.get((r["etapa"], r["fazendas"]))
+        if antes and r["segundos"] > antes * (1 + tolerancia):
+            regressoes.append((r["etapa"], r["fazendas"], antes, r["segundos"]))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--vertices", type=int, default=20, help="Vértices por polígono de fazenda")
+    parser.add_argument("--cidades", type=int, default=5570, help="Municípios no GeoJSON sintético")
+    parser.add_argument("--sem-memoria", action="store_true", help="Não mede o pico de memória (metade do tempo)")
+    parser.add_argument("--saida", default="baseline.json")
+    parser.add_argument("--comparar", help="Baseline anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Aumento de tempo aceito na comparação")
+    args = parser.parse_args()
+
+    print(f"{'etapa':>18} {'fazendas':>8} {'tempo (s)':>10} {'pico (MB)':>10}")
+    resultados = []
+    with tempfile.TemporaryDirectory() as diretorio:
+        for n in args.tamanhos:
+            resultados += rodar_escala(n, args.vertices, args.cidades, not args.sem_memoria, diretorio)
+
+    baseline = {
+        "gerado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {"vertices": args.vertices, "cidades": args.cidades},
+        "resultados": resultados,
+    }
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, ensure_ascii=False)
+    print(f"Baseline gravado em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regressoes = comparar(resultados, json.load(f), args.tolerancia)
+        for etapa, n, antes, depois in regressoes:
+            print(f"REGRESSÃO {etapa} ({n} fazendas): {antes:.2f} s → {depois:.2f} s")
+        if regressoes:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Geradores determinísticos de entradas sintéticas: KML/KMZ de fazendas, planilha de analistas, cidades IBGE e malha viária.
+
+Fazendas e especialistas ficam numa caixa do Centro-Oeste; os nomes da planilha
+coincidem com NOME_FAZ do KML, exceto uma fração com acentos removidos ou erros de
+digitação, para exercitar a correspondência aproximada.
+"""
+import io
+import json
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+# Caixa (lon_min, lat_min, lon_max, lat_max) onde caem fazendas, bases e cidades
+CAIXA = (-60.0, -20.0, -45.0, -8.0)
+FAZENDAS_POR_ESPECIALISTA = 100
+ESPECIALISTAS_POR_GESTOR = 8
+# Fração dos nomes da planilha alterados em relação ao KML
+FRACAO_ALTERADOS = 0.05
+NOMES = ["SÃO JOÃO", "SANTA RITA", "BOA VISTA", "PARAÍSO", "ÁGUA LIMPA", "SÃO JOSÉ", "ESPERANÇA",
+         "TRÊS IRMÃOS", "PALMEIRAS", "CAPÃO BONITO", "RIO VERDE", "SERRA AZUL", "BURITI", "JATOBÁ"]
+# Códigos IBGE de UF presentes na caixa (MT, GO, BA, MS, TO, PA)
+UFS = ["51", "52", "29", "50", "17", "15"]
+
+
+def nomes_fazendas(n, seed=0):
+    """Nomes distintos e estáveis para `n` fazendas."""
+    rng = np.random.default_rng(seed)
+    return [f"FAZENDA {NOMES[j]} {i}" for i, j in enumerate(rng.integers(0, len(NOMES), n))]
+
+
+def centros_fazendas(n, seed=0):
+    """Centros (lon, lat) das `n` fazendas."""
+    rng = np.random.default_rng(seed)
+    lon_min, lat_min, lon_max, lat_max = CAIXA
+    return rng.uniform(lon_min, lon_max, n), rng.uniform(lat_min, lat_max, n)
+
+
+def _anel(lon, lat, raio_graus, vertices, rng):
+    """Anel fechado irregular em torno de (lon, lat), em texto de coordenadas KML."""
+    angulos = np.sort(rng.uniform(0, 2 * np.pi, vertices))
+    raios = raio_graus * rng.uniform(0.6, 1.0, vertices)
+    xs = np.append(lon + raios * np.cos(angulos), lon + raios[0] * np.cos(angulos[0]))
+    ys = np.append(lat + raios * np.sin(angulos), lat + raios[0] * np.sin(angulos[0]))
+    return " ".join(f"{x:.7f},{y:.7f},0" for x, y in zip(xs, ys))
+
+
+def gerar_kml(n, vertices=20, seed=0, kmz=False, fracao_multi=0.05):
+    """KML (ou KMZ) com `n` placemarks poligonais de `vertices` vértices cada.
+
+    Uma fração `fracao_multi` vira MultiGeometry com dois polígonos.
+    """
+    rng = np.random.default_rng(seed + 1)
+    lon, lat = centros_fazendas(n, seed)
+    partes = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<kml xmlns="http://www.opengis.net/kml/2.2"><Document><Folder><name>Fazendas</name>']
+    for i, nome in enumerate(nomes_fazendas(n, seed)):
+        raio = rng.uniform(0.005, 0.03)
+        poligono = ("<Polygon><outerBoundaryIs><LinearRing><coordinates>"
+                    f"{_anel(lon[i], lat[i], raio, vertices, rng)}"
+                    "</coordinates></LinearRing></outerBoundaryIs></Polygon>")
+        if rng.random() < fracao_multi:
+            vizinho = ("<Polygon><outerBoundaryIs><LinearRing><coordinates>"
+                       f"{_anel(lon[i] + 3 * raio, lat[i], raio / 2, vertices, rng)}"
+                       "</coordinates></LinearRing></outerBoundaryIs></Polygon>")
+            poligono = f"<MultiGeometry>{poligono}{vizinho}</MultiGeometry>"
+        partes.append(
+            f"<Placemark><name>{nome}</name><ExtendedData><SchemaData schemaUrl=\"#fazendas\">"
+            f"<SimpleData name=\"NOME_FAZ\">{nome}</SimpleData>"
+            f"<SimpleData name=\"AREA_HA\">{raio * 1e4:.1f}</SimpleData>"
+            f"</SchemaData></ExtendedData>{poligono}</Placemark>"
+        )
+    partes.append("</Folder></Document></kml>")
+    conteudo = "\n".join(partes).encode("utf-8")
+    if not kmz:
+        return conteudo
+    saida = io.BytesIO()
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED) as arquivo:
+        arquivo.writestr("doc.kml", conteudo)
+    return saida.getvalue()
+
+
+def _alterar(nome, rng):
+    """Remove acentos ou troca uma letra, como nas planilhas digitadas à mão."""
+    if rng.random() < 0.5:
+        return nome.replace("Ã", "A").replace("Í", "I").replace("É", "E").replace("Á", "A").replace("Ê", "E")
+    pos = int(rng.integers(len("FAZENDA "), len(nome)))
+    return nome[:pos] + "X" + nome[pos + 1:]
+
+
+def gerar_analistas(n, seed=0):
+    """DataFrame da planilha de analistas com uma linha por fazenda.
+
+    Cada fazenda é atendida pelo especialista de base mais próxima (em graus), com
+    FAZENDAS_POR_ESPECIALISTA fazendas por especialista em média.
+    """
+    rng = np.random.default_rng(seed + 2)
+    lon, lat = centros_fazendas(n, seed)
+    n_esp = max(1, n // FAZENDAS_POR_ESPECIALISTA)
+    lon_min, lat_min, lon_max, lat_max = CAIXA
+    lon_base, lat_base = rng.uniform(lon_min, lon_max, n_esp), rng.uniform(lat_min, lat_max, n_esp)
+    especialista = np.empty(n, dtype=np.int64)
+    for inicio in range(0, n, 10_000):
+        fim = min(n, inicio + 10_000)
+        d2 = (lon[inicio:fim, None] - lon_base) ** 2 + (lat[inicio:fim, None] - lat_base) ** 2
+        especialista[inicio:fim] = d2.argmin(axis=1)
+    unidades = [
+        _alterar(nome, rng) if rng.random() < FRACAO_ALTERADOS else nome
+        for nome in nomes_fazendas(n, seed)
+    ]
+    return pd.DataFrame({
+        "GESTOR": [f"GESTOR {e // ESPECIALISTAS_POR_GESTOR}" for e in especialista],
+        "ESPECIALISTA": [f"ESPECIALISTA {e}" for e in especialista],
+        "CIDADE_BASE": [f"CIDADE BASE {e}" for e in especialista],
+        "UNIDADE": unidades,
+        "COORDENADAS_CIDADE": [f"{lat_base[e]:.6f}, {lon_base[e]:.6f}" for e in especialista],
+    })
+
+
+def gerar_excel(n, seed=0):
+    """Bytes .xlsx da planilha de gerar_analistas."""
+    saida = io.BytesIO()
+    gerar_analistas(n, seed).to_excel(saida, index=False)
+    return saida.getvalue()
+
+
+def atualizar_entradas(kml_bytes, df_analistas, fracao=0.01, seed=0):
+    """Atualização semanal de gerar_kml/gerar_analistas: (kml_bytes, df_analistas) com uma `fracao` de mudanças.
+
+    Em cada parte `fracao` das fazendas: remove o Placemark e suas linhas, altera AREA_HA
+    do Placemark ou troca o especialista da linha; e acrescenta a mesma quantidade de
+    fazendas novas, atribuídas a especialistas existentes.
+    """
+    rng = np.random.default_rng(seed + 3)
+    cabecalho, *placemarks = kml_bytes.decode("utf-8").split("<Placemark>")
+    placemarks[-1], rodape = placemarks[-1].split("</Placemark>", 1)
+    placemarks[-1] += "</Placemark>"
+    n = len(placemarks)
+    k = max(1, int(n * fracao))
+    removidas, alteradas = np.split(rng.choice(n, 2 * k, replace=False), 2)
+    for i in alteradas:
+        placemarks[i] = placemarks[i].replace('<SimpleData name="AREA_HA">', '<SimpleData name="AREA_HA">1', 1)
+    nomes_removidos = {placemarks[i].split("<name>", 1)[1].split("</name>", 1)[0] for i in removidas}
+    manter = np.ones(n, dtype=bool)
+    manter[removidas] = False
+    novas = gerar_kml(k, seed=seed + 100).decode("utf-8").split("<Placemark>")[1:]
+    novas[-1] = novas[-1].split("</Placemark>", 1)[0] + "</Placemark>"
+    novas = [p.replace("FAZENDA ", "FAZENDA NOVA ") for p in novas]
+    conteudo = "<Placemark>".join([cabecalho] + [p for p, m in zip(placemarks, manter) if m] + novas)
+    kml_bytes = (conteudo.rstrip("\n") + rodape).encode("utf-8")
+
+    df = df_analistas[~df_analistas["UNIDADE"].isin(nomes_removidos)].reset_index(drop=True)
+    trocar = rng.choice(len(df), k, replace=False)
+    origem = rng.choice(len(df), k)
+    for coluna in ("GESTOR", "ESPECIALISTA", "CIDADE_BASE", "COORDENADAS_CIDADE"):
+        df.loc[trocar, coluna] = df.loc[origem, coluna].to_numpy()
+    linhas_novas = df.iloc[rng.choice(len(df), k)].copy()
+    linhas_novas["UNIDADE"] = [f"FAZENDA NOVA {nome[len('FAZENDA '):]}" for nome in nomes_fazendas(k, seed + 100)]
+    return kml_bytes, pd.concat([df, linhas_novas], ignore_index=True)
+
+
+def dividir_kml(kml_bytes, arquivos=4, zipar=False):
+    """Divide um KML de gerar_kml em `arquivos` KMLs [(nome, bytes)] com os Placemarks em sequência.
+
+    Os MultiGeometry da fronteira entre dois arquivos são partidos: o segundo polígono
+    vai, como Placemark de mesmo nome, para o início do arquivo seguinte. Com `zipar`,
+    os arquivos a partir do segundo vão num único .zip.
+    """
+    cabecalho, *placemarks = kml_bytes.decode("utf-8").split("<Placemark>")
+    placemarks[-1], rodape = placemarks[-1].split("</Placemark>", 1)
+    placemarks[-1] += "</Placemark>"
+    blocos = [list(bloco) for bloco in np.array_split(np.array(placemarks, dtype=object), arquivos)]
+    for atual, seguinte in zip(blocos, blocos[1:]):
+        multi = [i for i, p in enumerate(atual) if "<MultiGeometry>" in p]
+        if not multi:
+            continue
+        inicio, poligonos = atual[multi[-1]].split("<MultiGeometry>", 1)
+        primeiro, segundo = poligonos.split("</MultiGeometry>", 1)[0].split("</Polygon>", 1)
+        atual[multi[-1]] = f"{inicio}{primeiro}</Polygon></Placemark>"
+        seguinte.insert(0, f"{inicio}{segundo}</Placemark>")
+    saida = [(f"fazendas_{i + 1}.kml", ("<Placemark>".join([cabecalho] + bloco).rstrip("\n") + rodape).encode("utf-8"))
+             for i, bloco in enumerate(blocos)]
+    if not zipar or len(saida) < 2:
+        return saida
+    compactado = io.BytesIO()
+    with zipfile.ZipFile(compactado, "w", zipfile.ZIP_DEFLATED) as arquivo:
+        for nome, conteudo in saida[1:]:
+            arquivo.writestr(nome, conteudo)
+    return [saida[0], ("fazendas.zip", compactado.getvalue())]
+
+
+def gerar_cidades(n=5570, seed=0, vertices=12):
+    """GeoJSON de municípios no formato do IBGE (propriedades nome e geocodigo de 7 dígitos)."""
+    rng = np.random.default_rng(seed + 3)
+    lon_min, lat_min, lon_max, lat_max = CAIXA
+    lon, lat = rng.uniform(lon_min - 2, lon_max + 2, n), rng.uniform(lat_min - 2, lat_max + 2, n)
+    ufs = rng.choice(UFS, n)
+    features = []
+    for i in range(n):
+        angulos = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+        raios = rng.uniform(0.05, 0.25) * rng.uniform(0.7, 1.0, vertices)
+        anel = np.column_stack([lon[i] + raios * np.cos(angulos), lat[i] + raios * np.sin(angulos)]).round(6).tolist()
+        features.append({
+            "type": "Feature",
+            "properties": {"nome": f"Município {i}", "geocodigo": f"{ufs[i]}{i % 100_000:05d}"},
+            "geometry": {"type": "Polygon", "coordinates": [anel + anel[:1]]},
+        })
+    return json.dumps({"type": "FeatureCollection", "features": features}).encode("utf-8")
+
+
+def gerar_malha(n=700, pontos_forma=3, seed=0, fracao_removida=0.15, caixa=CAIXA):
+    """GeoDataFrame de vias: grade irregular n × n de quarteirões, um trecho por aresta da grade.
+
+    Os cruzamentos são deslocados ao acaso, cada trecho tem `pontos_forma` pontos
+    intermediários, uma linha a cada 50 é "primary" e uma a cada 10 "secondary", e
+    `fracao_removida` dos trechos some (deixando pedaços desconexos, como num extrato real).
+    """
+    import geopandas as gpd
+    import shapely
+
+    rng = np.random.default_rng(seed + 4)
+    lon_min, lat_min, lon_max, lat_max = caixa
+    passo_lon, passo_lat = (lon_max - lon_min) / (n - 1), (lat_max - lat_min) / (n - 1)
+    lon = np.linspace(lon_min, lon_max, n)[None, :] + rng.uniform(-0.3, 0.3, (n, n)) * passo_lon
+    lat = np.linspace(lat_min, lat_max, n)[:, None] + rng.uniform(-0.3, 0.3, (n, n)) * passo_lat
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    # Trechos horizontais (i, j) → (i, j + 1) e verticais (i, j) → (i + 1, j)
+    origem = np.r_[(i[:, :-1] * n + j[:, :-1]).ravel(), (i[:-1, :] * n + j[:-1, :]).ravel()]
+    destino = np.r_[(i[:, 1:] * n + j[:, 1:]).ravel(), (i[1:, :] * n + j[1:, :]).ravel()]
+    linha = np.r_[i[:, :-1].ravel(), n + j[:-1, :].ravel()]
+    manter = rng.random(origem.size) >= fracao_removida
+    origem, destino, linha = origem[manter], destino[manter], linha[manter]
+
+    lon, lat = lon.ravel(), lat.ravel()
+    t = np.linspace(0, 1, pontos_forma + 2)
+    desvio = np.zeros((origem.size, t.size))
+    desvio[:, 1:-1] = rng.uniform(-0.1, 0.1, (origem.size, pontos_forma))
+    xs = lon[origem, None] + t * (lon[destino] - lon[origem])[:, None] + desvio * passo_lon
+    ys = lat[origem, None] + t * (lat[destino] - lat[origem])[:, None] + desvio * passo_lat
+    geometrias = shapely.linestrings(np.c_[xs.ravel(), ys.ravel()], indices=np.repeat(np.arange(origem.size), t.size))
+    highway = np.where(linha % 50 == 0, "primary", np.where(linha % 10 == 0, "secondary", "unclassified"))
+    return gpd.GeoDataFrame({"highway": highway, "oneway": np.where(rng.random(origem.size) < 0.02, "yes", "no")},
+                            geometry=geometrias, crs="EPSG:4326")
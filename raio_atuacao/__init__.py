@@ -0,0 +1 @@
+"""Núcleo de processamento do Raio de Atuação, independente do Streamlit."""
@@ -0,0 +1,27 @@
+"""Leitura e preparação da planilha de analistas."""
+import pandas as pd
+
+from .texto import normalizar_serie
+
+COLUNAS_ESPERADAS = ["GESTOR", "ESPECIALISTA", "CIDADE_BASE", "UNIDADE", "COORDENADAS_CIDADE"]
+
+
+def colunas_faltando(df_analistas):
+    """Lista as colunas obrigatórias ausentes na planilha."""
+    return [col for col in COLUNAS_ESPERADAS if col not in df_analistas.columns]
+
+
+def preparar_analistas(df_analistas):
+    """Adiciona LAT_BASE, LON_BASE e UNIDADE_normalized à planilha de analistas."""
+    coords = df_analistas["COORDENADAS_CIDADE"].astype(str).str.split(",", expand=True)
+    df_analistas["LAT_BASE"] = pd.to_numeric(coords[0], errors="coerce")
+    df_analistas["LON_BASE"] = pd.to_numeric(coords[1], errors="coerce") if 1 in coords else float("nan")
+    df_analistas["UNIDADE_normalized"] = normalizar_serie(df_analistas["UNIDADE"])
+    return df_analistas
+
+
+def hashes_especialistas(df_analistas):
+    """Hash dos dados gravados de cada especialista (nome normalizado): gestor, cidade e coordenadas da base."""
+    primeiras = df_analistas.drop_duplicates(subset=["ESPECIALISTA"])
+    hashes = pd.util.hash_pandas_object(primeiras[["GESTOR", "CIDADE_BASE", "LAT_BASE", "LON_BASE"]], index=False)
+    return dict(zip(normalizar_serie(primeiras["ESPECIALISTA"]), (f"{h:016x}" for h in hashes)))
@@ -0,0 +1,313 @@
+"""Atribuição ótima de fazendas a especialistas (custo mínimo com capacidade e raio máximo).
+
+O problema é de transporte: cada fazenda vai para exatamente um especialista,
+cada especialista atende no máximo `capacidade` fazendas e a soma das distâncias
+base → centróide é mínima. A solução é exata sobre os `k` especialistas
+candidatos de cada fazenda e sai de um fluxo de custo mínimo:
+
+1. ascensão dual vetorizada (preço por especialista) deixa quase tudo viável;
+2. com empates nos custos a ascensão pode esvaziar demais um especialista de
+   preço positivo; caminhos negativos até especialistas com vaga o completam;
+3. o excesso restante é escoado por caminhos mínimos sucessivos (com
+   potenciais) num grafo compacto especialista → especialista, em que cada
+   arco é a fazenda mais barata de mover de um para o outro.
+"""
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from .distancia import blocos_distancias_m, haversine_m
+
+logger = logging.getLogger(__name__)
+
+# Especialistas mais próximos considerados por fazenda; com o total de especialistas a solução é exata
+CANDIDATOS_POR_FAZENDA = 20
+# Rodadas da ascensão dual antes dos caminhos mínimos (o excesso cai rápido nas primeiras)
+RODADAS_AQUECIMENTO = 40
+# Deixar uma fazenda sem especialista custa este múltiplo da maior distância candidata
+MULTIPLO_PENALIDADE = 10.0
+
+SEM_ATRIBUICAO = -1
+# Melhora mínima (km) aceita na busca de caminhos, contra ruído de ponto flutuante
+TOLERANCIA = 1e-9
+
+
+def candidatos_mais_proximos(lon_esp, lat_esp, lon_faz, lat_faz, k=CANDIDATOS_POR_FAZENDA, raio_max_km=None):
+    """Para cada fazenda, os `k` especialistas mais próximos e as distâncias (km), em blocos.
+
+    Pares além de `raio_max_km` recebem distância infinita (proibidos).
+    """
+    n_esp = np.asarray(lon_esp).size
+    n_faz = np.asarray(lon_faz).size
+    k = max(1, min(k, n_esp))
+    indices = np.empty((n_faz, k), dtype=np.int64)
+    custos = np.empty((n_faz, k), dtype=np.float64)
+    for inicio, fim, bloco in blocos_distancias_m(lon_faz, lat_faz, lon_esp, lat_esp):
+        bloco = bloco / 1000
+        if k < n_esp:
+            idx = np.argpartition(bloco, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(n_esp), bloco.shape)
+        indices[inicio:fim] = idx
+        custos[inicio:fim] = np.take_along_axis(bloco, idx, axis=1)
+    if raio_max_km is not None:
+        custos[custos > raio_max_km] = np.inf
+    return indices, custos
+
+
+def _ascensao_dual(indices, custos, capacidade, rodadas):
+    """Sobe o preço dos especialistas lotados até liberarem exatamente o excesso.
+
+    Cada fazenda fica na opção de menor custo + preço, então a atribuição é ótima
+    para as cargas que induz. Fazendas com o mesmo custo de troca saem juntas, e um
+    especialista com preço positivo pode ficar abaixo da capacidade (transporte_min_custo
+    corrige). Retorna (classe de cada fazenda, preços).
+    """
+    linhas = np.arange(indices.shape[0])
+    preco = np.zeros(capacidade.size)
+    for rodada in range(rodadas + 1):
+        valores = custos + preco[indices]
+        dois = np.partition(valores, 1, axis=1)[:, :2]
+        classe = indices[linhas, valores.argmin(axis=1)]
+        excesso = np.bincount(classe, minlength=capacidade.size) - capacidade
+        lotadas = excesso[classe] > 0
+        if not lotadas.any() or rodada == rodadas:
+            break
+        j, margem = classe[lotadas], dois[lotadas, 1] - dois[lotadas, 0]
+        ordem = np.lexsort((margem, j))
+        j, margem = j[ordem], margem[ordem]
+        inicio = np.flatnonzero(np.r_[True, j[1:] != j[:-1]])
+        # O e-ésimo menor custo de troca libera exatamente o excesso (o acréscimo desempata)
+        preco[j[inicio]] += margem[inicio + excesso[j[inicio]] - 1] * (1 + 1e-12) + 1e-9
+    return classe, preco
+
+
+def _menores_caminhos(custo, dist):
+    """Rótulos mínimos a partir de `dist` sobre os arcos custo[a, b] (sem ciclos negativos): (dist, anterior)."""
+    anterior = np.full(dist.size, -1, dtype=np.int64)
+    ativos = np.flatnonzero(np.isfinite(dist))
+    while ativos.size:
+        candidatos = dist[ativos][:, None] + custo[ativos]
+        origem = candidatos.argmin(axis=0)
+        novo = candidatos[origem, np.arange(dist.size)]
+        melhora = novo < dist - TOLERANCIA
+        dist[melhora] = novo[melhora]
+        anterior[melhora] = ativos[origem[melhora]]
+        ativos = np.flatnonzero(melhora)
+    return dist, anterior
+
+
+class _GrafoMovimentos:
+    """Grafo residual compacto entre classes: custo[a, b] é o menor acréscimo de custo
+    ao passar uma fazenda de `a` para `b`, e fazenda[a, b] é qual fazenda."""
+
+    def __init__(self, indices, custos, classe, n_classes):
+        self.indices = indices
+        self.custos = custos
+        self.classe = classe
+        linhas = np.arange(classe.size)
+        self.custo_atual = custos[linhas, (indices == classe[:, None]).argmax(axis=1)]
+        self.membros = [set() for _ in range(n_classes)]
+        for fazenda, c in enumerate(classe.tolist()):
+            self.membros[c].add(fazenda)
+        self.custo = np.full((n_classes, n_classes), np.inf)
+        self.fazenda = np.full((n_classes, n_classes), SEM_ATRIBUICAO, dtype=np.int64)
+        # Todas as linhas de uma vez: ordena (classe de origem, destino, acréscimo) e fica com o primeiro
+        origem = np.repeat(classe, indices.shape[1])
+        destino = indices.ravel()
+        delta = (custos - self.custo_atual[:, None]).ravel()
+        quem = np.repeat(linhas, indices.shape[1])
+        util = np.isfinite(delta) & (destino != origem)
+        origem, destino, delta, quem = origem[util], destino[util], delta[util], quem[util]
+        ordem = np.lexsort((delta, destino, origem))
+        origem, destino, delta, quem = origem[ordem], destino[ordem], delta[ordem], quem[ordem]
+        primeiro = np.r_[True, (origem[1:] != origem[:-1]) | (destino[1:] != destino[:-1])]
+        self.custo[origem[primeiro], destino[primeiro]] = delta[primeiro]
+        self.fazenda[origem[primeiro], destino[primeiro]] = quem[primeiro]
+
+    def _recalcular(self, a, colunas):
+        """Refaz as colunas da linha `a` a partir das fazendas que estão em `a`."""
+        fazendas = np.fromiter(self.membros[a], dtype=np.int64)
+        self.custo[a, colunas] = np.inf
+        self.fazenda[a, colunas] = SEM_ATRIBUICAO
+        if not fazendas.size:
+            return
+        cand = self.indices[fazendas]
+        delta = self.custos[fazendas] - self.custo_atual[fazendas, None]
+        for coluna in colunas:
+            valores = np.where(cand == coluna, delta, np.inf).min(axis=1)
+            i = valores.argmin()
+            if np.isfinite(valores[i]):
+                self.custo[a, coluna] = valores[i]
+                self.fazenda[a, coluna] = fazendas[i]
+
+    def mover(self, fazenda, a, b):
+        """Passa `fazenda` de `a` para `b`, atualizando só o que depende dela."""
+        self.membros[a].discard(fazenda)
+        self.membros[b].add(fazenda)
+        self.classe[fazenda] = b
+        cand = self.indices[fazenda]
+        self.custo_atual[fazenda] = self.custos[fazenda, cand == b][0]
+        self._recalcular(a, np.flatnonzero(self.fazenda[a] == fazenda))
+        delta = self.custos[fazenda] - self.custo_atual[fazenda]
+        melhora = (delta < self.custo[b, cand]) & (cand != b)
+        self.custo[b, cand[melhora]] = delta[melhora]
+        self.fazenda[b, cand[melhora]] = fazenda
+
+
+def transporte_min_custo(indices, custos, capacidade, penalidade=None, rodadas_aquecimento=RODADAS_AQUECIMENTO):
+    """Resolve o transporte com capacidades sobre candidatos esparsos (n_fazendas, k).
+
+    `indices[i]` são os especialistas candidatos da fazenda i e `custos[i]` os custos
+    (np.inf proíbe o par). Fazendas podem ficar sem atribuição ao custo `penalidade`,
+    o que mantém o problema viável com capacidade ou raio insuficientes. Retorna o
+    especialista de cada fazenda (SEM_ATRIBUICAO quando não houver) e o número de
+    caminhos aumentantes usados.
+    """
+    n_faz = indices.shape[0]
+    n_esp = np.asarray(capacidade).size
+    validos = np.isfinite(custos)
+    custo_max = float(custos[validos].max()) if validos.any() else 1.0
+    if penalidade is None:
+        penalidade = MULTIPLO_PENALIDADE * custo_max
+
+    # Classe extra n_esp = "sem atribuição", sem limite de vagas
+    n_classes = n_esp + 1
+    indices = np.hstack([indices, np.full((n_faz, 1), n_esp)])
+    custos = np.hstack([np.where(validos, custos, np.inf), np.full((n_faz, 1), float(penalidade))])
+    capacidade = np.append(np.asarray(capacidade, dtype=np.int64), n_faz)
+
+    classe, preco = _ascensao_dual(indices, custos, capacidade, rodadas_aquecimento)
+    carga = np.bincount(classe, minlength=n_classes)
+    grafo = None
+    # Potenciais iniciais vindos dos preços: custos reduzidos não negativos
+    phi = -preco
+    phi_destino = 0.0
+    caminhos = 0
+    if ((carga < capacidade) & (preco > 0)).any():
+        # Especialista com vaga e preço positivo (empates na ascensão): enquanto houver um caminho
+        # de custo negativo de qualquer classe até uma com vaga, move as fazendas ao longo dele
+        grafo = _GrafoMovimentos(indices, custos, classe, n_classes)
+        while True:
+            phi, anterior = _menores_caminhos(grafo.custo, np.zeros(n_classes))
+            com_vaga = np.flatnonzero(carga < capacidade)
+            fim = com_vaga[phi[com_vaga].argmin()]
+            if phi[fim] >= -TOLERANCIA:
+                break
+            b = fim
+            while anterior[b] >= 0:
+                a = anterior[b]
+                grafo.mover(grafo.fazenda[a, b], a, b)
+                b = a
+            carga[fim] += 1
+            carga[b] -= 1
+            caminhos += 1
+    while True:
+        fontes = np.flatnonzero(carga > capacidade)
+        if not fontes.size:
+            break
+        if grafo is None:
+            grafo = _GrafoMovimentos(indices, custos, classe, n_classes)
+        # Caminho mínimo por correção de rótulos vetorizada: a fronteira inteira é
+        # relaxada de uma vez, e nós além do melhor destino já encontrado são podados
+        saida = np.where(carga < capacidade, phi - phi_destino, np.inf)
+        dist = np.full(n_classes, np.inf)
+        dist[fontes] = 0.0
+        anterior = np.full(n_classes, -1, dtype=np.int64)
+        ativos = fontes
+        while ativos.size:
+            ativos = ativos[dist[ativos] < (dist + saida).min()]
+            if not ativos.size:
+                break
+            candidatos = (dist[ativos] + phi[ativos])[:, None] + grafo.custo[ativos] - phi
+            origem = candidatos.argmin(axis=0)
+            novo = candidatos[origem, np.arange(n_classes)]
+            melhora = novo < dist - TOLERANCIA
+            dist[melhora] = novo[melhora]
+            anterior[melhora] = ativos[origem[melhora]]
+            ativos = np.flatnonzero(melhora)
+        fim = int((dist + saida).argmin())
+        dist_destino = dist[fim] + saida[fim]
+
+        phi += np.minimum(dist, dist_destino)
+        phi_destino += dist_destino
+        b = fim
+        while anterior[b] >= 0:
+            a = anterior[b]
+            grafo.mover(grafo.fazenda[a, b], a, b)
+            b = a
+        carga[fim] += 1
+        carga[b] -= 1
+        caminhos += 1
+
+    classe[classe == n_esp] = SEM_ATRIBUICAO
+    return classe, caminhos
+
+
+def atribuir_fazendas(lon_esp, lat_esp, lon_faz, lat_faz, capacidade, raio_max_km=None, k=CANDIDATOS_POR_FAZENDA):
+    """Atribuição de custo mínimo (distância em km) de fazendas a especialistas.
+
+    `capacidade` é um inteiro ou um array por especialista. Retorna (especialista de
+    cada fazenda ou SEM_ATRIBUICAO, distância em km ou NaN).
+    """
+    n_esp = np.asarray(lon_esp).size
+    capacidade = np.broadcast_to(np.asarray(capacidade, dtype=np.int64), (n_esp,)).copy()
+    inicio = time.perf_counter()
+    indices, custos = candidatos_mais_proximos(lon_esp, lat_esp, lon_faz, lat_faz, k, raio_max_km)
+    atribuido, caminhos = transporte_min_custo(indices, custos, capacidade)
+    ok = atribuido != SEM_ATRIBUICAO
+    distancias = np.full(atribuido.size, np.nan)
+    distancias[ok] = haversine_m(
+        np.asarray(lon_esp, dtype=float)[atribuido[ok]], np.asarray(lat_esp, dtype=float)[atribuido[ok]],
+        np.asarray(lon_faz, dtype=float)[ok], np.asarray(lat_faz, dtype=float)[ok],
+    ) / 1000
+    logger.info(
+        f"Atribuição: {ok.sum()}/{atribuido.size} fazendas, {n_esp} especialistas, "
+        f"{caminhos} caminhos aumentantes, {time.perf_counter() - inicio:.2f} s."
+    )
+    return atribuido, distancias
+
+
+def propor_atribuicao(df_analistas, gdf_kml, capacidade, raio_max_km=None, k=CANDIDATOS_POR_FAZENDA):
+    """Propõe a atribuição ótima para as fazendas hoje atendidas e compara com a atual.
+
+    `gdf_kml` precisa de Longitude/Latitude_Unidade (ver adicionar_centroides) e
+    `capacidade` pode ser um inteiro ou um dicionário ESPECIALISTA → máximo de fazendas.
+    Retorna (fazendas com ESPECIALISTA_ATUAL/ESPECIALISTA_PROPOSTO e distâncias,
+    resumo por especialista com raios e distâncias médias atuais e propostos).
+    """
+    centroides = gdf_kml.drop_duplicates("UNIDADE_normalized").set_index("UNIDADE_normalized")
+    atual = df_analistas[df_analistas["UNIDADE_normalized"].isin(centroides.index)].dropna(subset=["LAT_BASE", "LON_BASE"])
+    especialistas = atual.drop_duplicates("ESPECIALISTA").set_index("ESPECIALISTA")[["GESTOR", "CIDADE_BASE", "LAT_BASE", "LON_BASE"]]
+    fazendas = pd.DataFrame(index=pd.Index(atual["UNIDADE_normalized"].unique(), name="UNIDADE_normalized"))
+    fazendas["Longitude_Unidade"] = centroides["Longitude_Unidade"].reindex(fazendas.index)
+    fazendas["Latitude_Unidade"] = centroides["Latitude_Unidade"].reindex(fazendas.index)
+    fazendas["ESPECIALISTA_ATUAL"] = atual.groupby("UNIDADE_normalized")["ESPECIALISTA"].first()
+    fazendas["DISTANCIA_ATUAL_KM"] = haversine_m(
+        especialistas["LON_BASE"].reindex(fazendas["ESPECIALISTA_ATUAL"]).to_numpy(),
+        especialistas["LAT_BASE"].reindex(fazendas["ESPECIALISTA_ATUAL"]).to_numpy(),
+        fazendas["Longitude_Unidade"].to_numpy(), fazendas["Latitude_Unidade"].to_numpy(),
+    ) / 1000
+
+    if isinstance(capacidade, dict):
+        capacidade = especialistas.index.map(lambda e: capacidade.get(e, 0)).to_numpy()
+    atribuido, distancias = atribuir_fazendas(
+        especialistas["LON_BASE"].to_numpy(), especialistas["LAT_BASE"].to_numpy(),
+        fazendas["Longitude_Unidade"].to_numpy(), fazendas["Latitude_Unidade"].to_numpy(),
+        capacidade, raio_max_km, k,
+    )
+    nomes = especialistas.index.to_numpy()
+    fazendas["ESPECIALISTA_PROPOSTO"] = np.where(atribuido >= 0, nomes[np.maximum(atribuido, 0)], None)
+    fazendas["DISTANCIA_PROPOSTA_KM"] = distancias
+    fazendas = fazendas.reset_index()
+
+    resumo = especialistas.copy()
+    for sufixo, coluna_esp, coluna_dist in (("ATUAL", "ESPECIALISTA_ATUAL", "DISTANCIA_ATUAL_KM"),
+                                            ("PROPOSTO", "ESPECIALISTA_PROPOSTO", "DISTANCIA_PROPOSTA_KM")):
+        grupos = fazendas.groupby(coluna_esp)[coluna_dist]
+        resumo[f"FAZENDAS_{sufixo}"] = grupos.size().reindex(resumo.index, fill_value=0)
+        resumo[f"RAIO_{sufixo}_KM"] = grupos.max().reindex(resumo.index)
+        resumo[f"DIST_MEDIA_{sufixo}_KM"] = grupos.mean().reindex(resumo.index)
+    return fazendas, resumo.reset_index()
@@ -0,0 +1,339 @@
+"""Persistência de especialistas e fazendas no banco SQLite mapa_dados.db."""
+import logging
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from .distancia import haversine_m
+from .indice import expandir_bbox
+from .texto import normalize_str, normalizar_serie
+
+logger = logging.getLogger(__name__)
+
+CAMINHO_BANCO = "mapa_dados.db"
+# Fazendas convertidas por vez ao atualizar bancos com geometria em JSON
+LOTE_CONVERSAO = 10_000
+
+SQL_UPSERT_ESPECIALISTA = """
+    INSERT INTO especialistas (nome, gestor, cidade_base, latitude_base, longitude_base)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(nome) DO UPDATE SET
+        gestor = excluded.gestor, cidade_base = excluded.cidade_base,
+        latitude_base = excluded.latitude_base, longitude_base = excluded.longitude_base
+"""
+
+SQL_UPSERT_FAZENDA = """
+    INSERT INTO fazendas (nome_fazenda, especialista_id, geometria_wkb, latitude_centroide, longitude_centroide)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(nome_fazenda, especialista_id) DO UPDATE SET
+        geometria_wkb = excluded.geometria_wkb,
+        latitude_centroide = excluded.latitude_centroide,
+        longitude_centroide = excluded.longitude_centroide
+"""
+
+# Caixas das fazendas gravadas na migração, ligadas ao id pela chave natural
+SQL_INDEXAR_CAIXAS = """
+    INSERT OR REPLACE INTO fazendas_rtree (id, min_lon, max_lon, min_lat, max_lat)
+    SELECT f.id, c.min_lon, c.max_lon, c.min_lat, c.max_lat
+    FROM temp.caixas_migracao c
+    JOIN fazendas f ON f.nome_fazenda = c.nome_fazenda AND f.especialista_id = c.especialista_id
+"""
+
+SQL_CONSULTA_FAZENDAS = """
+    SELECT f.id, f.nome_fazenda, f.especialista_id, e.nome AS especialista,
+           f.latitude_centroide, f.longitude_centroide, f.geometria_wkb
+    FROM {origem}
+    LEFT JOIN especialistas e ON e.id = f.especialista_id
+    WHERE {condicao}
+"""
+COLUNAS_CONSULTA = ["id", "nome_fazenda", "especialista_id", "especialista", "latitude_centroide", "longitude_centroide"]
+# Pré-filtro das consultas espaciais: caixa da fazenda cruzando a caixa pedida
+ORIGEM_RTREE = "fazendas_rtree r JOIN fazendas f ON f.id = r.id"
+CONDICAO_RTREE = "r.max_lon >= ? AND r.min_lon <= ? AND r.max_lat >= ? AND r.min_lat <= ?"
+
+
+def conectar(caminho=CAMINHO_BANCO):
+    """Abre o banco com WAL e sincronização reduzida, adequados a cargas em lote."""
+    conn = sqlite3.connect(caminho)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def criar_tabelas(conn):
+    """Cria as tabelas, a chave natural (nome_fazenda, especialista_id) e os índices das fazendas.
+
+    Geometrias ficam em WKB (EPSG:4326) e suas caixas no R*Tree fazendas_rtree.
+    Bancos de versões anteriores, com geometria_json, são convertidos aqui.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS especialistas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT UNIQUE, gestor TEXT, cidade_base TEXT,
+            latitude_base REAL, longitude_base REAL
+        )''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fazendas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_fazenda TEXT, especialista_id INTEGER,
+            geometria_wkb BLOB, latitude_centroide REAL, longitude_centroide REAL,
+            FOREIGN KEY (especialista_id) REFERENCES especialistas (id)
+        )''')
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS fazendas_rtree USING rtree(
+            id, min_lon, max_lon, min_lat, max_lat
+        )''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS fazendas_rtree_apagar AFTER DELETE ON fazendas BEGIN
+            DELETE FROM fazendas_rtree WHERE id = old.id;
+        END''')
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_fazendas_chave'"
+    ).fetchone()
+    if not existe:
+        # Bancos criados por versões anteriores podem ter linhas duplicadas por migração
+        removidas = conn.execute('''
+            DELETE FROM fazendas WHERE id NOT IN (
+                SELECT MAX(id) FROM fazendas GROUP BY nome_fazenda, especialista_id
+            )''').rowcount
+        if removidas:
+            logger.info(f"{removidas} fazendas duplicadas removidas antes de criar a chave natural.")
+        # nome_fazenda é a primeira coluna da chave, que também atende buscas só pelo nome
+        conn.execute("CREATE UNIQUE INDEX ux_fazendas_chave ON fazendas (nome_fazenda, especialista_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_fazendas_especialista ON fazendas (especialista_id)")
+    # Estado da última ingestão: hashes das unidades do KML e dos especialistas da planilha
+    conn.execute("CREATE TABLE IF NOT EXISTS ingestao (chave TEXT PRIMARY KEY, valor TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS hashes_unidades (unidade TEXT PRIMARY KEY, hashes TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS hashes_especialistas (nome TEXT PRIMARY KEY, hash TEXT)")
+    _converter_geometria_json(conn)
+    conn.commit()
+
+
+def _indexar_caixas(conn, ids, geometrias):
+    """Grava no R*Tree as caixas (EPSG:4326) das geometrias de `ids`; geometrias vazias ficam de fora."""
+    caixas = shapely.bounds(geometrias)
+    validas = ~np.isnan(caixas).any(axis=1)
+    ids, caixas = np.asarray(ids)[validas], caixas[validas]
+    conn.executemany(
+        "INSERT OR REPLACE INTO fazendas_rtree (id, min_lon, max_lon, min_lat, max_lat) VALUES (?, ?, ?, ?, ?)",
+        zip(ids.tolist(), caixas[:, 0].tolist(), caixas[:, 2].tolist(), caixas[:, 1].tolist(), caixas[:, 3].tolist()),
+    )
+
+
+def _converter_geometria_json(conn):
+    """Converte geometria_json em geometria_wkb, em lotes, e indexa as caixas no R*Tree."""
+    colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(fazendas)")}
+    if "geometria_json" not in colunas:
+        return
+    if "geometria_wkb" not in colunas:
+        conn.execute("ALTER TABLE fazendas ADD COLUMN geometria_wkb BLOB")
+    convertidas = 0
+    ultimo = 0
+    while True:
+        linhas = conn.execute(
+            "SELECT id, geometria_json FROM fazendas WHERE id > ? ORDER BY id LIMIT ?", (ultimo, LOTE_CONVERSAO)
+        ).fetchall()
+        if not linhas:
+            break
+        ids = [linha[0] for linha in linhas]
+        geometrias = shapely.from_geojson([linha[1] for linha in linhas])
+        conn.executemany("UPDATE fazendas SET geometria_wkb = ? WHERE id = ?", zip(shapely.to_wkb(geometrias).tolist(), ids))
+        _indexar_caixas(conn, ids, geometrias)
+        convertidas += len(ids)
+        ultimo = ids[-1]
+    conn.execute("ALTER TABLE fazendas DROP COLUMN geometria_json")
+    logger.info(f"{convertidas} geometrias convertidas de JSON para WKB e indexadas no R*Tree.")
+
+
+def migrar_dados(conn, df_analistas, gdf_kml):
+    """Grava especialistas e fazendas em uma única transação, com upsert idempotente.
+
+    `df_analistas` deve ter passado por preparar_analistas e `gdf_kml` pode estar
+    em qualquer CRS; usa geometry_4326 se existir, senão reprojeta em uma só chamada.
+    Retorna um dicionário com contagens, tempo total e linhas por segundo.
+    """
+    inicio = time.perf_counter()
+
+    especialistas = df_analistas.drop_duplicates(subset=["ESPECIALISTA"])
+    linhas_especialistas = list(zip(
+        normalizar_serie(especialistas["ESPECIALISTA"]).tolist(),
+        normalizar_serie(especialistas["GESTOR"]).tolist(),
+        normalizar_serie(especialistas["CIDADE_BASE"]).tolist(),
+        especialistas["LAT_BASE"].tolist(),
+        especialistas["LON_BASE"].tolist(),
+    ))
+
+    if "geometry_4326" in gdf_kml:
+        geometrias = gdf_kml["geometry_4326"].to_numpy()
+    else:
+        geometrias = gdf_kml.geometry.to_crs("EPSG:4326").to_numpy()
+    centroides = shapely.centroid(geometrias)
+    caixas = shapely.bounds(geometrias)
+    fazendas = pd.DataFrame(gdf_kml[["UNIDADE_normalized", "NOME_FAZ"]]).assign(
+        geometria_wkb=shapely.to_wkb(geometrias),
+        latitude_centroide=shapely.get_y(centroides),
+        longitude_centroide=shapely.get_x(centroides),
+        min_lon=caixas[:, 0], min_lat=caixas[:, 1], max_lon=caixas[:, 2], max_lat=caixas[:, 3],
+    )
+    vinculos = df_analistas[["ESPECIALISTA", "UNIDADE_normalized"]].merge(fazendas, on="UNIDADE_normalized", how="inner")
+    vinculos["ESPECIALISTA"] = normalizar_serie(vinculos["ESPECIALISTA"]).to_numpy()
+
+    with conn:
+        conn.executemany(SQL_UPSERT_ESPECIALISTA, linhas_especialistas)
+        ids = dict(conn.execute("SELECT nome, id FROM especialistas"))
+        vinculos["especialista_id"] = vinculos["ESPECIALISTA"].map(ids)
+        vinculos = vinculos.dropna(subset=["especialista_id"]).drop_duplicates(
+            subset=["NOME_FAZ", "especialista_id"], keep="last"
+        )
+        conn.executemany(SQL_UPSERT_FAZENDA, zip(
+            vinculos["NOME_FAZ"].tolist(),
+            vinculos["especialista_id"].astype(int).tolist(),
+            vinculos["geometria_wkb"].tolist(),
+            vinculos["latitude_centroide"].tolist(),
+            vinculos["longitude_centroide"].tolist(),
+        ))
+        conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS caixas_migracao (
+                nome_fazenda TEXT, especialista_id INTEGER,
+                min_lon REAL, max_lon REAL, min_lat REAL, max_lat REAL
+            )''')
+        conn.executemany("INSERT INTO temp.caixas_migracao VALUES (?, ?, ?, ?, ?, ?)", zip(
+            vinculos["NOME_FAZ"].tolist(),
+            vinculos["especialista_id"].astype(int).tolist(),
+            vinculos["min_lon"].tolist(), vinculos["max_lon"].tolist(),
+            vinculos["min_lat"].tolist(), vinculos["max_lat"].tolist(),
+        ))
+        conn.execute(SQL_INDEXAR_CAIXAS)
+        conn.execute("DELETE FROM temp.caixas_migracao")
+
+    segundos = time.perf_counter() - inicio
+    linhas = len(linhas_especialistas) + len(vinculos)
+    resultado = {
+        "especialistas": len(linhas_especialistas),
+        "fazendas": len(vinculos),
+        "segundos": segundos,
+        "linhas_por_segundo": linhas / segundos if segundos > 0 else float("inf"),
+    }
+    logger.info(
+        f"Migração: {resultado['especialistas']} especialistas e {resultado['fazendas']} fazendas "
+        f"em {segundos:.2f} s ({resultado['linhas_por_segundo']:.0f} linhas/s)"
+    )
+    return resultado
+
+
+def ler_estado(conn):
+    """Estado da última ingestão: valores de `ingestao` mais {"unidades": {unidade: hashes}, "especialistas": {nome: hash}}."""
+    estado = dict(conn.execute("SELECT chave, valor FROM ingestao"))
+    estado["unidades"] = dict(conn.execute("SELECT unidade, hashes FROM hashes_unidades"))
+    estado["especialistas"] = dict(conn.execute("SELECT nome, hash FROM hashes_especialistas"))
+    return estado
+
+
+def gravar_estado(conn, unidades, especialistas, completo=False, **ingestao):
+    """Grava os hashes novos ou alterados (valor None remove a chave) e os valores de `ingestao`.
+
+    Com `completo=True` os hashes anteriores são descartados antes.
+    """
+    with conn:
+        if completo:
+            conn.execute("DELETE FROM hashes_unidades")
+            conn.execute("DELETE FROM hashes_especialistas")
+        for tabela, chave, coluna, hashes in [("hashes_unidades", "unidade", "hashes", unidades),
+                                              ("hashes_especialistas", "nome", "hash", especialistas)]:
+            conn.executemany(f"DELETE FROM {tabela} WHERE {chave} = ?", [(k,) for k, v in hashes.items() if v is None])
+            conn.executemany(f"INSERT OR REPLACE INTO {tabela} ({chave}, {coluna}) VALUES (?, ?)",
+                             [(k, v) for k, v in hashes.items() if v is not None])
+        conn.executemany("INSERT OR REPLACE INTO ingestao (chave, valor) VALUES (?, ?)", list(ingestao.items()))
+
+
+def vinculos_gravados(conn):
+    """Conjunto de pares (nome_fazenda, especialista) gravados."""
+    return set(conn.execute(
+        "SELECT f.nome_fazenda, e.nome FROM fazendas f JOIN especialistas e ON e.id = f.especialista_id"
+    ))
+
+
+def remover(conn, vinculos=(), especialistas=()):
+    """Apaga pares (nome_fazenda, especialista) e especialistas pelo nome, com suas fazendas.
+
+    O gatilho fazendas_rtree_apagar tira as caixas do R*Tree. Retorna quantas fazendas foram apagadas.
+    """
+    especialistas = [(nome,) for nome in especialistas]
+    apagadas = 0
+    with conn:
+        if vinculos:
+            apagadas += conn.executemany(
+                "DELETE FROM fazendas WHERE nome_fazenda = ? AND especialista_id = (SELECT id FROM especialistas WHERE nome = ?)",
+                list(vinculos),
+            ).rowcount
+        if especialistas:
+            apagadas += conn.executemany(
+                "DELETE FROM fazendas WHERE especialista_id = (SELECT id FROM especialistas WHERE nome = ?)", especialistas
+            ).rowcount
+            conn.executemany("DELETE FROM especialistas WHERE nome = ?", especialistas)
+    return apagadas
+
+
+def _consultar(conn, origem, condicao, parametros):
+    """Linhas de SQL_CONSULTA_FAZENDAS como {coluna: array}, com os WKB em "geometria_wkb"."""
+    linhas = conn.execute(SQL_CONSULTA_FAZENDAS.format(origem=origem, condicao=condicao), parametros).fetchall()
+    colunas = COLUNAS_CONSULTA + ["geometria_wkb"]
+    valores = list(zip(*linhas)) or [()] * len(colunas)
+    return {coluna: np.array(v, dtype=object if coluna in ("nome_fazenda", "especialista", "geometria_wkb") else None)
+            for coluna, v in zip(colunas, valores)}
+
+
+def _montar(colunas, manter=slice(None), geometrias=None, ordem=None):
+    """DataFrame das linhas `manter` (na `ordem`, se dada); GeoDataFrame em EPSG:4326 quando há `geometrias`."""
+    indices = np.arange(len(colunas["id"]))[manter]
+    if ordem is not None:
+        indices = indices[ordem]
+    df = pd.DataFrame({coluna: v[indices] for coluna, v in colunas.items() if coluna != "geometria_wkb"})
+    if geometrias is None:
+        return df
+    import geopandas as gpd
+
+    return gpd.GeoDataFrame(df, geometry=gpd.array.from_shapely(geometrias[indices], crs="EPSG:4326"))
+
+
+def fazendas_na_caixa(conn, min_lon, min_lat, max_lon, max_lat, geometrias=True):
+    """Fazendas cuja geometria cruza o retângulo (graus, EPSG:4326).
+
+    O R*Tree seleciona as candidatas e só elas são lidas do banco; a checagem exata
+    contra o retângulo é feita nas geometrias. Com `geometrias=False` o resultado
+    vem como DataFrame, sem a coluna geometry.
+    """
+    colunas = _consultar(conn, ORIGEM_RTREE, CONDICAO_RTREE, (min_lon, max_lon, min_lat, max_lat))
+    formas = shapely.from_wkb(colunas["geometria_wkb"])
+    manter = shapely.intersects(formas, shapely.box(min_lon, min_lat, max_lon, max_lat))
+    return _montar(colunas, manter, formas if geometrias else None)
+
+
+def fazendas_no_raio(conn, lat, lon, raio_km, geometrias=True):
+    """Fazendas com centróide a até `raio_km` do ponto, da mais próxima à mais distante.
+
+    DISTANCIA_KM é a mesma do app (haversine até o centróide); o R*Tree limita a
+    leitura às fazendas cuja caixa cruza a caixa do círculo.
+    """
+    min_lon, min_lat, max_lon, max_lat = expandir_bbox((lon, lat, lon, lat), raio_km)
+    colunas = _consultar(conn, ORIGEM_RTREE, CONDICAO_RTREE, (min_lon, max_lon, min_lat, max_lat))
+    lon_faz = colunas["longitude_centroide"].astype(np.float64)
+    lat_faz = colunas["latitude_centroide"].astype(np.float64)
+    colunas["DISTANCIA_KM"] = haversine_m(np.full(lon_faz.size, lon, dtype=np.float64),
+                                          np.full(lat_faz.size, lat, dtype=np.float64), lon_faz, lat_faz) / 1000
+    manter = colunas["DISTANCIA_KM"] <= raio_km
+    ordem = np.argsort(colunas["DISTANCIA_KM"][manter], kind="stable")
+    return _montar(colunas, manter, shapely.from_wkb(colunas["geometria_wkb"]) if geometrias else None, ordem)
+
+
+def fazendas_do_especialista(conn, especialista, geometrias=True):
+    """Fazendas de um especialista, pelo id (int) ou pelo nome (normalizado como na migração)."""
+    if isinstance(especialista, (int, np.integer)):
+        condicao, parametro = "f.especialista_id = ?", int(especialista)
+    else:
+        condicao, parametro = "f.especialista_id = (SELECT id FROM especialistas WHERE nome = ?)", normalize_str(especialista)
+    colunas = _consultar(conn, "fazendas f", condicao, (parametro,))
+    return _montar(colunas, geometrias=shapely.from_wkb(colunas["geometria_wkb"]) if geometrias else None)
@@ -0,0 +1,200 @@
+"""Cidades próximas de todas as fazendas de uma vez, em formato longo e gravado em lotes.
+
+Uso: python -m raio_atuacao.cidades --kml fazendas.kmz --cidades municipios.geojson --saida cidades.csv
+     [--n 5] [--raio 50] [--formato csv|parquet]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from .distancia import haversine_m, matriz_distancias_m
+from .indice import KM_POR_GRAU, preparar_cidades
+from .preparados import adicionar_centroides
+from .projecao import WGS84, transformar
+
+logger = logging.getLogger(__name__)
+
+# Mapeamento de códigos IBGE para UFs
+UF_MAP = {
+    "11": "RO", "12": "AC", "13": "AM", "14": "RR", "15": "PA", "16": "AP", "17": "TO",
+    "21": "MA", "22": "PI", "23": "CE", "24": "RN", "25": "PB", "26": "PE", "27": "AL",
+    "28": "SE", "29": "BA", "31": "MG", "32": "ES", "33": "RJ", "35": "SP", "41": "PR",
+    "42": "SC", "43": "RS", "50": "MS", "51": "MT", "52": "GO", "53": "DF"
+}
+
+N_PADRAO = 5
+RAIO_PADRAO_KM = 50
+# Fazendas por lote: limita os pares candidatos e o DataFrame de cada escrita
+FAZENDAS_POR_LOTE = 5000
+# Raio inicial da busca das mais próximas, em múltiplos do espaçamento médio entre cidades
+FOLGA_BUSCA = 3.0
+COLUNAS = ["NOME_FAZ", "UNIDADE_normalized", "CIDADE", "GEOCODIGO", "UF", "DISTANCIA_KM", "POSICAO",
+           "MAIS_PROXIMA", "NO_RAIO"]
+
+
+def uf_do_geocodigo(geocodigos):
+    """UF de cada geocódigo IBGE pelos dois primeiros dígitos ("Desconhecida" se ausente)."""
+    return pd.Series(geocodigos, dtype=object).astype(str).str[:2].map(UF_MAP).fillna("Desconhecida").to_numpy()
+
+
+def _caixas(lon, lat, raio_km):
+    """Caixas em graus em torno de cada ponto, conservadoras para `raio_km` (como expandir_bbox)."""
+    dlat = raio_km / KM_POR_GRAU
+    lat_max = np.minimum(np.abs(lat) + dlat, 89.0)
+    dlon = np.minimum(raio_km / (KM_POR_GRAU * np.cos(np.radians(lat_max))), 360.0)
+    return shapely.box(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+
+
+def mais_proximas(arvore, lon_cid, lat_cid, lon, lat, n, raio_busca_km):
+    """Pares (ponto, cidade) com as `n` cidades mais próximas de cada ponto, e as distâncias (km).
+
+    As candidatas vêm do STRtree dentro de `raio_busca_km`; pontos com menos de `n`
+    candidatas no raio são resolvidos contra todas as cidades.
+    """
+    ponto, cidade = arvore.query(_caixas(lon, lat, raio_busca_km))
+    distancia = haversine_m(lon[ponto], lat[ponto], lon_cid[cidade], lat_cid[cidade]) / 1000
+    dentro = distancia <= raio_busca_km
+    ponto, cidade, distancia = ponto[dentro], cidade[dentro], distancia[dentro]
+    ordem = np.lexsort((distancia, ponto))
+    ponto, cidade, distancia = ponto[ordem], cidade[ordem], distancia[ordem]
+    inicio_ponto = np.searchsorted(ponto, ponto, side="left")
+    manter = np.arange(ponto.size) - inicio_ponto < n
+    ponto, cidade, distancia = ponto[manter], cidade[manter], distancia[manter]
+
+    poucas = np.flatnonzero(np.bincount(ponto, minlength=lon.size) < n)
+    if poucas.size:
+        todas = matriz_distancias_m(lon[poucas], lat[poucas], lon_cid, lat_cid) / 1000
+        extra = np.argpartition(todas, n - 1, axis=1)[:, :n] if n < lon_cid.size else np.tile(np.arange(n), (poucas.size, 1))
+        completos = ~np.isin(ponto, poucas)
+        ponto = np.concatenate([ponto[completos], np.repeat(poucas, n)])
+        cidade = np.concatenate([cidade[completos], extra.ravel()])
+        distancia = np.concatenate([distancia[completos], np.take_along_axis(todas, extra, axis=1).ravel()])
+    return ponto, cidade, distancia
+
+
+def cidades_proximas_lote(gdf_kml, cidades_gdf, n=N_PADRAO, raio_km=RAIO_PADRAO_KM, fazendas_por_lote=FAZENDAS_POR_LOTE):
+    """Gera DataFrames longos fazenda × cidade, um por lote de fazendas.
+
+    Para cada fazenda entram as `n` cidades de centróide mais próximo e todas as
+    cidades a até `raio_km` da geometria da fazenda, medidos na zona UTM dela (o
+    critério da aba Cidades Próximas, consultado em massa no STRtree de cada zona).
+    DISTANCIA_KM é a distância entre centróides e POSICAO a ordem por distância
+    dentro da fazenda.
+    """
+    if "LON_CENTROIDE" not in cidades_gdf:
+        cidades_gdf = preparar_cidades(cidades_gdf)
+    lon_cid = cidades_gdf["LON_CENTROIDE"].to_numpy()
+    lat_cid = cidades_gdf["LAT_CENTROIDE"].to_numpy()
+    nomes = cidades_gdf["nome"].astype(str).to_numpy() if "nome" in cidades_gdf else np.full(lon_cid.size, "Desconhecida")
+    geocodigos = cidades_gdf["geocodigo"].astype(str).to_numpy() if "geocodigo" in cidades_gdf else np.full(lon_cid.size, "")
+    ufs = uf_do_geocodigo(geocodigos)
+    n = min(n, lon_cid.size)
+
+    # Centróides das cidades indexados uma única vez, em graus (mais próximas) e em cada zona UTM das fazendas (raio)
+    if "ZONA_UTM" not in gdf_kml:
+        gdf_kml = adicionar_centroides(gdf_kml)
+    zonas = gdf_kml["ZONA_UTM"].to_numpy()
+    pontos = shapely.points(lon_cid, lat_cid)
+    arvore_graus = shapely.STRtree(pontos)
+    arvores = {zona: shapely.STRtree(transformar(pontos, WGS84, zona)) for zona in np.unique(zonas)}
+    # Raio que, com densidade uniforme de cidades, contém ~n·FOLGA_BUSCA² delas
+    area_km2 = max(np.ptp(lon_cid) * np.ptp(lat_cid), 1e-6) * KM_POR_GRAU ** 2 * np.cos(np.radians(np.mean(lat_cid)))
+    raio_busca_km = FOLGA_BUSCA * np.sqrt(n * area_km2 / (np.pi * lon_cid.size))
+    lon_faz, lat_faz = gdf_kml["Longitude_Unidade"].to_numpy(), gdf_kml["Latitude_Unidade"].to_numpy()
+    geometrias = gdf_kml["geometry_utm"].to_numpy()
+    nome_faz = gdf_kml["NOME_FAZ"].astype(str).to_numpy()
+    unidades = gdf_kml["UNIDADE_normalized"].to_numpy()
+
+    for inicio in range(0, len(gdf_kml), fazendas_por_lote):
+        fim = min(inicio + fazendas_por_lote, len(gdf_kml))
+        faz_raio, cid_raio = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for zona in np.unique(zonas[inicio:fim]):
+            sel = np.flatnonzero(zonas[inicio:fim] == zona)
+            fazenda, cidade = arvores[zona].query(geometrias[inicio + sel], predicate="dwithin", distance=raio_km * 1000)
+            faz_raio.append(sel[fazenda])
+            cid_raio.append(cidade)
+        faz_raio, cid_raio = np.concatenate(faz_raio), np.concatenate(cid_raio)
+        faz_prox, cid_prox, _ = mais_proximas(
+            arvore_graus, lon_cid, lat_cid, lon_faz[inicio:fim], lat_faz[inicio:fim], n, raio_busca_km
+        )
+
+        pares = pd.DataFrame({
+            "fazenda": np.concatenate([faz_prox, faz_raio]),
+            "cidade": np.concatenate([cid_prox, cid_raio]),
+            "MAIS_PROXIMA": np.r_[np.ones(faz_prox.size, bool), np.zeros(faz_raio.size, bool)],
+            "NO_RAIO": np.r_[np.zeros(faz_prox.size, bool), np.ones(faz_raio.size, bool)],
+        }).groupby(["fazenda", "cidade"], sort=False, as_index=False)[["MAIS_PROXIMA", "NO_RAIO"]].any()
+        fazenda, cidade = pares["fazenda"].to_numpy(), pares["cidade"].to_numpy()
+        lote = pd.DataFrame({
+            "NOME_FAZ": nome_faz[inicio + fazenda],
+            "UNIDADE_normalized": unidades[inicio + fazenda],
+            "CIDADE": nomes[cidade],
+            "GEOCODIGO": geocodigos[cidade],
+            "UF": ufs[cidade],
+            "DISTANCIA_KM": haversine_m(lon_faz[inicio + fazenda], lat_faz[inicio + fazenda], lon_cid[cidade], lat_cid[cidade]) / 1000,
+            "MAIS_PROXIMA": pares["MAIS_PROXIMA"].to_numpy(),
+            "NO_RAIO": pares["NO_RAIO"].to_numpy(),
+            "_fazenda": fazenda,
+        }).sort_values(["_fazenda", "DISTANCIA_KM"], kind="stable")
+        lote["POSICAO"] = lote.groupby("_fazenda").cumcount() + 1
+        yield lote[COLUNAS].reset_index(drop=True)
+
+
+def exportar_cidades_proximas(gdf_kml, cidades_gdf, caminho, formato=None, **kwargs):
+    """Grava cidades_proximas_lote em CSV ou Parquet, lote a lote; retorna o número de linhas.
+
+    O formato vem da extensão de `caminho` quando não informado.
+    """
+    formato = formato or ("parquet" if caminho.endswith(".parquet") else "csv")
+    inicio = time.perf_counter()
+    linhas = 0
+    escritor = None
+    if formato == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    try:
+        for i, lote in enumerate(cidades_proximas_lote(gdf_kml, cidades_gdf, **kwargs)):
+            if formato == "parquet":
+                tabela = pa.Table.from_pandas(lote, preserve_index=False)
+                if escritor is None:
+                    escritor = pq.ParquetWriter(caminho, tabela.schema)
+                escritor.write_table(tabela)
+            else:
+                lote.to_csv(caminho, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            linhas += len(lote)
+    finally:
+        if escritor is not None:
+            escritor.close()
+    logger.info(f"Cidades próximas: {linhas} linhas de {len(gdf_kml)} fazendas em {time.perf_counter() - inicio:.2f} s.")
+    return linhas
+
+
+def main(argv=None):
+    from .kml import ler_kml, reprojetar_utm
+
+    parser = argparse.ArgumentParser(description="Cidades próximas de todas as fazendas, em formato longo.")
+    parser.add_argument("--kml", required=True, help="Arquivo KML/KMZ das fazendas")
+    parser.add_argument("--cidades", required=True, help="GeoJSON de municípios (propriedades nome e geocodigo)")
+    parser.add_argument("--saida", required=True, help="Arquivo .csv ou .parquet")
+    parser.add_argument("--formato", choices=("csv", "parquet"), default=None)
+    parser.add_argument("--n", type=int, default=N_PADRAO, help="Cidades mais próximas por fazenda")
+    parser.add_argument("--raio", type=float, default=RAIO_PADRAO_KM, help="Raio (km) a partir da fazenda")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    gdf_kml, _ = reprojetar_utm(ler_kml(args.kml))
+    cidades_gdf = gpd.read_file(args.cidades)
+    linhas = exportar_cidades_proximas(gdf_kml, cidades_gdf, args.saida, args.formato, n=args.n, raio_km=args.raio)
+    print(f"{linhas} linhas gravadas em {os.path.abspath(args.saida)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
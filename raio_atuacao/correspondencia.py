@@ -0,0 +1,116 @@
+"""Correspondência aproximada UNIDADE (Excel) ↔ NOME_FAZ (KML) com blocagem por n-gramas."""
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+import Levenshtein
+from unidecode import unidecode
+
+# Similaridade mínima (0-100) para aceitar uma correspondência aproximada
+LIMIAR_PADRAO = 90
+CANDIDATOS_POR_ITEM = 5
+TAMANHO_NGRAMA = 3
+# N-gramas presentes em mais que esta fração dos nomes não discriminam e são ignorados na blocagem
+FRACAO_MAX_NGRAMA = 0.02
+MIN_POSTAGENS = 50
+# Chaves memorizadas por normalizar_chave (nomes do Excel e do KML, repetidos entre ingestões)
+MAX_CHAVES_MEMORIZADAS = 1 << 18
+
+
+@functools.lru_cache(maxsize=MAX_CHAVES_MEMORIZADAS)
+def normalizar_chave(texto):
+    """Remove acentos e pontuação e ordena as palavras, tornando a chave insensível à ordem."""
+    tokens = re.sub(r"[^A-Z0-9]+", " ", unidecode(str(texto)).upper()).split()
+    return " ".join(sorted(tokens))
+
+
+def ngramas(chave, n=TAMANHO_NGRAMA):
+    """Conjunto de n-gramas de caracteres da chave (com bordas)."""
+    chave = f" {chave} "
+    return {chave[i:i + n] for i in range(len(chave) - n + 1)}
+
+
+class IndiceNgramas:
+    """Índice invertido n-grama → posições das chaves, para gerar candidatos sem comparar todos os pares."""
+
+    def __init__(self, chaves, fracao_max=FRACAO_MAX_NGRAMA):
+        self.chaves = list(chaves)
+        postagens = {}
+        for i, chave in enumerate(self.chaves):
+            for grama in ngramas(chave):
+                postagens.setdefault(grama, []).append(i)
+        limite = max(MIN_POSTAGENS, int(fracao_max * len(self.chaves)))
+        self.postagens = {
+            grama: np.asarray(ids, dtype=np.int64) for grama, ids in postagens.items() if len(ids) <= limite
+        }
+
+    def candidatos(self, chave, k=CANDIDATOS_POR_ITEM):
+        """Até `k` posições que mais compartilham n-gramas com a chave."""
+        listas = [self.postagens[g] for g in ngramas(chave) if g in self.postagens]
+        if not listas:
+            return np.empty(0, dtype=np.int64)
+        ids, contagens = np.unique(np.concatenate(listas), return_counts=True)
+        if ids.size > k:
+            melhores = np.argpartition(-contagens, k - 1)[:k]
+            ids = ids[melhores]
+        return ids
+
+
+def corresponder(esquerda, direita, limiar=LIMIAR_PADRAO, k=CANDIDATOS_POR_ITEM):
+    """Associa cada valor de `esquerda` ao valor mais parecido de `direita`.
+
+    Valores com chave normalizada idêntica casam diretamente (score 100); os demais
+    são comparados (Levenshtein sobre as chaves) apenas com os `k` candidatos da
+    blocagem por n-gramas. Retorna (correspondências, não encontrados), onde as
+    correspondências têm as colunas esquerda, direita, score e metodo, e os não
+    encontrados trazem o melhor candidato abaixo do limiar para revisão.
+    """
+    esquerda = pd.unique(pd.Series(esquerda, dtype=object))
+    direita = pd.unique(pd.Series(direita, dtype=object))
+    chaves_dir = [normalizar_chave(v) for v in direita]
+    exatos = {}
+    for i, chave in enumerate(chaves_dir):
+        exatos.setdefault(chave, i)
+
+    indice = None
+    casados, nao_casados = [], []
+    for valor in esquerda:
+        chave = normalizar_chave(valor)
+        if chave in exatos:
+            casados.append((valor, direita[exatos[chave]], 100.0, "exata"))
+            continue
+        if indice is None:
+            indice = IndiceNgramas(chaves_dir)
+        melhor, score = None, 0.0
+        for j in indice.candidatos(chave, k):
+            s = Levenshtein.ratio(chave, chaves_dir[j]) * 100
+            if s > score:
+                melhor, score = direita[j], s
+        if melhor is not None and score >= limiar:
+            casados.append((valor, melhor, score, "aproximada"))
+        else:
+            nao_casados.append((valor, melhor, score))
+
+    correspondencias = pd.DataFrame(casados, columns=["esquerda", "direita", "score", "metodo"])
+    nao_encontrados = pd.DataFrame(nao_casados, columns=["esquerda", "melhor_candidato", "score"])
+    return correspondencias, nao_encontrados
+
+
+def alinhar_unidades(df_analistas, gdf_kml, limiar=LIMIAR_PADRAO):
+    """Reescreve UNIDADE_normalized da planilha com a chave do KML correspondente.
+
+    A chave original fica em UNIDADE_EXCEL e a confiança em SCORE_CORRESPONDENCIA,
+    de modo que os merges por UNIDADE_normalized passam a incluir correspondências
+    aproximadas. Retorna (df_analistas, correspondências, não encontrados).
+    """
+    correspondencias, nao_encontrados = corresponder(
+        df_analistas["UNIDADE_normalized"], gdf_kml["UNIDADE_normalized"], limiar
+    )
+    df_analistas = df_analistas.copy()
+    df_analistas["UNIDADE_EXCEL"] = df_analistas["UNIDADE_normalized"]
+    destino = dict(zip(correspondencias["esquerda"], correspondencias["direita"]))
+    score = dict(zip(correspondencias["esquerda"], correspondencias["score"]))
+    df_analistas["UNIDADE_normalized"] = df_analistas["UNIDADE_EXCEL"].map(destino).fillna(df_analistas["UNIDADE_EXCEL"])
+    df_analistas["SCORE_CORRESPONDENCIA"] = df_analistas["UNIDADE_EXCEL"].map(score)
+    return df_analistas, correspondencias, nao_encontrados
@@ -0,0 +1,68 @@
+"""Distâncias geodésicas vetorizadas (Haversine) com NumPy."""
+import numpy as np
+
+RAIO_TERRA_M = 6371000.0
+
+# Limite padrão de elementos por bloco no modo em blocos (~64 MB em float64)
+ELEMENTOS_POR_BLOCO = 8_000_000
+
+
+def _radianos(lon, lat):
+    """Converte coordenadas em graus para radianos, pré-calculando o cosseno da latitude."""
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    return lon, lat, np.cos(lat)
+
+
+def _haversine_rad(lon1, lat1, cos1, lon2, lat2, cos2):
+    """Núcleo da fórmula de Haversine sobre valores já em radianos (com broadcasting)."""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + cos1 * cos2 * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    """Calcula distância em metros usando a fórmula de Haversine.
+
+    Aceita escalares ou arrays (com broadcasting do NumPy) e retorna um float
+    para entradas escalares ou um array caso contrário.
+    """
+    d = _haversine_rad(*_radianos(lon1, lat1), *_radianos(lon2, lat2))
+    return float(d) if d.ndim == 0 else d
+
+
+def matriz_distancias_m(lon_a, lat_a, lon_b, lat_b, dtype=np.float64):
+    """Matriz (len(a), len(b)) de distâncias em metros entre dois conjuntos de pontos."""
+    lon_a, lat_a, cos_a = _radianos(lon_a, lat_a)
+    lon_b, lat_b, cos_b = _radianos(lon_b, lat_b)
+    d = _haversine_rad(lon_a[:, None], lat_a[:, None], cos_a[:, None], lon_b[None, :], lat_b[None, :], cos_b[None, :])
+    return d.astype(dtype, copy=False)
+
+
+def blocos_distancias_m(lon_a, lat_a, lon_b, lat_b, elementos_por_bloco=ELEMENTOS_POR_BLOCO, dtype=np.float64):
+    """Itera a matriz de distâncias em blocos de linhas de `a`, retornando (inicio, fim, bloco).
+
+    Útil quando len(a) * len(b) não cabe em memória: cada bloco tem no máximo
+    `elementos_por_bloco` elementos e a trigonometria de `b` é calculada uma única vez.
+    """
+    lon_a, lat_a, cos_a = _radianos(lon_a, lat_a)
+    lon_b, lat_b, cos_b = (v[None, :] for v in _radianos(lon_b, lat_b))
+    linhas = max(1, elementos_por_bloco // max(lon_b.size, 1))
+    for inicio in range(0, lon_a.size, linhas):
+        fim = min(inicio + linhas, lon_a.size)
+        bloco = _haversine_rad(
+            lon_a[inicio:fim, None], lat_a[inicio:fim, None], cos_a[inicio:fim, None],
+            lon_b, lat_b, cos_b,
+        )
+        yield inicio, fim, bloco.astype(dtype, copy=False)
+
+
+def mais_proximos_m(lon_a, lat_a, lon_b, lat_b, elementos_por_bloco=ELEMENTOS_POR_BLOCO):
+    """Para cada ponto de `a`, índice e distância (m) do ponto mais próximo de `b`, em blocos."""
+    n = np.asarray(lon_a).size
+    indices = np.empty(n, dtype=np.int64)
+    distancias = np.empty(n, dtype=np.float64)
+    for inicio, fim, bloco in blocos_distancias_m(lon_a, lat_a, lon_b, lat_b, elementos_por_bloco):
+        indices[inicio:fim] = bloco.argmin(axis=1)
+        distancias[inicio:fim] = bloco[np.arange(fim - inicio), indices[inicio:fim]]
+    return indices, distancias
+
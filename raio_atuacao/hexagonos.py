@@ -0,0 +1,154 @@
+"""Grade hexagonal hierárquica com agregados de fazendas e especialistas por resolução."""
+import numpy as np
+import pandas as pd
+import shapely
+
+from .projecao import WGS84, transformar
+
+# Albers de área igual da América do Sul: hexágonos de mesma área em todo o país
+CRS_HEXAGONOS = "ESRI:102033"
+# (resolução, lado do hexágono em metros, zoom mínimo, zoom máximo exclusivo); cada nível tem 1/4 da área do anterior
+RESOLUCOES = [(0, 200_000, 0, 5), (1, 100_000, 5, 6), (2, 50_000, 6, 7), (3, 25_000, 7, 8), (4, 12_500, 8, 9),
+              (5, 6_250, 9, 30)]
+# Hexágonos enviados ao mapa, somando todas as resoluções; as mais finas que não cabem ficam de fora
+MAX_HEXAGONOS_MAPA = 2000
+# Metros quadrados por hectare
+M2_POR_HA = 10_000
+COLUNAS_AGREGADOS = ["RESOLUCAO", "HEXAGONO", "FAZENDAS", "AREA_HA", "DIST_MEDIA_KM", "DIST_MAX_KM", "VINCULOS",
+                     "ESPECIALISTAS", "FAZENDAS_POR_ESPECIALISTA"]
+
+RAIZ3 = np.sqrt(3.0)
+
+
+def hexagonos(x, y, lado):
+    """Hexágono (id int64 das coordenadas axiais q, r) de cada ponto no plano, para hexágonos de `lado` metros."""
+    q = (RAIZ3 / 3 * x - y / 3) / lado
+    r = (2 / 3 * y) / lado
+    # Arredondamento em coordenadas cúbicas: corrige o eixo com o maior erro
+    s = -q - r
+    qi, ri, si = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(qi - q), np.abs(ri - r), np.abs(si - s)
+    corrige_q = (dq > dr) & (dq > ds)
+    corrige_r = ~corrige_q & (dr > ds)
+    qi = np.where(corrige_q, -ri - si, qi)
+    ri = np.where(corrige_r, -qi - si, ri)
+    return (qi.astype(np.int64) << 32) | (ri.astype(np.int64) & 0xFFFFFFFF)
+
+
+def _centros(ids, lado):
+    """Centros (x, y) no plano de CRS_HEXAGONOS dos hexágonos `ids`."""
+    ids = np.asarray(ids, dtype=np.int64)
+    q = (ids >> 32).astype(float)
+    r = (((ids & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000).astype(float)
+    return lado * RAIZ3 * (q + r / 2), lado * 1.5 * r
+
+
+def centros_hexagonos(ids, lado):
+    """(lon, lat) dos centros dos hexágonos `ids` com `lado` metros."""
+    centros = transformar(shapely.points(*_centros(ids, lado)), CRS_HEXAGONOS, WGS84)
+    return shapely.get_x(centros), shapely.get_y(centros)
+
+
+def poligonos_hexagonos(ids, lado):
+    """Polígonos em EPSG:4326 dos hexágonos `ids` (de hexagonos) com `lado` metros."""
+    cx, cy = _centros(ids, lado)
+    angulos = np.radians(30 + 60 * np.arange(7))
+    xs = cx[:, None] + lado * np.cos(angulos)
+    ys = cy[:, None] + lado * np.sin(angulos)
+    aneis = shapely.linearrings(np.stack([xs, ys], axis=-1))
+    return transformar(shapely.polygons(aneis), CRS_HEXAGONOS, WGS84)
+
+
+class GradeHexagonal:
+    """Fazendas e bases de especialistas binadas uma vez em todas as resoluções, com agregados por hexágono.
+
+    Cada fazenda conta uma vez no hexágono do seu centróide (FAZENDAS, AREA_HA) e cada
+    vínculo fazenda × especialista entra nas distâncias (DIST_MEDIA_KM, DIST_MAX_KM).
+    ESPECIALISTAS conta as bases no hexágono e FAZENDAS_POR_ESPECIALISTA é a média de
+    fazendas atendidas por esses especialistas. As resoluções não se encaixam
+    exatamente como numa quadtree; o detalhamento de um hexágono (recorte) usa as
+    fazendas e bases que caíram nele, então as contagens dos níveis sempre fecham.
+    """
+
+    def __init__(self, base, gdf_kml, resolucoes=RESOLUCOES):
+        self.resolucoes = list(resolucoes)
+
+        # Fazendas: uma linha por unidade, com área medida na zona UTM de cada uma
+        fazendas = base.drop_duplicates("UNIDADE_normalized")
+        geometrias = gdf_kml.drop_duplicates("UNIDADE_normalized").set_index("UNIDADE_normalized")
+        coluna = "geometry_utm" if "geometry_utm" in geometrias else "geometry"
+        area = pd.Series(shapely.area(geometrias[coluna].to_numpy()) / M2_POR_HA, index=geometrias.index)
+        self.fazendas = pd.DataFrame({
+            "UNIDADE_normalized": fazendas["UNIDADE_normalized"].to_numpy(),
+            "AREA_HA": fazendas["UNIDADE_normalized"].map(area).fillna(0).to_numpy(),
+        })
+        self.vinculos = pd.DataFrame({
+            "UNIDADE_normalized": base["UNIDADE_normalized"].to_numpy(),
+            "DISTANCIA_KM": base["DISTANCIA_KM"].to_numpy(dtype=float),
+        })
+        especialistas = base.groupby("ESPECIALISTA", sort=False).agg(
+            LON_BASE=("LON_BASE", "first"), LAT_BASE=("LAT_BASE", "first"), FAZENDAS=("UNIDADE_normalized", "nunique"),
+        )
+        especialistas = especialistas[especialistas["LON_BASE"].notna() & especialistas["LAT_BASE"].notna()]
+        self.especialistas = especialistas.reset_index()
+
+        # Hexágono de cada fazenda e de cada base em todas as resoluções, de uma vez
+        x, y = self._projetar(fazendas["Longitude_Unidade"], fazendas["Latitude_Unidade"])
+        xb, yb = self._projetar(self.especialistas["LON_BASE"], self.especialistas["LAT_BASE"])
+        for res, lado, _, _ in self.resolucoes:
+            self.fazendas[res] = hexagonos(x, y, lado)
+            self.especialistas[res] = hexagonos(xb, yb, lado)
+        self.vinculos = self.vinculos.merge(self.fazendas, on="UNIDADE_normalized", how="inner")
+        self.agregados = self._agregar(self.fazendas, self.vinculos, self.especialistas, self.resolucoes)
+
+    @staticmethod
+    def _projetar(lon, lat):
+        pontos = shapely.points(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float))
+        projetados = transformar(pontos, WGS84, CRS_HEXAGONOS)
+        return shapely.get_x(projetados), shapely.get_y(projetados)
+
+    @staticmethod
+    def _agregar(fazendas, vinculos, especialistas, resolucoes):
+        """DataFrame longo (COLUNAS_AGREGADOS) com um hexágono por linha em cada resolução."""
+        partes = []
+        for res, _, _, _ in resolucoes:
+            por_fazenda = fazendas.groupby(res).agg(FAZENDAS=("UNIDADE_normalized", "size"), AREA_HA=("AREA_HA", "sum"))
+            por_vinculo = vinculos.groupby(res)["DISTANCIA_KM"].agg(DIST_MEDIA_KM="mean", DIST_MAX_KM="max", VINCULOS="size")
+            por_base = especialistas.groupby(res)["FAZENDAS"].agg(ESPECIALISTAS="size", ATENDIDAS="sum")
+            agregado = por_fazenda.join(por_vinculo, how="outer").join(por_base, how="outer")
+            agregado = agregado.fillna({"FAZENDAS": 0, "AREA_HA": 0.0, "VINCULOS": 0, "ESPECIALISTAS": 0})
+            agregado["FAZENDAS_POR_ESPECIALISTA"] = agregado["ATENDIDAS"] / agregado["ESPECIALISTAS"].replace(0, np.nan)
+            agregado = agregado.rename_axis("HEXAGONO").reset_index().assign(RESOLUCAO=res)
+            partes.append(agregado)
+        agregados = pd.concat(partes, ignore_index=True)[COLUNAS_AGREGADOS]
+        return agregados.astype({"FAZENDAS": np.int64, "VINCULOS": np.int64, "ESPECIALISTAS": np.int64})
+
+    def recorte(self, resolucao, hexagono):
+        """Agregados das resoluções mais finas só com as fazendas e bases do `hexagono` de `resolucao`."""
+        finas = [r for r in self.resolucoes if r[0] > resolucao]
+        if not finas:
+            return self.agregados[(self.agregados["RESOLUCAO"] == resolucao) & (self.agregados["HEXAGONO"] == hexagono)]
+        return self._agregar(
+            self.fazendas[self.fazendas[resolucao] == hexagono], self.vinculos[self.vinculos[resolucao] == hexagono],
+            self.especialistas[self.especialistas[resolucao] == hexagono], finas,
+        )
+
+    def camadas(self, agregados=None, max_hexagonos=MAX_HEXAGONOS_MAPA):
+        """[(resolução, zoom mínimo, zoom máximo, agregados com geometry em EPSG:4326)] que cabem em `max_hexagonos`.
+
+        Começa pela resolução mais grossa presente; a última incluída vale até o zoom máximo.
+        """
+        agregados = self.agregados if agregados is None else agregados
+        camadas, total = [], 0
+        for res, lado, zmin, zmax in self.resolucoes:
+            nivel = agregados[agregados["RESOLUCAO"] == res]
+            if nivel.empty:
+                continue
+            if camadas and total + len(nivel) > max_hexagonos:
+                break
+            total += len(nivel)
+            camadas.append([res, zmin, zmax, nivel.assign(geometry=poligonos_hexagonos(nivel["HEXAGONO"], lado))])
+        if camadas:
+            camadas[0][1] = 0
+            camadas[-1][2] = max(zmax for _, _, _, zmax in self.resolucoes)
+        return [tuple(camada) for camada in camadas]
@@ -0,0 +1,69 @@
+"""Índice espacial de pontos (STRtree) para consultas por raio."""
+import numpy as np
+import shapely
+
+from .distancia import haversine_m
+from .projecao import WGS84, transformar
+
+# Quilômetros por grau de latitude (com folga para o pré-filtro por bbox)
+KM_POR_GRAU = 110.0
+
+
+def expandir_bbox(bounds, raio_km):
+    """Expande um bbox (minx, miny, maxx, maxy) em graus de forma conservadora por `raio_km`."""
+    minx, miny, maxx, maxy = bounds
+    dlat = raio_km / KM_POR_GRAU
+    lat_max = min(max(abs(miny), abs(maxy)) + dlat, 89.0)
+    dlon = min(raio_km / (KM_POR_GRAU * np.cos(np.radians(lat_max))), 360.0)
+    return minx - dlon, miny - dlat, maxx + dlon, maxy + dlat
+
+
+class IndicePontos:
+    """Pontos em EPSG:4326 indexados por STRtree, com pré-filtro por bbox e checagem exata."""
+
+    def __init__(self, lon, lat):
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.pontos = shapely.points(self.lon, self.lat)
+        self.arvore = shapely.STRtree(self.pontos)
+
+    def __len__(self):
+        return self.lon.size
+
+    def candidatos(self, bounds, raio_km):
+        """Índices (ordenados) dos pontos dentro do bbox expandido por `raio_km`."""
+        return np.sort(self.arvore.query(shapely.box(*expandir_bbox(bounds, raio_km))))
+
+    def no_raio(self, lon, lat, raio_km):
+        """Índices e distâncias (km) dos pontos a até `raio_km` de (lon, lat), do mais próximo ao mais distante."""
+        cand = self.candidatos((lon, lat, lon, lat), raio_km)
+        dist_km = haversine_m(lon, lat, self.lon[cand], self.lat[cand]) / 1000
+        dentro = dist_km <= raio_km
+        ordem = np.argsort(dist_km[dentro], kind="stable")
+        return cand[dentro][ordem], dist_km[dentro][ordem]
+
+    def perto_da_geometria(self, geometria, crs, raio_km):
+        """Índices (na ordem original) dos pontos a até `raio_km` de uma geometria em CRS projetado.
+
+        Equivale a testar `within(geometria.buffer(raio))`, mas só os candidatos do
+        bbox são reprojetados (com transformadores reaproveitados entre consultas) e a
+        distância é medida exatamente no CRS da geometria, em geral a zona UTM da fazenda.
+        """
+        bounds = shapely.bounds(transformar([geometria], crs, WGS84)[0])
+        cand = self.candidatos(bounds, raio_km)
+        if not cand.size:
+            return cand
+        projetados = transformar(self.pontos[cand], WGS84, crs)
+        return cand[shapely.dwithin(geometria, projetados, raio_km * 1000)]
+
+
+def preparar_cidades(cidades_gdf):
+    """Converte a camada de cidades para EPSG:4326 e materializa os centróides (LON/LAT_CENTROIDE)."""
+    centroides = cidades_gdf.geometry.centroid
+    if cidades_gdf.crs is not None:
+        centroides = centroides.to_crs("EPSG:4326")
+        cidades_gdf = cidades_gdf.to_crs("EPSG:4326")
+    cidades_gdf = cidades_gdf.reset_index(drop=True)
+    cidades_gdf["LON_CENTROIDE"] = centroides.x.to_numpy()
+    cidades_gdf["LAT_CENTROIDE"] = centroides.y.to_numpy()
+    return cidades_gdf
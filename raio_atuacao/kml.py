@@ -0,0 +1,342 @@
+"""Leitura em streaming de arquivos KML/KMZ para GeoDataFrame."""
+import contextlib
+import hashlib
+import io
+import logging
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from .texto import normalize_str, normalizar_serie
+
+logger = logging.getLogger(__name__)
+
+COLUNAS_KML = ["Name", "geometry", "UNIDADE_normalized"]
+EXTENSOES_KML = (".kml", ".kmz")
+
+# Quantidade de Placemarks acumulados antes de converter coordenadas em geometrias
+TAMANHO_LOTE = 5000
+
+# Tipos de partes de geometria coletadas dentro de um Placemark
+PONTO, LINHA, POLIGONO = 0, 1, 2
+
+
+def _local(tag):
+    """Remove o namespace de uma tag XML."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _abrir_fonte(fonte, pilha):
+    """Retorna um arquivo binário com o conteúdo KML, descompactando KMZ se necessário.
+
+    O que for aberto aqui (arquivo do caminho, KMZ) é registrado em `pilha`
+    (contextlib.ExitStack) e fechado com ela; arquivos recebidos abertos não são fechados.
+    """
+    if isinstance(fonte, (bytes, bytearray, memoryview)):
+        fonte = io.BytesIO(fonte)
+    elif isinstance(fonte, str):
+        fonte = pilha.enter_context(open(fonte, "rb"))
+    inicio = fonte.read(4)
+    fonte.seek(0)
+    if inicio[:2] != b"PK":
+        return fonte
+    zf = pilha.enter_context(zipfile.ZipFile(fonte))
+    nomes = [n for n in zf.namelist() if n.lower().endswith(".kml")]
+    if not nomes:
+        raise ValueError("Arquivo KMZ sem documento .kml interno.")
+    # Pela especificação o documento principal é doc.kml; senão, o primeiro .kml
+    nome = next((n for n in nomes if n.lower().endswith("doc.kml")), nomes[0])
+    return pilha.enter_context(zf.open(nome))
+
+
+def _coordenadas(elem):
+    """Texto do filho <coordinates> de um elemento de geometria."""
+    for filho in elem:
+        if _local(filho.tag) == "coordinates":
+            return filho.text or ""
+    return ""
+
+
+def _coletar_partes(elem, partes):
+    """Percorre uma geometria KML (inclusive MultiGeometry) acumulando (tipo, [anéis])."""
+    tag = _local(elem.tag)
+    if tag == "MultiGeometry":
+        for filho in elem:
+            _coletar_partes(filho, partes)
+    elif tag == "Polygon":
+        externo, internos = None, []
+        for fronteira in elem:
+            nome = _local(fronteira.tag)
+            if nome not in ("outerBoundaryIs", "innerBoundaryIs"):
+                continue
+            for anel in fronteira:
+                if _local(anel.tag) != "LinearRing":
+                    continue
+                if nome == "outerBoundaryIs":
+                    externo = _coordenadas(anel)
+                else:
+                    internos.append(_coordenadas(anel))
+        if externo is not None:
+            partes.append((POLIGONO, [externo] + internos))
+    elif tag in ("LineString", "LinearRing"):
+        partes.append((LINHA, [_coordenadas(elem)]))
+    elif tag == "Point":
+        partes.append((PONTO, [_coordenadas(elem)]))
+
+
+def _parse_coordenadas(textos):
+    """Converte vários textos de coordenadas KML em um único array (n, 2) e contagens por texto."""
+    dims = np.empty(len(textos), dtype=np.int64)
+    contagens = np.empty(len(textos), dtype=np.int64)
+    for i, texto in enumerate(textos):
+        primeiro = texto.split(None, 1)
+        dims[i] = primeiro[0].count(",") + 1 if primeiro else 2
+        contagens[i] = texto.count(",") // max(dims[i] - 1, 1) if primeiro else 0
+    valores = np.fromstring(" ".join(textos).replace(",", " "), sep=" ")
+    if valores.size != int((dims * contagens).sum()):
+        raise ValueError("Coordenadas KML malformadas.")
+    if (dims == dims[0]).all():
+        xy = valores.reshape(-1, dims[0])[:, :2]
+    else:
+        fins = np.cumsum(dims * contagens)
+        xy = np.concatenate([
+            valores[fim - d * n:fim].reshape(n, d)[:, :2]
+            for fim, d, n in zip(fins, dims, contagens)
+        ])
+    return np.ascontiguousarray(xy), contagens
+
+
+def _parse_textos_seguro(textos):
+    """Como _parse_coordenadas, mas isola textos malformados (contagem zero)."""
+    try:
+        return _parse_coordenadas(textos)
+    except ValueError:
+        blocos, contagens = [], []
+        for texto in textos:
+            try:
+                xy, n = _parse_coordenadas([texto])
+            except ValueError:
+                xy, n = np.empty((0, 2)), np.zeros(1, dtype=np.int64)
+            blocos.append(xy)
+            contagens.append(n[0])
+        return np.concatenate(blocos), np.asarray(contagens, dtype=np.int64)
+
+
+def _construir_geometrias(partes):
+    """Cria em lote as geometrias shapely de uma lista de (tipo, [anéis])."""
+    textos = [texto for _, aneis in partes for texto in aneis]
+    resultado = np.full(len(partes), None, dtype=object)
+    if not textos:
+        return resultado
+
+    tipos = np.array([tipo for tipo, _ in partes], dtype=np.int8)
+    aneis_por_parte = np.array([len(aneis) for _, aneis in partes], dtype=np.int64)
+    parte_do_anel = np.repeat(np.arange(len(partes)), aneis_por_parte)
+    externo = np.zeros(len(textos), dtype=bool)
+    externo[np.cumsum(aneis_por_parte) - aneis_por_parte] = True
+
+    xy, contagens = _parse_textos_seguro(textos)
+    if not len(xy):
+        return resultado
+    anel_da_coord = np.repeat(np.arange(len(textos)), contagens)
+    tipo_anel = tipos[parte_do_anel]
+
+    # Anéis abertos são fechados pelo shapely, o que acrescenta uma coordenada
+    fim = np.cumsum(contagens)
+    vazio = contagens == 0
+    aberto = vazio | (xy[np.where(vazio, 0, fim - contagens)] != xy[np.where(vazio, 0, fim - 1)]).any(axis=1)
+    efetivo = contagens + ((tipo_anel == POLIGONO) & aberto)
+
+    # Partes inválidas: anel externo curto demais para o tipo de geometria
+    anel_valido = efetivo >= np.choose(tipo_anel, [1, 2, 4])
+    parte_valida = np.ones(len(partes), dtype=bool)
+    parte_valida[parte_do_anel[externo & ~anel_valido]] = False
+    # Buracos degenerados são descartados sem invalidar o polígono
+    usar = parte_valida[parte_do_anel] & anel_valido
+
+    sel = np.flatnonzero(usar & (tipo_anel == PONTO))
+    if sel.size:
+        resultado[parte_do_anel[sel]] = shapely.points(xy[fim[sel] - contagens[sel]])
+
+    for tipo in (LINHA, POLIGONO):
+        mascara = usar & (tipo_anel == tipo)
+        sel = np.flatnonzero(mascara)
+        if not sel.size:
+            continue
+        coords = xy[mascara[anel_da_coord]]
+        indices = np.repeat(np.arange(sel.size), contagens[sel])
+        if tipo == LINHA:
+            resultado[parte_do_anel[sel]] = shapely.linestrings(coords, indices=indices)
+        else:
+            aneis = shapely.linearrings(coords, indices=indices)
+            donos, poligono = np.unique(parte_do_anel[sel], return_inverse=True)
+            resultado[donos] = shapely.polygons(aneis, indices=poligono)
+
+    invalidas = np.flatnonzero(~parte_valida)
+    if invalidas.size:
+        logger.warning(f"{invalidas.size} geometrias KML descartadas por coordenadas insuficientes.")
+    return resultado
+
+
+def _iterar_placemarks(arquivo):
+    """Itera (props, partes) de cada Placemark, liberando os elementos já lidos."""
+    for _, elem in ET.iterparse(arquivo, events=("end",)):
+        tag = _local(elem.tag)
+        if tag in ("Folder", "Document"):
+            elem.clear()
+            continue
+        if tag != "Placemark":
+            continue
+
+        props, partes, nome = {}, [], "Sem Nome"
+        for filho in elem:
+            tag = _local(filho.tag)
+            if tag == "name":
+                nome = filho.text
+            elif tag == "ExtendedData":
+                for sd in filho.iter():
+                    if _local(sd.tag) == "SimpleData":
+                        props[sd.get("name")] = sd.text
+            else:
+                _coletar_partes(filho, partes)
+        props["Name"] = nome
+        yield props, partes
+
+        # Descarta o conteúdo do Placemark processado para manter a memória constante
+        elem.clear()
+
+
+def hash_placemark(props, partes):
+    """Hash do conteúdo de um Placemark (propriedades e textos de coordenadas, na ordem do arquivo)."""
+    h = hashlib.blake2b(digest_size=12)
+    for chave in sorted(props, key=str):
+        h.update(f"{chave}\x1f{props[chave]}\x1e".encode())
+    for tipo, aneis in partes:
+        h.update(b"\x1d%d" % tipo)
+        for texto in aneis:
+            h.update(texto.encode())
+            h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def unidade_placemark(props):
+    """UNIDADE_normalized de um Placemark, como calculada por ler_kml."""
+    nome_faz = props.get("NOME_FAZ")
+    return normalize_str(props["Name"] if nome_faz is None else nome_faz)
+
+
+def ler_kml(fonte, tamanho_lote=TAMANHO_LOTE, manter=None):
+    """Lê KML/KMZ (bytes, caminho ou arquivo) e retorna um GeoDataFrame em EPSG:4326 agrupado por unidade.
+
+    `manter(props, partes)`, se informado, é chamado para cada Placemark; os que
+    retornam False são descartados sem construir geometrias.
+    """
+    registros, geometrias, donos = [], [], []
+    lote, donos_lote = [], []
+
+    def _fechar_lote():
+        geometrias.extend(_construir_geometrias(lote))
+        donos.extend(donos_lote)
+        lote.clear()
+        donos_lote.clear()
+
+    with contextlib.ExitStack() as pilha:
+        for props, partes in _iterar_placemarks(_abrir_fonte(fonte, pilha)):
+            if manter is not None and not manter(props, partes):
+                continue
+            indice = len(registros)
+            registros.append(props)
+            lote.extend(partes)
+            donos_lote.extend([indice] * len(partes))
+            if len(lote) >= tamanho_lote:
+                _fechar_lote()
+    _fechar_lote()
+
+    if not registros:
+        return gpd.GeoDataFrame(columns=COLUNAS_KML, geometry="geometry", crs="EPSG:4326")
+
+    props = pd.DataFrame.from_records(registros)
+    nome_faz = props["NOME_FAZ"].fillna(props["Name"]) if "NOME_FAZ" in props else props["Name"]
+    props["UNIDADE_normalized"] = normalizar_serie(nome_faz).to_numpy()
+
+    partes = pd.DataFrame({"dono": np.asarray(donos, dtype=np.int64), "geometry": geometrias})
+    partes = partes[partes["geometry"].notna()]
+    if partes.empty:
+        return gpd.GeoDataFrame(columns=COLUNAS_KML, geometry="geometry", crs="EPSG:4326")
+    # Só Placemarks com geometria válida contribuem com propriedades, como no parser original
+    props = props.iloc[np.unique(partes["dono"].to_numpy())]
+    partes["unidade"] = props["UNIDADE_normalized"].reindex(partes["dono"]).to_numpy()
+
+    # Unidades com uma única parte dispensam a união (caso mais comum)
+    repetida = partes["unidade"].duplicated(keep=False)
+    geometria = dict(zip(partes.loc[~repetida, "unidade"], partes.loc[~repetida, "geometry"]))
+    for unidade, grupo in partes[repetida].groupby("unidade", sort=False)["geometry"]:
+        geometria[unidade] = shapely.union_all(grupo.to_numpy())
+
+    agrupado = props.groupby("UNIDADE_normalized", sort=False).last()
+    agrupado["UNIDADE_normalized"] = agrupado.index
+    agrupado["NOME_FAZ"] = agrupado["NOME_FAZ"].fillna(agrupado["Name"]) if "NOME_FAZ" in agrupado else agrupado["Name"]
+    extras = [c for c in agrupado.columns if c not in ("Name", "NOME_FAZ", "UNIDADE_normalized")]
+    agrupado["geometry"] = agrupado.index.map(geometria)
+    agrupado = agrupado[["Name", "geometry", "NOME_FAZ", "UNIDADE_normalized"] + extras]
+    return gpd.GeoDataFrame(agrupado.reset_index(drop=True), geometry="geometry", crs="EPSG:4326")
+
+
+def expandir_zip(nome, conteudo):
+    """[(nome, bytes)] dos KML/KMZ de um .zip, por nome; outros arquivos voltam como estão."""
+    if not nome.lower().endswith(".zip"):
+        return [(nome, conteudo)]
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+        membros = sorted(m for m in zf.namelist()
+                         if m.lower().endswith(EXTENSOES_KML) and not m.startswith("__MACOSX/"))
+        if not membros:
+            raise ValueError(f"{nome}: nenhum KML/KMZ dentro do .zip.")
+        return [(f"{nome}/{m}", zf.read(m)) for m in membros]
+
+
+def unir_kmls(gdfs):
+    """Junta resultados de ler_kml, na ordem dos arquivos, como se fossem um só documento.
+
+    Unidades presentes em mais de um arquivo têm as geometrias unidas e ficam com as
+    últimas propriedades não nulas, como os Placemarks repetidos dentro de um arquivo.
+    """
+    gdfs = [gdf for gdf in gdfs if len(gdf)]
+    if not gdfs:
+        return gpd.GeoDataFrame(columns=COLUNAS_KML, geometry="geometry", crs="EPSG:4326")
+    todos = pd.concat(gdfs, ignore_index=True)
+    repetida = todos["UNIDADE_normalized"].duplicated(keep=False)
+    if not repetida.any():
+        return todos
+    geometria = dict(zip(todos.loc[~repetida, "UNIDADE_normalized"], todos.loc[~repetida, "geometry"]))
+    for unidade, grupo in todos[repetida].groupby("UNIDADE_normalized", sort=False)["geometry"]:
+        geometria[unidade] = shapely.union_all(grupo.to_numpy())
+    agrupado = pd.DataFrame(todos.drop(columns="geometry")).groupby("UNIDADE_normalized", sort=False).last()
+    agrupado["UNIDADE_normalized"] = agrupado.index
+    agrupado["geometry"] = agrupado.index.map(geometria)
+    return gpd.GeoDataFrame(agrupado[todos.columns].reset_index(drop=True), geometry="geometry", crs="EPSG:4326")
+
+
+def reprojetar_utm(gdf, crs=None):
+    """Reprojeta o GeoDataFrame para a zona UTM com mais fazendas (ou para `crs`) e retorna (gdf, crs).
+
+    A zona de cada fazenda vem do seu centróide em graus. As geometrias em EPSG:4326
+    ficam em geometry_4326, para não precisarem ser reprojetadas de volta depois.
+    """
+    from .projecao import WGS84, transformar, zona_predominante, zonas_utm
+
+    if gdf.empty:
+        return gdf, gdf.crs
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(WGS84)
+    graus = gdf.geometry.to_numpy()
+    if crs is None:
+        centroides = shapely.centroid(graus)
+        crs = f"EPSG:{zona_predominante(zonas_utm(shapely.get_x(centroides), shapely.get_y(centroides)))}"
+    gdf = gdf.copy()
+    gdf["geometry_4326"] = gpd.GeoSeries(graus, index=gdf.index, crs=WGS84)
+    gdf["geometry"] = gpd.GeoSeries(transformar(graus, WGS84, crs), index=gdf.index, crs=crs)
+    return gdf, crs
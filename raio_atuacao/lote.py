@@ -0,0 +1,211 @@
+"""Modo em lote, sem Streamlit: raios por especialista e atribuições por fazenda para um ou vários snapshots.
+
+Uso:
+    python -m raio_atuacao.lote --kml fazendas.kmz --excel analistas.xlsx --saida relatorios/
+    python -m raio_atuacao.lote --snapshots historico/ --saida relatorios/ --formato parquet --processos 8
+
+Com --snapshots, cada subdiretório (ex.: historico/2016-01/) deve ter um KML/KMZ e
+uma planilha .xlsx. Os snapshots são lidos em paralelo e o cálculo é particionado por
+GESTOR num pool de processos; cada snapshot gera especialistas.<formato> e
+fazendas.<formato> em <saida>/<snapshot>/, e <saida>/resumo.csv lista todos, com o
+erro dos que não puderam ser processados.
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from .analistas import colunas_faltando, preparar_analistas
+from .correspondencia import LIMIAR_PADRAO, alinhar_unidades
+from .distancia import haversine_m
+from .preparados import adicionar_centroides
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ("csv", "parquet")
+EXTENSOES_KML = (".kml", ".kmz")
+COLUNAS_FAZENDAS = ["GESTOR", "ESPECIALISTA", "CIDADE_BASE", "UNIDADE", "UNIDADE_normalized", "NOME_FAZ",
+                    "LAT_BASE", "LON_BASE", "Latitude_Unidade", "Longitude_Unidade", "DISTANCIA_KM"]
+COLUNAS_RESUMO = ["snapshot", "gestores", "especialistas", "fazendas", "fazendas_sem_especialista", "raio_maximo_km",
+                  "segundos_leitura", "erro"]
+
+
+def descobrir_snapshots(diretorio):
+    """{nome: (kml, xlsx)} para cada subdiretório com exatamente um KML/KMZ e uma planilha."""
+    snapshots = {}
+    for pasta in sorted(glob.glob(os.path.join(diretorio, "*", ""))):
+        nome = os.path.basename(os.path.normpath(pasta))
+        kmls = [c for c in sorted(os.listdir(pasta)) if c.lower().endswith(EXTENSOES_KML)]
+        planilhas = [c for c in sorted(os.listdir(pasta)) if c.lower().endswith(".xlsx")]
+        if len(kmls) != 1 or len(planilhas) != 1:
+            logger.warning(f"Snapshot {nome} ignorado: {len(kmls)} KML/KMZ e {len(planilhas)} planilhas.")
+            continue
+        snapshots[nome] = (os.path.join(pasta, kmls[0]), os.path.join(pasta, planilhas[0]))
+    return snapshots
+
+
+def carregar_snapshot(caminho_kml, caminho_excel, limiar=LIMIAR_PADRAO):
+    """Lê KML e planilha como o app e retorna (analistas, centróides das fazendas).
+
+    Os centróides vêm sem geometrias, pequenos o bastante para circular entre processos.
+    """
+    from .kml import ler_kml, reprojetar_utm
+
+    df_analistas = pd.read_excel(caminho_excel)
+    faltando = colunas_faltando(df_analistas)
+    if faltando:
+        raise ValueError(f"Colunas faltando no Excel {caminho_excel}: {faltando}")
+    df_analistas = preparar_analistas(df_analistas)
+    gdf_kml, _ = reprojetar_utm(ler_kml(caminho_kml))
+    if gdf_kml.empty:
+        raise ValueError(f"Nenhuma geometria válida em {caminho_kml}")
+    df_analistas, _, _ = alinhar_unidades(df_analistas, gdf_kml, limiar)
+    centroides = pd.DataFrame(adicionar_centroides(gdf_kml)[
+        ["UNIDADE_normalized", "NOME_FAZ", "Latitude_Unidade", "Longitude_Unidade"]
+    ])
+    return df_analistas, centroides
+
+
+def calcular_particao(df_analistas, centroides):
+    """Atribuições por fazenda e raios por especialista de uma partição (ex.: um GESTOR)."""
+    fazendas = df_analistas.merge(centroides, on="UNIDADE_normalized", how="inner")
+    fazendas["DISTANCIA_KM"] = haversine_m(
+        fazendas["LON_BASE"].to_numpy(dtype=float), fazendas["LAT_BASE"].to_numpy(dtype=float),
+        fazendas["Longitude_Unidade"].to_numpy(dtype=float), fazendas["Latitude_Unidade"].to_numpy(dtype=float),
+    ) / 1000
+    especialistas = fazendas.groupby(["GESTOR", "ESPECIALISTA", "CIDADE_BASE", "LAT_BASE", "LON_BASE"], dropna=False).agg(
+        FAZENDAS=("UNIDADE_normalized", "nunique"),
+        RAIO_MAXIMO_KM=("DISTANCIA_KM", "max"),
+        DIST_MEDIA_KM=("DISTANCIA_KM", "mean"),
+    ).reset_index()
+    return fazendas[COLUNAS_FAZENDAS], especialistas
+
+
+def _tarefa_snapshot(args):
+    """Lê um snapshot no pool; o erro volta como texto para não derrubar o lote inteiro."""
+    nome, caminho_kml, caminho_excel, limiar = args
+    inicio = time.perf_counter()
+    df_analistas, centroides, erro = None, None, None
+    try:
+        df_analistas, centroides = carregar_snapshot(caminho_kml, caminho_excel, limiar)
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+    return nome, df_analistas, centroides, time.perf_counter() - inicio, erro
+
+
+def _tarefa_particao(args):
+    nome, gestor, df_analistas, centroides = args
+    try:
+        return nome, gestor, *calcular_particao(df_analistas, centroides), None
+    except Exception as e:
+        return nome, gestor, None, None, f"{type(e).__name__}: {e}"
+
+
+def gravar(df, caminho_sem_extensao, formato):
+    """Grava `df` em CSV ou Parquet e retorna o caminho."""
+    caminho = f"{caminho_sem_extensao}.{formato}"
+    if formato == "parquet":
+        df.to_parquet(caminho, index=False)
+    else:
+        df.to_csv(caminho, index=False)
+    return caminho
+
+
+def processar(snapshots, saida, formato="csv", processos=None, limiar=LIMIAR_PADRAO):
+    """Processa {nome: (kml, xlsx)} e grava os relatórios; retorna o DataFrame do resumo.
+
+    A leitura dos snapshots e o cálculo por (snapshot, GESTOR) são distribuídos no
+    mesmo pool; só centróides e linhas da planilha trafegam entre processos. Um
+    snapshot com erro não gera relatórios e aparece no resumo com a coluna erro.
+    """
+    os.makedirs(saida, exist_ok=True)
+    resumo, erros = [], {}
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        carregados = {}
+        for nome, df_analistas, centroides, segundos, erro in pool.map(
+            _tarefa_snapshot, [(nome, kml, xlsx, limiar) for nome, (kml, xlsx) in snapshots.items()]
+        ):
+            if erro is not None:
+                erros[nome] = erro
+                logger.error(f"Snapshot {nome} ignorado: {erro}")
+                continue
+            carregados[nome] = (df_analistas, centroides, segundos)
+            logger.info(f"Snapshot {nome}: {len(df_analistas)} linhas, {len(centroides)} fazendas, {segundos:.2f} s.")
+
+        particoes = [
+            (nome, gestor, grupo, centroides[centroides["UNIDADE_normalized"].isin(grupo["UNIDADE_normalized"])])
+            for nome, (df_analistas, centroides, _) in carregados.items()
+            for gestor, grupo in df_analistas.groupby("GESTOR", dropna=False)
+        ]
+        resultados = {}
+        for nome, gestor, fazendas, especialistas, erro in pool.map(_tarefa_particao, particoes):
+            if erro is not None:
+                erros.setdefault(nome, f"GESTOR {gestor}: {erro}")
+                logger.error(f"Snapshot {nome} ignorado: GESTOR {gestor}: {erro}")
+                continue
+            resultados.setdefault(nome, []).append((fazendas, especialistas))
+
+    for nome in snapshots:
+        if nome in erros:
+            resumo.append({"snapshot": nome, "erro": erros[nome]})
+            continue
+        df_analistas, centroides, segundos = carregados[nome]
+        partes = resultados.get(nome, [])
+        fazendas = pd.concat([f for f, _ in partes], ignore_index=True) if partes else pd.DataFrame(columns=COLUNAS_FAZENDAS)
+        especialistas = pd.concat([e for _, e in partes], ignore_index=True) if partes else pd.DataFrame()
+        # Fazendas do KML sem especialista entram sem atribuição, para medir cobertura
+        descobertas = centroides[~centroides["UNIDADE_normalized"].isin(fazendas["UNIDADE_normalized"])]
+        fazendas = pd.concat([fazendas, descobertas], ignore_index=True)[COLUNAS_FAZENDAS]
+        pasta = os.path.join(saida, nome)
+        os.makedirs(pasta, exist_ok=True)
+        gravar(especialistas, os.path.join(pasta, "especialistas"), formato)
+        gravar(fazendas, os.path.join(pasta, "fazendas"), formato)
+        resumo.append({
+            "snapshot": nome, "gestores": df_analistas["GESTOR"].nunique(), "especialistas": len(especialistas),
+            "fazendas": len(centroides), "fazendas_sem_especialista": len(descobertas),
+            "raio_maximo_km": especialistas["RAIO_MAXIMO_KM"].max() if len(especialistas) else None,
+            "segundos_leitura": round(segundos, 3), "erro": None,
+        })
+    resumo = pd.DataFrame(resumo, columns=COLUNAS_RESUMO)
+    resumo.to_csv(os.path.join(saida, "resumo.csv"), index=False)
+    return resumo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relatórios de raio de atuação em lote, sem Streamlit.")
+    entrada = parser.add_mutually_exclusive_group(required=True)
+    entrada.add_argument("--snapshots", help="Diretório com um subdiretório (KML/KMZ + .xlsx) por snapshot")
+    entrada.add_argument("--kml", help="Arquivo KML/KMZ de um único snapshot (com --excel)")
+    parser.add_argument("--excel", help="Planilha de analistas do snapshot único")
+    parser.add_argument("--nome", default="snapshot", help="Nome do snapshot único na saída")
+    parser.add_argument("--saida", required=True, help="Diretório dos relatórios")
+    parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    parser.add_argument("--processos", type=int, default=None, help="Processos do pool (padrão: núcleos da máquina)")
+    parser.add_argument("--limiar", type=int, default=LIMIAR_PADRAO, help="Similaridade mínima UNIDADE ↔ NOME_FAZ")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.kml:
+        if not args.excel:
+            parser.error("--kml exige --excel")
+        snapshots = {args.nome: (args.kml, args.excel)}
+    else:
+        snapshots = descobrir_snapshots(args.snapshots)
+        if not snapshots:
+            parser.error(f"Nenhum snapshot encontrado em {args.snapshots}")
+
+    inicio = time.perf_counter()
+    resumo = processar(snapshots, args.saida, args.formato, args.processos, args.limiar)
+    falhas = int(resumo["erro"].notna().sum())
+    logger.info(f"{len(resumo) - falhas} snapshots processados e {falhas} com erro em {time.perf_counter() - inicio:.2f} s.")
+    print(resumo.to_string(index=False))
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
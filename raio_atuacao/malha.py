@@ -0,0 +1,426 @@
+"""Malha viária offline: grafo CSR de tempos de viagem, caminhos mínimos a partir das bases e isócronas.
+
+Uso:
+    python -m raio_atuacao.malha converter --linhas mato-grosso.osm.pbf --saida malha_mt/
+    python -m raio_atuacao.malha tempos --malha malha_mt/ --kml fazendas.kmz --excel analistas.xlsx --saida tempos.csv
+
+`converter` lê as vias (extrato OSM .osm.pbf/.osm pelo driver OSM do GDAL, ou qualquer
+arquivo de linhas com as colunas highway, oneway e maxspeed), junta os pontos de forma
+entre cruzamentos em arestas únicas, mantém o maior componente conexo e grava o grafo
+como arrays .npy, abertos depois com mmap.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from . import metricas
+from .distancia import haversine_m
+
+logger = logging.getLogger(__name__)
+
+# Velocidade por classe de via OSM (km/h); classes fora da tabela não entram na malha
+VELOCIDADES_KMH = {
+    "motorway": 100, "motorway_link": 60, "trunk": 90, "trunk_link": 50, "primary": 80, "primary_link": 50,
+    "secondary": 70, "secondary_link": 40, "tertiary": 60, "tertiary_link": 40, "unclassified": 40,
+    "residential": 30, "living_street": 15, "service": 20, "road": 40, "track": 25,
+}
+VELOCIDADE_PADRAO_KMH = 40
+# Trecho entre o ponto (base ou fazenda) e o nó mais próximo, percorrido fora da malha
+VELOCIDADE_ACESSO_KMH = 20
+# Casas decimais que identificam o mesmo vértice em vias diferentes (~0,1 m)
+CASAS_VERTICE = 6
+# Largura dos baldes da busca (delta-stepping), em segundos
+DELTA_S = 600.0
+# Origens buscadas juntas; cada uma ocupa uma coluna float32 por nó
+ORIGENS_POR_LOTE = 16
+# Velocidade mínima (km/h, em linha reta) da base até a fazenda mais distante; limita a busca das isócronas
+VELOCIDADE_MINIMA_ISOCRONA_KMH = 20
+# Célula (graus) que reduz os pontos alcançados antes do contorno da isócrona
+CELULA_ISOCRONA_GRAUS = 0.01
+# Pontos máximos por isócrona; acima disso a célula cresce
+MAX_PONTOS_ISOCRONA = 4000
+# Concavidade do contorno (0 = mais justo, 1 = envoltória convexa)
+RAZAO_CONCAVA = 0.1
+ARQUIVOS = ("indptr", "destinos", "tempos", "lon", "lat")
+
+
+def _expandir(indptr, nos):
+    """Índices das arestas que saem de `nos` e, para cada aresta, a posição do nó em `nos`."""
+    inicio = indptr[nos]
+    grau = indptr[nos + 1] - inicio
+    posicao = np.repeat(np.arange(nos.size), grau)
+    deslocamento = np.arange(posicao.size) - np.repeat(np.cumsum(grau) - grau, grau)
+    return inicio[posicao] + deslocamento, posicao
+
+
+def _componentes(n, origem, destino):
+    """Rótulo do componente conexo (não dirigido) de cada nó, por ganchos e saltos de ponteiro."""
+    rotulo = np.arange(n)
+    while True:
+        ru, rv = rotulo[origem], rotulo[destino]
+        diferentes = ru != rv
+        if not diferentes.any():
+            return rotulo
+        ru, rv = ru[diferentes], rv[diferentes]
+        np.minimum.at(rotulo, np.maximum(ru, rv), np.minimum(ru, rv))
+        while True:
+            proximo = rotulo[rotulo]
+            if np.array_equal(proximo, rotulo):
+                break
+            rotulo = proximo
+
+
+class GrafoViario:
+    """Grafo dirigido em CSR: as arestas de `no` são destinos[indptr[no]:indptr[no + 1]], com tempos em segundos."""
+
+    def __init__(self, indptr, destinos, tempos, lon, lat):
+        self.indptr = indptr
+        self.destinos = destinos
+        self.tempos = tempos
+        self.lon = lon
+        self.lat = lat
+        self._arvore = None
+
+    def __len__(self):
+        return len(self.lon)
+
+    @property
+    def n_arestas(self):
+        return len(self.destinos)
+
+    @classmethod
+    def de_linhas(cls, linhas):
+        """Monta o grafo a partir de vias em EPSG:4326 (colunas opcionais highway, oneway, maxspeed).
+
+        Só cruzamentos e pontas de via viram nós; os pontos de forma entre eles somam
+        comprimento em uma única aresta. oneway aceita yes/true/1 e -1 (sentido inverso).
+        """
+        linhas = linhas.to_crs("EPSG:4326") if linhas.crs is not None else linhas
+        velocidade = pd.Series(VELOCIDADE_PADRAO_KMH, index=linhas.index, dtype=np.float64)
+        if "highway" in linhas:
+            velocidade = linhas["highway"].map(VELOCIDADES_KMH).astype(np.float64).fillna(VELOCIDADE_PADRAO_KMH)
+        if "maxspeed" in linhas:
+            maxima = pd.to_numeric(linhas["maxspeed"].astype(str).str.extract(r"(\d+)")[0], errors="coerce")
+            velocidade = maxima.where(maxima > 0, velocidade)
+        sentido = np.zeros(len(linhas), dtype=np.int8)
+        if "oneway" in linhas:
+            valor = linhas["oneway"].astype(str).str.lower()
+            sentido = np.select([valor.isin(["yes", "true", "1"]), valor.eq("-1")], [1, -1], 0).astype(np.int8)
+
+        partes, de_qual = shapely.get_parts(linhas.geometry.to_numpy(), return_index=True)
+        coords, parte = shapely.get_coordinates(partes, return_index=True)
+        if coords.shape[0] < 2:
+            raise ValueError("Nenhuma via encontrada para montar a malha.")
+        escala = 10 ** CASAS_VERTICE
+        chave = (np.round((coords[:, 0] + 180) * escala).astype(np.int64) << 32) | np.round((coords[:, 1] + 90) * escala).astype(np.int64)
+        chaves, vertice = np.unique(chave, return_inverse=True)
+
+        # Nós: pontas de cada parte e vértices usados mais de uma vez (cruzamentos)
+        inicio_parte = np.r_[True, parte[1:] != parte[:-1]]
+        fim_parte = np.r_[parte[1:] != parte[:-1], True]
+        e_no = np.bincount(vertice, minlength=chaves.size) > 1
+        e_no[vertice[inicio_parte | fim_parte]] = True
+
+        segmento = np.flatnonzero(~fim_parte)
+        a, b = vertice[segmento], vertice[segmento + 1]
+        linha_segmento = de_qual[parte[segmento]]
+        comprimento = haversine_m(coords[segmento, 0], coords[segmento, 1], coords[segmento + 1, 0], coords[segmento + 1, 1])
+        tempo = comprimento / (velocidade.to_numpy()[linha_segmento] / 3.6)
+        # Cada trecho começa num segmento cujo vértice inicial é nó e vai até o próximo nó
+        trecho = np.cumsum(e_no[a]) - 1
+        ultimo = np.r_[trecho[1:] != trecho[:-1], True]
+        primeiro = np.r_[True, trecho[1:] != trecho[:-1]]
+        u, v = a[primeiro], b[ultimo]
+        peso = np.bincount(trecho, weights=tempo)
+        sentido_trecho = sentido[linha_segmento[primeiro]]
+
+        ida = sentido_trecho >= 0
+        volta = sentido_trecho <= 0
+        origem = np.concatenate([u[ida], v[volta]])
+        destino = np.concatenate([v[ida], u[volta]])
+        peso = np.concatenate([peso[ida], peso[volta]])
+        validas = origem != destino
+        origem, destino, peso = origem[validas], destino[validas], peso[validas]
+
+        # Maior componente conexo, com os nós em ordem de célula para acessos mais locais
+        nos = np.flatnonzero(e_no)
+        novo = np.full(chaves.size, -1, dtype=np.int64)
+        novo[nos] = np.arange(nos.size)
+        origem, destino = novo[origem], novo[destino]
+        rotulo = _componentes(nos.size, origem, destino)
+        maior = np.bincount(rotulo).argmax()
+        lon = (chaves[nos] >> 32) / escala - 180
+        lat = (chaves[nos] & 0xFFFFFFFF) / escala - 90
+        mantidos = np.flatnonzero(rotulo == maior)
+        mantidos = mantidos[np.lexsort((lon[mantidos], np.floor(lat[mantidos] / CELULA_ISOCRONA_GRAUS)))]
+        novo = np.full(nos.size, -1, dtype=np.int64)
+        novo[mantidos] = np.arange(mantidos.size)
+        origem, destino = novo[origem], novo[destino]
+        validas = origem >= 0
+        origem, destino, peso = origem[validas], destino[validas], peso[validas]
+
+        # Arestas paralelas: fica a mais rápida
+        ordem = np.lexsort((peso, destino, origem))
+        origem, destino, peso = origem[ordem], destino[ordem], peso[ordem]
+        unicas = np.r_[True, (origem[1:] != origem[:-1]) | (destino[1:] != destino[:-1])]
+        origem, destino, peso = origem[unicas], destino[unicas], peso[unicas]
+
+        indptr = np.zeros(mantidos.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(origem, minlength=mantidos.size), out=indptr[1:])
+        return cls(indptr, destino.astype(np.int32), peso.astype(np.float32), lon[mantidos], lat[mantidos])
+
+    def salvar(self, pasta):
+        """Grava os arrays como .npy em `pasta`."""
+        os.makedirs(pasta, exist_ok=True)
+        for nome in ARQUIVOS:
+            np.save(os.path.join(pasta, f"{nome}.npy"), getattr(self, nome))
+
+    @classmethod
+    def carregar(cls, pasta, mmap=True):
+        """Abre um grafo gravado por salvar; com `mmap` os arrays ficam no disco e só as páginas usadas vão à memória."""
+        return cls(*(np.load(os.path.join(pasta, f"{nome}.npy"), mmap_mode="r" if mmap else None) for nome in ARQUIVOS))
+
+    def mais_proximos(self, lon, lat):
+        """Nó mais próximo de cada ponto e a distância (m) até ele; -1 e NaN para coordenadas não finitas."""
+        if self._arvore is None:
+            self._arvore = shapely.STRtree(shapely.points(self.lon, self.lat))
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        validos = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+        ponto, no = self._arvore.query_nearest(shapely.points(lon[validos], lat[validos]), all_matches=False)
+        nos = np.full(lon.size, -1, dtype=np.int64)
+        nos[validos[ponto]] = no
+        distancia = np.full(lon.size, np.nan)
+        achados = np.flatnonzero(nos >= 0)
+        distancia[achados] = haversine_m(lon[achados], lat[achados], self.lon[nos[achados]], self.lat[nos[achados]])
+        return nos, distancia
+
+    def tempos_a_partir(self, origens, tempo_inicial=None, limite_s=None, delta_s=DELTA_S):
+        """Tempo mínimo (s) de cada origem até cada nó: array (nós, origens) em float32.
+
+        Todas as origens avançam juntas, uma coluna cada, em baldes de `delta_s`
+        segundos (delta-stepping): só os rótulos abaixo do limiar do balde são
+        expandidos, o que evita reexpandir nós longe da frente de busca. Nós além de
+        `limite_s` ou inalcançáveis ficam com inf. Levanta ValueError para origem fora
+        do grafo ou `tempo_inicial` não finito, que nunca sairiam da fila.
+        """
+        origens = np.asarray(origens, dtype=np.int64)
+        k = origens.size
+        if k and (origens.min() < 0 or origens.max() >= len(self)):
+            raise ValueError("Origem fora da malha viária.")
+        if tempo_inicial is not None and not np.isfinite(np.asarray(tempo_inicial, dtype=np.float64)).all():
+            raise ValueError("Tempo inicial não finito para a busca na malha viária.")
+        dist = np.full(len(self) * k, np.inf, dtype=np.float32)
+        chaves = origens * k + np.arange(k)
+        dist[chaves] = 0 if tempo_inicial is None else np.asarray(tempo_inicial, dtype=np.float32)
+        pendentes = np.unique(chaves)
+        # Marca os rótulos já na fila, para não reinseri-los sem ordenar a fila inteira
+        na_fila = np.zeros(dist.size, dtype=bool)
+        na_fila[pendentes] = True
+        limiar = float(dist[pendentes].min()) + delta_s if pendentes.size else 0.0
+        while pendentes.size:
+            rotulos = dist[pendentes]
+            abaixo = rotulos < limiar
+            if not abaixo.any():
+                limiar = float(rotulos.min()) + delta_s
+                continue
+            atual, pendentes = pendentes[abaixo], pendentes[~abaixo]
+            na_fila[atual] = False
+            no, coluna = np.divmod(atual, k)
+            arestas, posicao = _expandir(self.indptr, no)
+            candidato = dist[atual][posicao] + self.tempos[arestas]
+            alvo = self.destinos[arestas].astype(np.int64) * k + coluna[posicao]
+            if limite_s is not None:
+                dentro = candidato <= limite_s
+                candidato, alvo = candidato[dentro], alvo[dentro]
+            antes = dist[alvo]
+            melhora = candidato < antes
+            candidato, alvo = candidato[melhora], alvo[melhora]
+            np.minimum.at(dist, alvo, candidato)
+            novos = np.sort(alvo[~na_fila[alvo]])
+            novos = novos[np.r_[True, novos[1:] != novos[:-1]]] if novos.size else novos
+            na_fila[novos] = True
+            pendentes = np.concatenate([pendentes, novos])
+        return dist.reshape(len(self), k)
+
+    def contorno(self, dist, limite_s):
+        """Polígono da área com `dist` (uma coluna de tempos_a_partir) até `limite_s`, ou None.
+
+        Entram os nós alcançados e os pontos interpolados nas arestas que saem deles
+        e cruzam o limite; um ponto por célula (no mínimo CELULA_ISOCRONA_GRAUS, maior
+        em áreas grandes) alimenta o concave hull.
+        """
+        alcancados = np.flatnonzero(dist <= limite_s)
+        if alcancados.size == 0:
+            return None
+        arestas, posicao = _expandir(self.indptr, alcancados)
+        u = alcancados[posicao]
+        v = self.destinos[arestas]
+        parcial = dist[v] > limite_s
+        u, v = u[parcial], v[parcial]
+        fracao = np.clip((limite_s - dist[u]) / np.maximum(self.tempos[arestas][parcial], 1e-6), 0.0, 1.0)
+        lon = np.concatenate([self.lon[alcancados], self.lon[u] + fracao * (self.lon[v] - self.lon[u])])
+        lat = np.concatenate([self.lat[alcancados], self.lat[u] + fracao * (self.lat[v] - self.lat[u])])
+        celula = max(CELULA_ISOCRONA_GRAUS, np.sqrt(np.ptp(lon) * np.ptp(lat) / MAX_PONTOS_ISOCRONA))
+        coluna = np.floor(lon / celula).astype(np.int64)
+        linha = np.floor(lat / celula).astype(np.int64)
+        _, um_por_celula = np.unique((coluna - coluna.min()) << 32 | (linha - linha.min()), return_index=True)
+        contorno = shapely.concave_hull(shapely.multipoints(np.c_[lon[um_por_celula], lat[um_por_celula]]), ratio=RAZAO_CONCAVA)
+        if not isinstance(contorno, (shapely.Polygon, shapely.MultiPolygon)):
+            contorno = shapely.buffer(contorno, celula / 2)
+        return contorno
+
+
+def _acesso_s(distancia_m):
+    return distancia_m / (VELOCIDADE_ACESSO_KMH / 3.6)
+
+
+def _buscas(grafo, lon, lat, limites_s=None, origens_por_lote=ORIGENS_POR_LOTE):
+    """Gera (índices, tempos) por lote de origens, já com o acesso até o nó mais próximo.
+
+    `tempos` é tempos_a_partir para as origens (lon[índices], lat[índices]), limitado
+    pelo maior de `limites_s` no lote quando informado. Origens sem coordenadas
+    válidas ou com limite não finito ficam de fora; os índices são crescentes.
+    """
+    nos, distancia = grafo.mais_proximos(lon, lat)
+    validas = nos >= 0
+    if limites_s is not None:
+        limites_s = np.asarray(limites_s, dtype=np.float64)
+        validas &= np.isfinite(limites_s)
+    validas = np.flatnonzero(validas)
+    for inicio in range(0, validas.size, origens_por_lote):
+        lote = validas[inicio:inicio + origens_por_lote]
+        limite = None if limites_s is None else float(limites_s[lote].max())
+        yield lote, grafo.tempos_a_partir(nos[lote], _acesso_s(distancia[lote]), limite)
+
+
+def tempos_ate_fazendas(grafo, lon_base, lat_base, lon_faz, lat_faz, limite_s=None, origens_por_lote=ORIGENS_POR_LOTE):
+    """Tempo de direção (min) de cada base até a fazenda do mesmo índice, NaN se inalcançável.
+
+    Bases repetidas são buscadas uma só vez; o trecho até o nó mais próximo, nas duas
+    pontas, entra a VELOCIDADE_ACESSO_KMH. Base ou fazenda sem coordenadas dá NaN.
+    """
+    bases, qual_base = np.unique(np.c_[np.asarray(lon_base, dtype=np.float64), np.asarray(lat_base, dtype=np.float64)],
+                                 axis=0, return_inverse=True)
+    qual_base = qual_base.ravel()
+    no_faz, dist_faz = grafo.mais_proximos(lon_faz, lat_faz)
+    minutos = np.full(qual_base.size, np.nan)
+    limites = None if limite_s is None else np.full(len(bases), limite_s, dtype=np.float64)
+    with metricas.span("malha.tempos", bases=len(bases), linhas=qual_base.size):
+        for lote, dist in _buscas(grafo, bases[:, 0], bases[:, 1], limites, origens_por_lote):
+            linhas = np.flatnonzero(np.isin(qual_base, lote) & (no_faz >= 0))
+            segundos = dist[no_faz[linhas], np.searchsorted(lote, qual_base[linhas])] + _acesso_s(dist_faz[linhas])
+            minutos[linhas] = np.where(np.isfinite(segundos), segundos / 60, np.nan)
+    return minutos
+
+
+def isocronas(grafo, lon, lat, minutos, origens_por_lote=ORIGENS_POR_LOTE):
+    """Polígono (EPSG:4326) alcançável a partir de cada ponto em `minutos[i]` de direção (None se nada)."""
+    limites = np.asarray(minutos, dtype=np.float64) * 60
+    poligonos = [None] * limites.size
+    with metricas.span("malha.isocronas", linhas=limites.size):
+        for lote, dist in _buscas(grafo, lon, lat, limites, origens_por_lote):
+            for coluna, i in enumerate(lote):
+                if np.isfinite(limites[i]):
+                    poligonos[i] = grafo.contorno(dist[:, coluna], limites[i])
+    return poligonos
+
+
+def isocronas_especialistas(grafo, df_fazendas, origens_por_lote=ORIGENS_POR_LOTE):
+    """{ESPECIALISTA: (isócrona, minutos)} com o maior tempo de direção da base até as fazendas de cada um.
+
+    `df_fazendas` tem uma linha por especialista × fazenda, como base_mapa_analistas;
+    é o equivalente por estrada do raio máximo desenhado no mapa. Uma só busca por
+    especialista serve aos tempos e ao contorno; ela para no tempo da fazenda mais
+    distante em linha reta a VELOCIDADE_MINIMA_ISOCRONA_KMH (mais os acessos), e
+    fazendas que só seriam alcançadas depois disso ficam fora do tempo máximo. Especialistas sem base
+    e fazendas sem centróide ficam de fora.
+    """
+    especialistas = df_fazendas.drop_duplicates("ESPECIALISTA")
+    qual = pd.Index(especialistas["ESPECIALISTA"]).get_indexer(df_fazendas["ESPECIALISTA"])
+    no_faz, dist_faz = grafo.mais_proximos(df_fazendas["Longitude_Unidade"], df_fazendas["Latitude_Unidade"])
+    reta_m = haversine_m(
+        df_fazendas["LON_BASE"].to_numpy(dtype=np.float64), df_fazendas["LAT_BASE"].to_numpy(dtype=np.float64),
+        df_fazendas["Longitude_Unidade"].to_numpy(dtype=np.float64), df_fazendas["Latitude_Unidade"].to_numpy(dtype=np.float64),
+    )
+    # Trechos de acesso nas duas pontas entram à parte, como no tempo calculado
+    limites = pd.Series(reta_m / (VELOCIDADE_MINIMA_ISOCRONA_KMH / 3.6) + _acesso_s(dist_faz)).groupby(qual).max()
+    _, dist_base = grafo.mais_proximos(especialistas["LON_BASE"], especialistas["LAT_BASE"])
+    limites = limites.reindex(range(len(especialistas))).to_numpy() + _acesso_s(dist_base)
+    resultado = {}
+    with metricas.span("malha.isocronas", bases=len(especialistas), linhas=len(df_fazendas)):
+        for lote, dist in _buscas(grafo, especialistas["LON_BASE"], especialistas["LAT_BASE"], limites, origens_por_lote):
+            for coluna, i in enumerate(lote):
+                linhas = np.flatnonzero((qual == i) & (no_faz >= 0))
+                segundos = dist[no_faz[linhas], coluna] + _acesso_s(dist_faz[linhas])
+                segundos = segundos[np.isfinite(segundos)]
+                if segundos.size == 0:
+                    continue
+                poligono = grafo.contorno(dist[:, coluna], segundos.max())
+                if poligono is not None:
+                    resultado[especialistas["ESPECIALISTA"].iloc[i]] = (poligono, float(segundos.max()) / 60)
+    return resultado
+
+
+def ler_linhas(caminho):
+    """Vias de um extrato OSM (.osm.pbf/.osm, camada lines) ou de um arquivo de linhas qualquer."""
+    import geopandas as gpd
+
+    if caminho.lower().endswith((".pbf", ".osm")):
+        linhas = gpd.read_file(caminho, layer="lines")
+        linhas = linhas[linhas["highway"].isin(list(VELOCIDADES_KMH))]
+        etiquetas = linhas["other_tags"].fillna("")
+        linhas = linhas.assign(
+            oneway=etiquetas.str.extract(r'"oneway"=>"([^"]*)"')[0],
+            maxspeed=etiquetas.str.extract(r'"maxspeed"=>"([^"]*)"')[0],
+        )
+        return linhas[["highway", "oneway", "maxspeed", "geometry"]]
+    linhas = gpd.read_file(caminho)
+    if "highway" in linhas:
+        linhas = linhas[linhas["highway"].isin(list(VELOCIDADES_KMH))]
+    return linhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Malha viária offline: conversão e tempos de direção.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    converter = comandos.add_parser("converter", help="Converte vias (OSM .pbf, GeoJSON, shapefile) no grafo .npy")
+    converter.add_argument("--linhas", required=True)
+    converter.add_argument("--saida", required=True, help="Diretório do grafo")
+    tempos = comandos.add_parser("tempos", help="Tempo de direção de cada especialista até suas fazendas")
+    tempos.add_argument("--malha", required=True, help="Diretório gerado por converter")
+    tempos.add_argument("--kml", required=True)
+    tempos.add_argument("--excel", required=True)
+    tempos.add_argument("--saida", required=True, help="Arquivo .csv")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    inicio = time.perf_counter()
+    if args.comando == "converter":
+        grafo = GrafoViario.de_linhas(ler_linhas(args.linhas))
+        grafo.salvar(args.saida)
+        print(f"{len(grafo)} nós e {grafo.n_arestas} arestas gravados em {os.path.abspath(args.saida)} "
+              f"({time.perf_counter() - inicio:.1f} s)")
+        return 0
+
+    from .lote import carregar_snapshot
+
+    df_analistas, centroides = carregar_snapshot(args.kml, args.excel)
+    fazendas = df_analistas.merge(centroides, on="UNIDADE_normalized", how="inner")
+    fazendas["TEMPO_MIN"] = tempos_ate_fazendas(
+        GrafoViario.carregar(args.malha), fazendas["LON_BASE"], fazendas["LAT_BASE"],
+        fazendas["Longitude_Unidade"], fazendas["Latitude_Unidade"],
+    )
+    fazendas[["GESTOR", "ESPECIALISTA", "CIDADE_BASE", "UNIDADE", "NOME_FAZ", "TEMPO_MIN"]].to_csv(args.saida, index=False)
+    print(f"{len(fazendas)} tempos gravados em {os.path.abspath(args.saida)} ({time.perf_counter() - inicio:.1f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
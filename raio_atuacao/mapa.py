@@ -0,0 +1,450 @@
+"""Construção de camadas folium para o Mapa de Analistas."""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import shapely
+import folium
+from branca.element import MacroElement
+from folium.plugins import FastMarkerCluster, MarkerCluster
+from jinja2 import Template
+from shapely.geometry import MultiPolygon, Polygon
+
+from . import metricas
+from .distancia import haversine_m
+from .preparados import adicionar_centroides
+from .projecao import WGS84, transformar
+from .texto import normalizar_serie
+
+# Cores dos especialistas, atribuídas em ciclo
+CORES = ["#E6194B", "#3CB44B", "#FFE119", "#4363D8", "#F58231", "#911EB4", "#46F0F0", "#F032E6"]
+
+# Acima deste número de fazendas o app sugere o modo leve
+LIMITE_MODO_LEVE = 1000
+
+# (zoom mínimo, zoom máximo exclusivo, tolerância de simplificação em metros)
+NIVEIS_SIMPLIFICACAO = [(0, 10, 250.0), (10, 30, 15.0)]
+
+# Mapas renderizados mantidos em memória: limite de entradas e de bytes de HTML somados
+MAX_MAPAS = 32
+MAX_BYTES_MAPAS = 256 * 1024 * 1024
+
+# ~1 m de precisão em graus, suficiente para desenhar limites de fazendas
+CASAS_DECIMAIS = 5
+
+# Cores do mapa de densidade, por quantil de fazendas no hexágono (do menor para o maior)
+CORES_DENSIDADE = ["#FFFFB2", "#FED976", "#FEB24C", "#FD8D3C", "#F03B20", "#BD0026"]
+
+CALLBACK_MARCADOR = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+        {radius: 6, color: row[5], weight: 2, fillColor: row[5], fillOpacity: 0.8});
+    marker.bindPopup("<b>Fazenda:</b> " + row[2] + "<br><b>Especialista:</b> " + row[3]
+        + "<br><b>Distância:</b> " + row[4] + " km", {maxWidth: 300});
+    return marker;
+}
+"""
+
+
+class CamadasPorZoom(MacroElement):
+    """Mantém no grupo apenas a camada cuja faixa de zoom contém o zoom atual do mapa."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var faixas = [{% for camada, zmin, zmax in this.faixas %}[{{ camada.get_name() }}, {{ zmin }}, {{ zmax }}],{% endfor %}];
+            function atualizar() {
+                var z = {{ this._parent.get_name() }}.getZoom();
+                faixas.forEach(function (f) {
+                    var visivel = z >= f[1] && z < f[2];
+                    if (visivel && !{{ this.grupo.get_name() }}.hasLayer(f[0])) { {{ this.grupo.get_name() }}.addLayer(f[0]); }
+                    if (!visivel && {{ this.grupo.get_name() }}.hasLayer(f[0])) { {{ this.grupo.get_name() }}.removeLayer(f[0]); }
+                });
+            }
+            {{ this._parent.get_name() }}.on("zoomend", atualizar);
+            atualizar();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, grupo, faixas):
+        super().__init__()
+        self._name = "CamadasPorZoom"
+        self.grupo = grupo
+        self.faixas = faixas
+
+
+def simplificar_por_zoom(geometrias, crs, niveis=NIVEIS_SIMPLIFICACAO):
+    """Versões simplificadas (preservando topologia) das geometrias, em EPSG:4326, por faixa de zoom.
+
+    A simplificação é feita no CRS projetado (tolerância em metros) e as
+    coordenadas finais são arredondadas para reduzir o tamanho do GeoJSON.
+    """
+    geometrias = np.asarray(geometrias, dtype=object)
+    resultado = []
+    for zmin, zmax, tolerancia in niveis:
+        simplificadas = shapely.simplify(geometrias, tolerancia, preserve_topology=True)
+        em_graus = transformar(simplificadas, crs, WGS84)
+        resultado.append((zmin, zmax, shapely.transform(em_graus, lambda c: np.round(c, CASAS_DECIMAIS))))
+    return resultado
+
+
+def colecao_geojson(geometrias, propriedades):
+    """FeatureCollection (dict) a partir de geometrias shapely e uma lista de dicionários de propriedades.
+
+    As geometrias são serializadas em lote pelo shapely, evitando o
+    __geo_interface__ feição a feição do GeoPandas.
+    """
+    geometrias_json = json.loads("[" + ",".join(shapely.to_geojson(geometrias).tolist()) + "]")
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "id": str(i), "properties": props, "geometry": geometria}
+            for i, (props, geometria) in enumerate(zip(propriedades, geometrias_json))
+        ],
+    }
+
+
+def adicionar_fazendas_leve(mapa, df_fazendas, crs, niveis=NIVEIS_SIMPLIFICACAO):
+    """Adiciona fazendas como uma camada GeoJSON por nível de zoom e marcadores com cluster no cliente.
+
+    `df_fazendas` precisa das colunas geometry (no CRS `crs`), NOME_FAZ, ESPECIALISTA,
+    COR, DISTANCIA_KM, Latitude_Unidade e Longitude_Unidade. Popups e estilos vêm das
+    propriedades das features, sem HTML por objeto.
+    """
+    propriedades = pd.DataFrame({
+        "Fazenda": df_fazendas["NOME_FAZ"].astype(str).str.title().to_numpy(),
+        "Especialista": df_fazendas["ESPECIALISTA"].astype(str).str.title().to_numpy(),
+        "Distância (km)": df_fazendas["DISTANCIA_KM"].round(1).to_numpy(),
+        "COR": df_fazendas["COR"].to_numpy(),
+    })
+    registros = json.loads(propriedades.to_json(orient="records", force_ascii=False))
+    grupo = folium.FeatureGroup(name="Fazendas").add_to(mapa)
+    faixas = []
+    for zmin, zmax, geometrias in simplificar_por_zoom(df_fazendas["geometry"].to_numpy(), crs, niveis):
+        camada = folium.GeoJson(
+            colecao_geojson(geometrias, registros),
+            style_function=lambda f: {"color": f["properties"]["COR"], "weight": 1.5, "fillOpacity": 0.3},
+            popup=folium.GeoJsonPopup(fields=["Fazenda", "Especialista", "Distância (km)"]),
+            control=False,
+        ).add_to(grupo)
+        faixas.append((camada, zmin, zmax))
+    mapa.add_child(CamadasPorZoom(grupo, faixas))
+
+    dados = list(zip(
+        df_fazendas["Latitude_Unidade"].round(CASAS_DECIMAIS).tolist(),
+        df_fazendas["Longitude_Unidade"].round(CASAS_DECIMAIS).tolist(),
+        propriedades["Fazenda"].tolist(), propriedades["Especialista"].tolist(),
+        propriedades["Distância (km)"].tolist(), propriedades["COR"].tolist(),
+    ))
+    FastMarkerCluster(dados, callback=CALLBACK_MARCADOR, name="Marcadores de Fazendas").add_to(mapa)
+    return grupo
+
+
+def renderizar_mapa(mapa):
+    """HTML completo do mapa e os segundos gastos para gerá-lo."""
+    inicio = time.perf_counter()
+    html = mapa.get_root().render()
+    return html, time.perf_counter() - inicio
+
+
+def medir_mapa(mapa):
+    """Renderiza o HTML do mapa e retorna (tamanho em bytes, segundos de renderização)."""
+    html, segundos = renderizar_mapa(mapa)
+    return len(html.encode("utf-8")), segundos
+
+
+def chave_mapa(versao, gestor, especialista, rotas, modo_leve, raios_propostos=None, malha=None):
+    """Chave de CacheMapas para um estado de filtros; os raios propostos entram por hash e a malha das isócronas pelo caminho."""
+    propostos = None
+    if raios_propostos is not None:
+        propostos = hashlib.sha1(pd.Series(raios_propostos).round(3).to_json().encode("utf-8")).hexdigest()
+    return (versao, gestor, especialista, bool(rotas), bool(modo_leve), propostos, malha)
+
+
+class CacheMapas:
+    """Mapas renderizados em memória, com despejo LRU por número de entradas e por bytes de HTML."""
+
+    def __init__(self, max_entradas=MAX_MAPAS, max_bytes=MAX_BYTES_MAPAS):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def obter(self, chave):
+        """Entrada gravada para `chave` (marcada como a mais recente) ou None."""
+        with self._lock:
+            entrada = self._itens.get(chave)
+            if entrada is not None:
+                self._itens.move_to_end(chave)
+        metricas.registrar_cache("mapas", acertos=int(entrada is not None), falhas=int(entrada is None))
+        return entrada
+
+    def gravar(self, chave, html, **info):
+        """Grava o HTML de `chave` com os dados em `info` e retorna a entrada.
+
+        Um mapa maior que max_bytes é devolvido sem ficar em cache.
+        """
+        entrada = {"html": html, "bytes": len(html.encode("utf-8")), **info}
+        if entrada["bytes"] > self.max_bytes:
+            return entrada
+        with self._lock:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self.bytes -= anterior["bytes"]
+            self._itens[chave] = entrada
+            self.bytes += entrada["bytes"]
+            while len(self._itens) > self.max_entradas or self.bytes > self.max_bytes:
+                _, despejada = self._itens.popitem(last=False)
+                self.bytes -= despejada["bytes"]
+        return entrada
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self.bytes = 0
+
+
+def base_mapa_analistas(df_analistas, gdf_kml):
+    """Analistas × fazendas com DISTANCIA_KM e COR por especialista, sem filtros.
+
+    Não depende de gestor, especialista nem rotas, então pode ser calculada uma vez
+    por versão do dataset e reaproveitada por construir_mapa_analistas. Levanta
+    ValueError sem dados ou sem correspondência.
+    """
+    if gdf_kml.empty or df_analistas.empty:
+        raise ValueError("Dados de fazendas ou analistas vazios.")
+
+    df_analistas = df_analistas.copy()
+    if "UNIDADE_normalized" not in df_analistas:
+        df_analistas["UNIDADE_normalized"] = normalizar_serie(df_analistas["UNIDADE"]).to_numpy()
+    # Dados preparados já trazem centróides em graus e geometrias em EPSG:4326
+    if "ZONA_UTM" not in gdf_kml:
+        gdf_kml = adicionar_centroides(gdf_kml)
+
+    with metricas.span("mapa.merge") as registro:
+        df_merged = pd.merge(
+            df_analistas,
+            gdf_kml[["UNIDADE_normalized", "Latitude_Unidade", "Longitude_Unidade", "geometry", "geometry_4326", "NOME_FAZ"]],
+            on="UNIDADE_normalized",
+            how="inner"
+        )
+        registro["linhas"] = len(df_merged)
+    if df_merged.empty:
+        raise ValueError("Nenhuma correspondência entre analistas e fazendas.")
+
+    if "DISTANCIA_KM" not in df_merged:
+        df_merged["DISTANCIA_KM"] = haversine_m(
+            df_merged["LON_BASE"].to_numpy(), df_merged["LAT_BASE"].to_numpy(),
+            df_merged["Longitude_Unidade"].to_numpy(), df_merged["Latitude_Unidade"].to_numpy()
+        ) / 1000
+
+    cor_especialista = {esp: CORES[i % len(CORES)] for i, esp in enumerate(df_merged["ESPECIALISTA"].unique())}
+    df_merged["COR"] = df_merged["ESPECIALISTA"].map(cor_especialista)
+    return df_merged
+
+
+def filtrar_base(base, gestor, especialista):
+    """Linhas de base_mapa_analistas do gestor e do especialista ("Todos" não filtra)."""
+    base = base[base["GESTOR"].eq(gestor) if gestor != "Todos" else slice(None)]
+    return base[base["ESPECIALISTA"].eq(especialista) if especialista != "Todos" else slice(None)]
+
+
+def construir_mapa_analistas(df_analistas, gdf_kml, gestor, especialista, buscar_rotas=None, modo_leve=False, raios_propostos=None,
+                             base=None, isocronas=None):
+    """Cria mapa interativo com analistas e fazendas, filtrado por gestor e especialista ("Todos" = sem filtro).
+
+    No modo leve as fazendas vão em uma única camada GeoJSON simplificada por zoom,
+    com marcadores agrupados no cliente, em vez de um polígono e um marcador por linha.
+    `raios_propostos` (ESPECIALISTA → km) desenha o raio da atribuição otimizada,
+    tracejado, ao lado do raio atual. `buscar_rotas` recebe a lista de (lon, lat,
+    lon, lat) base → fazenda e devolve as rotas (ex.: ClienteRotas.rotas_em_lote).
+    `isocronas` (ESPECIALISTA → (polígono, minutos), de malha.isocronas_especialistas)
+    desenha a área alcançável por estrada no tempo máximo de cada especialista.
+    `base` é o resultado de base_mapa_analistas para os mesmos dados, quando já
+    calculado. Levanta ValueError sem dados ou sem correspondência e retorna None
+    quando os filtros não deixam nenhuma linha.
+    """
+    df_merged = base if base is not None else base_mapa_analistas(df_analistas, gdf_kml)
+    cor_especialista = dict(zip(df_merged["ESPECIALISTA"], df_merged["COR"]))
+
+    df_filtrado = filtrar_base(df_merged, gestor, especialista)
+
+    if df_filtrado.empty:
+        return None
+
+    mapa = folium.Map(location=[df_filtrado["Latitude_Unidade"].mean(), df_filtrado["Longitude_Unidade"].mean()], zoom_start=7, tiles="openstreetmap")
+    colaboradores_cluster = MarkerCluster(name="Colaboradores").add_to(mapa)
+    rotas_group = folium.FeatureGroup(name="Rotas").add_to(mapa)
+    propostos_group = folium.FeatureGroup(name="Raio Proposto").add_to(mapa) if raios_propostos is not None else None
+    isocronas_group = folium.FeatureGroup(name="Isócronas").add_to(mapa) if isocronas is not None else None
+
+    popup_css = """
+    <style>
+        .leaflet-popup-content { font-family: Arial, sans-serif; font-size: 14px; padding: 10px; }
+        .leaflet-popup-content b { color: #00497a; }
+    </style>
+    """
+    mapa.get_root().html.add_child(folium.Element(popup_css))
+
+    for _, row in df_filtrado.groupby(["ESPECIALISTA", "CIDADE_BASE", "LAT_BASE", "LON_BASE", "COR"]).agg(
+        RAIO_MAXIMO_KM=("DISTANCIA_KM", "max"),
+        DIST_MEDIA_KM=("DISTANCIA_KM", "mean"),
+        UNIDADES=("UNIDADE", "unique")
+    ).reset_index().iterrows():
+        raio_proposto = raios_propostos.get(row["ESPECIALISTA"]) if raios_propostos is not None else None
+        isocrona, tempo_maximo = isocronas.get(row["ESPECIALISTA"], (None, None)) if isocronas is not None else (None, None)
+        popup_html = (
+            f"<b>Especialista:</b> {row['ESPECIALISTA'].title()}<br>"
+            f"<b>Cidade Base:</b> {row['CIDADE_BASE'].title()}<br>"
+            f"<b>Raio Máximo:</b> {row['RAIO_MAXIMO_KM']:.1f} km<br>"
+            + (f"<b>Raio Proposto:</b> {raio_proposto:.1f} km<br>" if pd.notna(raio_proposto) else "")
+            + (f"<b>Tempo Máximo:</b> {tempo_maximo:.0f} min<br>" if pd.notna(tempo_maximo) else "")
+            + f"<b>Distância Média:</b> {row['DIST_MEDIA_KM']:.1f} km<br>"
+            f"<b>Unidades:</b> {', '.join(row['UNIDADES'][:5]) + ('...' if len(row['UNIDADES']) > 5 else '')}"
+        )
+        folium.Circle(
+            location=[row["LAT_BASE"], row["LON_BASE"]],
+            radius=row["RAIO_MAXIMO_KM"] * 1000,
+            color=row["COR"],
+            fill=True,
+            fill_opacity=0.15
+        ).add_to(mapa)
+        if pd.notna(raio_proposto):
+            folium.Circle(
+                location=[row["LAT_BASE"], row["LON_BASE"]],
+                radius=raio_proposto * 1000,
+                color=row["COR"],
+                weight=2,
+                dash_array="8 6",
+                fill=False
+            ).add_to(propostos_group)
+        if isocrona is not None:
+            folium.GeoJson(
+                shapely.set_precision(isocrona, 10 ** -CASAS_DECIMAIS).__geo_interface__,
+                style_function=lambda _, cor=row["COR"]: {"color": cor, "weight": 2, "fillColor": cor, "fillOpacity": 0.1},
+                tooltip=f"{row['ESPECIALISTA'].title()}: {tempo_maximo:.0f} min de estrada"
+            ).add_to(isocronas_group)
+        folium.Marker(
+            location=[row["LAT_BASE"], row["LON_BASE"]],
+            popup=folium.Popup(popup_html, max_width=300),
+            icon=folium.Icon(color="white", icon_color=row["COR"], icon="user", prefix="fa")
+        ).add_to(colaboradores_cluster)
+
+    rotas = [None] * len(df_filtrado)
+    if buscar_rotas is not None:
+        with metricas.span("mapa.rotas", linhas=len(df_filtrado)):
+            rotas = buscar_rotas(list(zip(
+                df_filtrado["LON_BASE"], df_filtrado["LAT_BASE"], df_filtrado["Longitude_Unidade"], df_filtrado["Latitude_Unidade"]
+            )))
+
+    if modo_leve:
+        adicionar_fazendas_leve(mapa, df_filtrado, gdf_kml.crs)
+        for (_, row), route in zip(df_filtrado.iterrows(), rotas):
+            if route:
+                folium.PolyLine(route, color=row["COR"], weight=2.5).add_to(rotas_group)
+    else:
+        fazendas_group = folium.FeatureGroup(name="Fazendas").add_to(mapa)
+        geometrias_4326 = df_filtrado["geometry_4326"]
+
+    for (_, row), route, geometria in zip(df_filtrado.iterrows(), rotas, [] if modo_leve else geometrias_4326):
+        if isinstance(geometria, (Polygon, MultiPolygon)):
+            coords = [list(geometria.exterior.coords)] if isinstance(geometria, Polygon) else [list(poly.exterior.coords) for poly in geometria.geoms]
+            for coord in coords:
+                folium.Polygon(
+                    locations=[(lat, lon) for lon, lat in coord],
+                    color=row["COR"],
+                    fill=True,
+                    fill_opacity=0.3,
+                    popup=f"<b>Fazenda:</b> {row['NOME_FAZ'].title()}<br><b>Atendida por:</b> {row['ESPECIALISTA'].title()}"
+                ).add_to(fazendas_group)
+
+        popup_html = (
+            f"<b>Fazenda:</b> {row['NOME_FAZ'].title()}<br>"
+            f"<b>Cidade:</b> {row['CIDADE_BASE'].title()}<br>"
+            f"<b>Especialista:</b> {row['ESPECIALISTA'].title()}<br>"
+            f"<b>Distância:</b> {row['DISTANCIA_KM']:.1f} km"
+        )
+        folium.Marker(
+            location=[row["Latitude_Unidade"], row["Longitude_Unidade"]],
+            popup=folium.Popup(popup_html, max_width=300),
+            icon=folium.Icon(color="white", icon_color=row["COR"], icon="home", prefix="fa")
+        ).add_to(fazendas_group)
+
+        if route:
+            folium.PolyLine(route, color=row["COR"], weight=2.5).add_to(rotas_group)
+
+    legenda_html = '<div style="position: fixed; bottom: 10px; left: 10px; background: white; padding: 10px; border-radius: 8px;">' \
+                   '<b>Legenda</b><br>' + \
+                   ''.join(f'<i class="fa fa-circle" style="color:{cor}"></i> {esp.title()}<br>' for esp, cor in cor_especialista.items() if esp in df_filtrado["ESPECIALISTA"].unique()) + \
+                   '</div>'
+    mapa.get_root().html.add_child(folium.Element(legenda_html))
+    folium.LayerControl().add_to(mapa)
+    return mapa
+
+
+def adicionar_hexagonos(mapa, camadas):
+    """Adiciona uma camada GeoJSON de hexágonos por resolução, visível na sua faixa de zoom.
+
+    `camadas` vem de GradeHexagonal.camadas. A cor é o quantil de fazendas do hexágono
+    dentro da própria resolução; o tooltip mostra os agregados.
+    """
+    grupo = folium.FeatureGroup(name="Densidade").add_to(mapa)
+    faixas = []
+    for _, zmin, zmax, nivel in camadas:
+        limites = np.unique(np.quantile(nivel["FAZENDAS"], np.linspace(0, 1, len(CORES_DENSIDADE) + 1)[1:-1]))
+        propriedades = pd.DataFrame({
+            "Fazendas": nivel["FAZENDAS"].to_numpy(),
+            "Área (ha)": nivel["AREA_HA"].round(0).to_numpy(),
+            "Distância média (km)": nivel["DIST_MEDIA_KM"].round(1).to_numpy(),
+            "Distância máxima (km)": nivel["DIST_MAX_KM"].round(1).to_numpy(),
+            "Especialistas": nivel["ESPECIALISTAS"].to_numpy(),
+            "Fazendas por especialista": nivel["FAZENDAS_POR_ESPECIALISTA"].round(1).to_numpy(),
+            "COR": np.asarray(CORES_DENSIDADE)[np.searchsorted(limites, nivel["FAZENDAS"].to_numpy(), side="right")],
+        })
+        geometrias = shapely.transform(nivel["geometry"].to_numpy(), lambda c: np.round(c, CASAS_DECIMAIS))
+        camada = folium.GeoJson(
+            colecao_geojson(geometrias, json.loads(propriedades.to_json(orient="records", force_ascii=False))),
+            style_function=lambda f: {"color": "#555555", "weight": 0.5, "fillColor": f["properties"]["COR"], "fillOpacity": 0.6},
+            tooltip=folium.GeoJsonTooltip(fields=[c for c in propriedades.columns if c != "COR"]),
+            control=False,
+        ).add_to(grupo)
+        faixas.append((camada, zmin, zmax))
+    mapa.add_child(CamadasPorZoom(grupo, faixas))
+    return grupo
+
+
+def construir_mapa_densidade(grade, recorte=None):
+    """Mapa de densidade das fazendas em hexágonos (GradeHexagonal), ou None sem hexágonos.
+
+    Sem `recorte` mostra o país todo, da resolução mais grossa às que cabem no limite
+    de hexágonos. Com `recorte` = (resolução, hexágono) mostra só as resoluções mais
+    finas dentro desse hexágono, com as bases dos especialistas dele como pontos (no
+    país todo elas aparecem só na contagem de cada hexágono, para o HTML não crescer).
+    """
+    agregados = grade.agregados if recorte is None else grade.recorte(*recorte)
+    camadas = grade.camadas(agregados)
+    if not camadas:
+        return None
+    minx, miny, maxx, maxy = shapely.total_bounds(camadas[0][3]["geometry"].to_numpy())
+    mapa = folium.Map(tiles="openstreetmap")
+    mapa.fit_bounds([[miny, minx], [maxy, maxx]])
+    adicionar_hexagonos(mapa, camadas)
+
+    if recorte is not None:
+        bases = folium.FeatureGroup(name="Bases dos especialistas").add_to(mapa)
+        for row in grade.especialistas[grade.especialistas[recorte[0]] == recorte[1]].itertuples():
+            folium.CircleMarker(
+                [row.LAT_BASE, row.LON_BASE], radius=4, color="#00497A", fill=True, fill_opacity=0.9,
+                tooltip=f"{str(row.ESPECIALISTA).title()}: {row.FAZENDAS} fazendas",
+            ).add_to(bases)
+    folium.LayerControl().add_to(mapa)
+    return mapa
@@ -0,0 +1,158 @@
+"""Instrumentação: spans de tempo por etapa, contadores de acerto/falha de cache e log JSON.
+
+Cada span registra nome, duração, linhas e bytes e sai como uma linha JSON no
+logger `raio_atuacao.metricas`. Com RAIO_METRICAS_LOG definido, essas linhas vão
+também para o arquivo indicado, uma por evento, prontas para um coletor de métricas.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Spans mantidos em memória para o painel Desempenho
+MAX_SPANS = 500
+
+_lock = threading.Lock()
+_spans = deque(maxlen=MAX_SPANS)
+_caches = {}
+# Execução (rerun) corrente e pilha de spans abertos, por thread
+_local = threading.local()
+
+
+def _emitir(evento):
+    logger.info(json.dumps(evento, ensure_ascii=False, default=str))
+
+
+def configurar_log_json(caminho=None):
+    """Grava os eventos, só o JSON, em `caminho` (padrão: RAIO_METRICAS_LOG). Retorna o handler ou None."""
+    caminho = caminho or os.environ.get("RAIO_METRICAS_LOG")
+    if not caminho:
+        return None
+    for handler in logger.handlers:
+        if getattr(handler, "baseFilename", None) == os.path.abspath(caminho):
+            return handler
+    handler = logging.FileHandler(caminho, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return handler
+
+
+def iniciar_execucao():
+    """Marca o início de um rerun nesta thread; spans seguintes ficam associados a ele."""
+    _local.execucao = f"{time.time():.6f}-{threading.get_ident()}"
+    return _local.execucao
+
+
+def execucao_atual():
+    """Identificador do rerun corrente nesta thread, ou None."""
+    return getattr(_local, "execucao", None)
+
+
+@contextmanager
+def span(nome, **atributos):
+    """Mede o bloco como uma etapa nomeada.
+
+    Produz um dicionário de atributos em que o bloco pode registrar `linhas`,
+    `bytes` ou qualquer outro valor conhecido só ao final. Spans aninhados levam o
+    nome do pai em `pai`.
+    """
+    pilha = getattr(_local, "pilha", None)
+    if pilha is None:
+        pilha = _local.pilha = []
+    registro = dict(atributos)
+    pai = pilha[-1] if pilha else None
+    pilha.append(nome)
+    inicio_epoch = time.time()
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield registro
+    except Exception as e:
+        erro = repr(e)
+        raise
+    finally:
+        pilha.pop()
+        evento = {
+            "evento": "span", "nome": nome, "segundos": round(time.perf_counter() - inicio, 6),
+            "inicio": inicio_epoch, "execucao": execucao_atual(), "pai": pai, **registro,
+        }
+        if erro:
+            evento["erro"] = erro
+        with _lock:
+            _spans.append(evento)
+        _emitir(evento)
+
+
+def registrar_cache(nome, acertos=0, falhas=0):
+    """Soma acertos e falhas ao contador do cache `nome`."""
+    with _lock:
+        contador = _caches.setdefault(nome, {"acertos": 0, "falhas": 0})
+        contador["acertos"] += acertos
+        contador["falhas"] += falhas
+    _emitir({"evento": "cache", "nome": nome, "acertos": acertos, "falhas": falhas, "execucao": execucao_atual()})
+
+
+def instrumentar_cache(decorador_cache, nome=None):
+    """Aplica `decorador_cache` (ex.: st.cache_data) contando acertos e falhas e medindo cada chamada.
+
+    O corpo da função só roda quando o cache falha; a chamada externa sabe se ele
+    rodou por uma marca por thread, o que funciona com qualquer decorador de memoização.
+    """
+    def aplicar(funcao):
+        rotulo = nome or funcao.__name__
+
+        @functools.wraps(funcao)
+        def corpo(*args, **kwargs):
+            _local.falhou = True
+            return funcao(*args, **kwargs)
+
+        cacheada = decorador_cache(corpo)
+
+        @functools.wraps(funcao)
+        def chamada(*args, **kwargs):
+            anterior = getattr(_local, "falhou", False)
+            _local.falhou = False
+            try:
+                with span(rotulo) as registro:
+                    resultado = cacheada(*args, **kwargs)
+                    registro["cache"] = "falha" if _local.falhou else "acerto"
+            finally:
+                falhou, _local.falhou = _local.falhou, anterior
+            registrar_cache(rotulo, acertos=0 if falhou else 1, falhas=1 if falhou else 0)
+            return resultado
+
+        if hasattr(cacheada, "clear"):
+            chamada.clear = cacheada.clear
+        return chamada
+    return aplicar
+
+
+def spans(execucao=None):
+    """Spans registrados, opcionalmente só os de uma execução."""
+    with _lock:
+        registros = list(_spans)
+    return [s for s in registros if execucao is None or s["execucao"] == execucao]
+
+
+def caches():
+    """Contadores por cache: {nome: {"acertos", "falhas", "taxa_acerto"}}."""
+    with _lock:
+        contadores = {nome: dict(c) for nome, c in _caches.items()}
+    for c in contadores.values():
+        total = c["acertos"] + c["falhas"]
+        c["taxa_acerto"] = c["acertos"] / total if total else None
+    return contadores
+
+
+def limpar():
+    """Zera spans e contadores."""
+    with _lock:
+        _spans.clear()
+        _caches.clear()
@@ -0,0 +1,291 @@
+"""Migração KML + planilha para mapa_dados.db e para o dataset preparado, sem interface."""
+import io
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import metricas
+from .analistas import colunas_faltando, preparar_analistas
+from .correspondencia import LIMIAR_PADRAO
+
+logger = logging.getLogger(__name__)
+
+
+def ler_planilha(xlsx):
+    """Lê e prepara a planilha de analistas (caminho, bytes ou arquivo). ValueError se faltarem colunas."""
+    with metricas.span("excel.ler", bytes=getattr(xlsx, "size", None)) as registro:
+        df_analistas = pd.read_excel(xlsx)
+        registro["linhas"] = len(df_analistas)
+    faltando = colunas_faltando(df_analistas)
+    if faltando:
+        raise ValueError(f"Colunas faltando no Excel: {faltando}")
+    return preparar_analistas(df_analistas)
+
+
+def _comparar(anteriores, atuais):
+    """(novos, alterados, removidos) entre dois dicionários chave → hash."""
+    novos = atuais.keys() - anteriores.keys()
+    removidos = anteriores.keys() - atuais.keys()
+    alterados = {chave for chave in atuais.keys() & anteriores.keys() if atuais[chave] != anteriores[chave]}
+    return novos, alterados, removidos
+
+
+def _ler_kml_delta(kml_bytes, conhecidos):
+    """Lê só os Placemarks com hash fora de `conhecidos`; retorna (gdf em EPSG:4326, {unidade: [hashes]})."""
+    from .kml import hash_placemark, ler_kml, unidade_placemark
+
+    por_unidade = {}
+
+    def manter(props, partes):
+        h = hash_placemark(props, partes)
+        por_unidade.setdefault(unidade_placemark(props), []).append(h)
+        return h not in conhecidos
+
+    return ler_kml(kml_bytes, manter=manter), por_unidade
+
+
+# Hashes conhecidos em cada processo do pool, recebidos uma vez pelo inicializador
+_conhecidos_pool = frozenset()
+
+
+def _iniciar_pool(conhecidos):
+    global _conhecidos_pool
+    _conhecidos_pool = conhecidos
+
+
+def _tarefa_kml(args, conhecidos=None):
+    """Lê um arquivo: os Placemarks fora de `conhecidos` (no pool, os do inicializador) ou, com `unidades`, só os dessas unidades."""
+    from .kml import ler_kml, unidade_placemark
+
+    nome, conteudo, unidades = args
+    conhecidos = _conhecidos_pool if conhecidos is None else conhecidos
+    inicio = time.perf_counter()
+    gdf, hashes, erro = None, {}, None
+    try:
+        if unidades is None:
+            gdf, hashes = _ler_kml_delta(conteudo, conhecidos)
+        else:
+            gdf = ler_kml(conteudo, manter=lambda props, partes: unidade_placemark(props) in unidades)
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+    return {"arquivo": nome, "gdf": gdf, "hashes": hashes, "bytes": len(conteudo),
+            "segundos": time.perf_counter() - inicio, "erro": erro}
+
+
+def _ler_arquivos(arquivos, conhecidos=frozenset(), unidades=None, processos=None):
+    """Resultado de _tarefa_kml para cada arquivo, na ordem de `arquivos`.
+
+    `conhecidos` vai uma vez para cada processo do pool (pelo inicializador), não
+    com cada arquivo: o conjunto pode ter os hashes de todo o banco.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    tarefas = [(nome, conteudo, unidades) for nome, conteudo in arquivos]
+    processos = min(processos or os.cpu_count() or 1, len(tarefas))
+    if processos > 1:
+        with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_pool,
+                                 initargs=(frozenset(conhecidos),)) as pool:
+            return list(pool.map(_tarefa_kml, tarefas))
+    return [_tarefa_kml(tarefa, conhecidos) for tarefa in tarefas]
+
+
+def _unir_resultados(resultados):
+    """(gdf, hashes por unidade, relatório) de ler_kmls a partir dos resultados de _ler_arquivos."""
+    from .kml import unir_kmls
+
+    hashes = {}
+    for resultado in resultados:
+        for unidade, lista in resultado["hashes"].items():
+            hashes.setdefault(unidade, []).extend(lista)
+    relatorio = pd.DataFrame([{
+        "arquivo": r["arquivo"],
+        "placemarks": sum(len(lista) for lista in r["hashes"].values()),
+        "fazendas": 0 if r["gdf"] is None else len(r["gdf"]),
+        "bytes": r["bytes"],
+        "segundos": round(r["segundos"], 3),
+        "erro": r["erro"],
+    } for r in resultados], columns=["arquivo", "placemarks", "fazendas", "bytes", "segundos", "erro"])
+    gdf = unir_kmls([r["gdf"] for r in resultados if r["gdf"] is not None])
+    return gdf, {unidade: " ".join(lista) for unidade, lista in hashes.items()}, relatorio
+
+
+def ler_kmls(arquivos, conhecidos=frozenset(), unidades=None, processos=None):
+    """Lê [(nome, bytes)] de KML/KMZ em paralelo e une as unidades repetidas entre arquivos.
+
+    Cada arquivo é lido num processo do pool (com um só arquivo ou processo, no
+    próprio processo). Retorna (gdf em EPSG:4326, {unidade: hashes dos Placemarks
+    na ordem dos arquivos}, relatório por arquivo com Placemarks, fazendas, bytes,
+    segundos e erro). Arquivos com erro entram só no relatório.
+    """
+    return _unir_resultados(_ler_arquivos(arquivos, conhecidos, unidades, processos))
+
+
+def migrar_incremental(kml, xlsx_bytes, limiar=LIMIAR_PADRAO, caminho_banco=None, versao=None, processos=None):
+    """Migra KML e planilha para o banco e o dataset preparado, processando só o que mudou desde a última ingestão.
+
+    `kml` são os bytes de um KML/KMZ ou uma lista [(nome, bytes)] de KML, KMZ e .zip
+    com KML/KMZ dentro, lidos em paralelo (ler_kmls) e reprojetados uma só vez; uma
+    fazenda dividida entre arquivos vira uma unidade só.
+
+    Cada Placemark e cada linha da planilha têm um hash, e o estado da ingestão
+    anterior (hashes, CRS e versão do dataset preparado) fica no banco. Só os
+    Placemarks novos ou alterados viram geometrias e são reprojetados; as demais
+    unidades vêm do dataset preparado anterior. O banco recebe apenas os vínculos
+    novos, de unidades alteradas ou de especialistas alterados, e perde os que
+    sumiram dos arquivos. Sem estado anterior (ou sem o dataset dele) tudo é processado.
+
+    `versao` padrão é versao_entradas dos arquivos enviados, da planilha e de `limiar`.
+    Retorna um dicionário com df_analistas, gdf_kml, correspondencias,
+    nao_encontrados, gravacao (o resultado de migrar_dados; None, sem nada gravado,
+    se planilha e KML não tiverem unidade em comum), versao (a versão preparada
+    efetivamente salva, ou None), "crs", "arquivos_kml" (o relatório de
+    ler_kmls, None se o KML não mudou) e "delta": modo ("incremental" ou "completo"),
+    contagens de "fazendas" e "especialistas" (novos, alterados, removidos e iguais),
+    vínculos gravados e removidos e segundos. ValueError se algum arquivo não puder ser lido.
+    """
+    from .analistas import hashes_especialistas
+    from .banco import (CAMINHO_BANCO, conectar, criar_tabelas, gravar_estado, ler_estado, migrar_dados, remover,
+                        vinculos_gravados)
+    from .correspondencia import alinhar_unidades
+    from .kml import expandir_zip, reprojetar_utm
+    from .preparados import (adicionar_centroides, adicionar_distancias, carregar_preparados, hash_conteudo,
+                             salvar_preparados, versao_entradas)
+    from .texto import normalizar_serie
+
+    inicio = time.perf_counter()
+    if isinstance(kml, (bytes, bytearray)):
+        kml = [("kml", bytes(kml))]
+    # Na ordem do upload (e dos nomes dentro de cada .zip): a correspondência desempata pela ordem
+    arquivos = [arquivo for nome, conteudo in kml for arquivo in expandir_zip(nome, conteudo)]
+    if not arquivos or not all(conteudo for _, conteudo in arquivos):
+        raise ValueError("Arquivo KML vazio ou inválido.")
+    hash_kml = hash_conteudo(*[parte for nome, conteudo in arquivos for parte in (nome.encode(), conteudo)])
+    hash_excel = hash_conteudo(xlsx_bytes)
+    versao = versao or versao_entradas(kml, xlsx_bytes, limiar)
+    relatorio = None
+    conn = conectar(caminho_banco or CAMINHO_BANCO)
+    try:
+        criar_tabelas(conn)
+        estado = ler_estado(conn)
+        anterior = carregar_preparados(estado["versao"]) if estado.get("versao") else None
+        incremental = anterior is not None
+
+        # KML: só Placemarks com hash desconhecido são convertidos em geometrias
+        if incremental and hash_kml == estado.get("hash_kml"):
+            unidades, gdf_delta = estado["unidades"], None
+        else:
+            conhecidos = {h for hashes in estado["unidades"].values() for h in hashes.split()} if incremental else set()
+            with metricas.span("kml.ler", bytes=sum(len(c) for _, c in arquivos), arquivos=len(arquivos)) as registro:
+                lidos = _ler_arquivos(arquivos, conhecidos, processos=processos)
+                gdf_delta, unidades, relatorio = _unir_resultados(lidos)
+                registro["linhas"] = len(gdf_delta)
+            falhas = relatorio[relatorio["erro"].notna()]
+            if len(falhas):
+                raise ValueError("Erro ao ler " + "; ".join(f"{a}: {e}" for a, e in zip(falhas["arquivo"], falhas["erro"])))
+        novas, alteradas, removidas = _comparar(estado["unidades"], unidades)
+        if incremental:
+            refazer = novas | alteradas
+            # Unidades alteradas com algum Placemark conhecido (ex.: uma parte mudou) são lidas de novo
+            # inteiras, só dos arquivos em que aparecem
+            incompletas = {u for u in refazer if any(h in conhecidos for h in unidades[u].split())} if gdf_delta is not None else set()
+            if incompletas:
+                com_incompletas = [arquivo for arquivo, lido in zip(arquivos, lidos) if incompletas & lido["hashes"].keys()]
+                gdf_delta = pd.concat([
+                    gdf_delta[~gdf_delta["UNIDADE_normalized"].isin(incompletas)],
+                    ler_kmls(com_incompletas, unidades=incompletas, processos=processos)[0],
+                ], ignore_index=True)
+            crs = estado["crs"]
+            gdf_kml = anterior[1][~anterior[1]["UNIDADE_normalized"].isin(refazer | removidas)]
+            if gdf_delta is not None and len(gdf_delta):
+                with metricas.span("kml.reprojetar", linhas=len(gdf_delta)):
+                    gdf_delta = adicionar_centroides(reprojetar_utm(gdf_delta, crs)[0])
+                # Ordem do arquivo, como na leitura completa: a correspondência desempata pela ordem
+                gdf_kml = pd.concat([gdf_kml, gdf_delta], ignore_index=True)
+                ordem = pd.Index(list(unidades)).get_indexer(gdf_kml["UNIDADE_normalized"])
+                gdf_kml = gdf_kml.iloc[np.argsort(ordem, kind="stable")].reset_index(drop=True)
+        else:
+            refazer = set(unidades)
+            gdf_kml, crs = gdf_delta, None
+            if len(gdf_delta):
+                with metricas.span("kml.reprojetar", linhas=len(gdf_delta)):
+                    gdf_kml, crs = reprojetar_utm(gdf_delta)
+                    gdf_kml = adicionar_centroides(gdf_kml)
+        if gdf_kml.empty:
+            raise ValueError("Nenhuma geometria válida encontrada no KML.")
+
+        # Planilha: idêntica à anterior, é reconstruída do dataset preparado sem abrir o Excel
+        if incremental and hash_excel == estado.get("hash_excel"):
+            df_analistas = anterior[0].drop(columns=["UNIDADE_normalized", "SCORE_CORRESPONDENCIA", "DISTANCIA_KM"])
+            df_analistas = df_analistas.rename(columns={"UNIDADE_EXCEL": "UNIDADE_normalized"})
+            especialistas = estado["especialistas"]
+        else:
+            df_analistas = ler_planilha(io.BytesIO(xlsx_bytes))
+            especialistas = hashes_especialistas(df_analistas)
+        novos, alterados, removidos = _comparar(estado["especialistas"], especialistas)
+
+        with metricas.span("correspondencia", linhas=len(df_analistas)):
+            df_analistas, correspondencias, nao_encontrados = alinhar_unidades(df_analistas, gdf_kml, limiar)
+        resultado = {
+            "df_analistas": df_analistas, "gdf_kml": gdf_kml, "correspondencias": correspondencias,
+            "nao_encontrados": nao_encontrados, "gravacao": None, "versao": None, "crs": crs,
+            "arquivos_kml": relatorio,
+        }
+        if not df_analistas["UNIDADE_normalized"].isin(gdf_kml["UNIDADE_normalized"]).any():
+            return resultado
+
+        # Vínculos fazenda × especialista: grava os novos ou afetados, apaga os que sumiram
+        nome_especialista = normalizar_serie(df_analistas["ESPECIALISTA"]).to_numpy()
+        nome_fazenda = df_analistas["UNIDADE_normalized"].map(
+            gdf_kml.drop_duplicates("UNIDADE_normalized").set_index("UNIDADE_normalized")["NOME_FAZ"]
+        ).to_numpy()
+        existentes = vinculos_gravados(conn)
+        vinculos = list(zip(nome_fazenda, nome_especialista))
+        escrever = (
+            df_analistas["UNIDADE_normalized"].isin(refazer).to_numpy()
+            | np.fromiter((par not in existentes for par in vinculos), dtype=bool, count=len(vinculos))
+        ) & pd.notna(nome_fazenda)
+        # migrar_dados grava cada especialista a partir da sua primeira linha, como na migração completa
+        primeira = ~df_analistas["ESPECIALISTA"].duplicated().to_numpy()
+        escrever |= primeira & np.isin(nome_especialista, list(set(nome_especialista[escrever]) | novos | alterados))
+        with metricas.span("banco.migrar") as registro:
+            gravacao = migrar_dados(conn, df_analistas[escrever],
+                                    gdf_kml[gdf_kml["UNIDADE_normalized"].isin(df_analistas["UNIDADE_normalized"][escrever])])
+            apagadas = remover(conn, existentes - set(vinculos),
+                               {nome for _, nome in existentes} - set(nome_especialista))
+            registro["linhas"] = gravacao["especialistas"] + gravacao["fazendas"] + apagadas
+        resultado["gravacao"] = gravacao
+
+        with metricas.span("preparar_dataset", linhas=len(df_analistas)):
+            resultado["df_analistas"] = adicionar_distancias(df_analistas, gdf_kml)
+        try:
+            salvar_preparados(versao, resultado["df_analistas"], gdf_kml)
+        except Exception as e:
+            logger.warning(f"Não foi possível salvar o dataset preparado: {e}")
+            versao = ""
+        resultado["versao"] = versao or None
+        gravar_estado(
+            conn,
+            {u: unidades[u] for u in refazer} | dict.fromkeys(removidas),
+            {nome: especialistas[nome] for nome in novos | alterados} | dict.fromkeys(removidos),
+            completo=not incremental, versao=versao, crs=crs, hash_kml=hash_kml, hash_excel=hash_excel,
+        )
+    finally:
+        conn.close()
+
+    resultado["delta"] = {
+        "modo": "incremental" if incremental else "completo",
+        "fazendas": {"novas": len(novas), "alteradas": len(alteradas), "removidas": len(removidas),
+                     "iguais": len(unidades) - len(novas) - len(alteradas)},
+        "especialistas": {"novos": len(novos), "alterados": len(alterados), "removidos": len(removidos),
+                          "iguais": len(especialistas) - len(novos) - len(alterados)},
+        "vinculos_gravados": gravacao["fazendas"],
+        "vinculos_removidos": apagadas,
+        "segundos": time.perf_counter() - inicio,
+    }
+    logger.info(f"Ingestão {resultado['delta']['modo']}: fazendas {resultado['delta']['fazendas']}, "
+                f"especialistas {resultado['delta']['especialistas']}, {apagadas} vínculos removidos "
+                f"em {resultado['delta']['segundos']:.2f} s")
+    return resultado
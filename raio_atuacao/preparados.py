@@ -0,0 +1,149 @@
+"""Dataset preparado (GeoParquet) versionado pelo hash do conteúdo dos arquivos de entrada."""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .distancia import haversine_m
+
+logger = logging.getLogger(__name__)
+
+DIRETORIO_PREPARADOS = "dados_preparados"
+# Incrementar quando as colunas gravadas mudarem, invalidando versões antigas
+VERSAO_FORMATO = 2
+ARQUIVO_ATUAL = "ATUAL"
+
+
+def _diretorio(diretorio=None):
+    return diretorio or os.environ.get("RAIO_DADOS_PREPARADOS", DIRETORIO_PREPARADOS)
+
+
+def hash_conteudo(*conteudos):
+    """Hash SHA-256 dos conteúdos (bytes) de entrada, prefixado pela versão do formato."""
+    h = hashlib.sha256(f"formato={VERSAO_FORMATO}".encode())
+    for conteudo in conteudos:
+        h.update(len(conteudo).to_bytes(8, "little"))
+        h.update(conteudo)
+    return h.hexdigest()
+
+
+def versao_entradas(arquivos_kml, xlsx_bytes, limiar):
+    """Versão do dataset preparado para [(nome, bytes)] de KML, a planilha e o limiar da correspondência.
+
+    Nomes e ordem dos arquivos entram no hash porque a correspondência desempata pela
+    ordem do KML; o limiar, porque muda quais unidades são casadas.
+    """
+    partes = [parte for nome, conteudo in arquivos_kml for parte in (nome.encode(), conteudo)]
+    return hash_conteudo(*partes, xlsx_bytes, f"limiar={limiar}".encode())
+
+
+def adicionar_centroides(gdf_kml):
+    """Cópia do GeoDataFrame com geometry_4326, a zona UTM de cada fazenda e centróides em graus.
+
+    ZONA_UTM é o EPSG da zona do centróide de cada fazenda e geometry_utm a geometria
+    nessa zona (coluna sem CRS único), usada para buffers e distâncias em metros. O
+    centróide (Longitude/Latitude_Unidade) também é calculado na zona da fazenda.
+    """
+    import geopandas as gpd
+    import shapely
+
+    from .projecao import WGS84, projetar_por_zona, transformar, zonas_utm
+
+    gdf_kml = gdf_kml.copy()
+    if "geometry_4326" not in gdf_kml:
+        gdf_kml["geometry_4326"] = gpd.GeoSeries(
+            transformar(gdf_kml.geometry.to_numpy(), gdf_kml.crs, WGS84), index=gdf_kml.index, crs=WGS84
+        )
+    graus = gdf_kml["geometry_4326"].to_numpy()
+    aproximados = shapely.centroid(graus)
+    zonas = zonas_utm(shapely.get_x(aproximados), shapely.get_y(aproximados))
+    # Fazendas na zona do dataset aproveitam a geometria já projetada
+    na_zona = np.empty(len(gdf_kml), dtype=object)
+    mesma = zonas == (gdf_kml.crs.to_epsg() if gdf_kml.crs is not None else None)
+    na_zona[mesma] = gdf_kml.geometry.to_numpy()[mesma]
+    na_zona[~mesma] = projetar_por_zona(graus[~mesma], zonas[~mesma])
+    centroides = projetar_por_zona(shapely.centroid(na_zona), zonas, inverso=True)
+    gdf_kml["Longitude_Unidade"] = shapely.get_x(centroides)
+    gdf_kml["Latitude_Unidade"] = shapely.get_y(centroides)
+    gdf_kml["ZONA_UTM"] = zonas
+    gdf_kml["geometry_utm"] = gpd.GeoSeries(na_zona, index=gdf_kml.index)
+    return gdf_kml
+
+
+def preparar_dataset(df_analistas, gdf_kml):
+    """Materializa centróides, geometrias em EPSG:4326 e DISTANCIA_KM de cada linha da planilha."""
+    gdf_kml = adicionar_centroides(gdf_kml)
+    return adicionar_distancias(df_analistas, gdf_kml), gdf_kml
+
+
+def adicionar_distancias(df_analistas, gdf_kml):
+    """Cópia da planilha com DISTANCIA_KM da base ao centróide da unidade (gdf_kml com adicionar_centroides)."""
+    centroides = gdf_kml.drop_duplicates("UNIDADE_normalized").set_index("UNIDADE_normalized")
+    lon = df_analistas["UNIDADE_normalized"].map(centroides["Longitude_Unidade"]).to_numpy(dtype=float)
+    lat = df_analistas["UNIDADE_normalized"].map(centroides["Latitude_Unidade"]).to_numpy(dtype=float)
+    df_analistas = df_analistas.copy()
+    df_analistas["DISTANCIA_KM"] = haversine_m(
+        df_analistas["LON_BASE"].to_numpy(dtype=float), df_analistas["LAT_BASE"].to_numpy(dtype=float), lon, lat
+    ) / 1000
+    return df_analistas
+
+
+def _compativel_parquet(df):
+    """Converte colunas de texto com tipos mistos (comum em planilhas) para str."""
+    import geopandas as gpd
+
+    df = df.copy()
+    for coluna in df.columns:
+        if df[coluna].dtype == object and not isinstance(df[coluna], gpd.GeoSeries):
+            if pd.api.types.infer_dtype(df[coluna], skipna=True) not in ("string", "empty"):
+                df[coluna] = df[coluna].where(df[coluna].isna(), df[coluna].astype(str))
+    return df
+
+
+def salvar_preparados(versao, df_analistas, gdf_kml, diretorio=None):
+    """Grava a versão preparada e a marca como atual (escrita atômica por renomeação)."""
+    base = _diretorio(diretorio)
+    os.makedirs(base, exist_ok=True)
+    destino = os.path.join(base, versao)
+    if not os.path.isdir(destino):
+        temporario = tempfile.mkdtemp(dir=base, prefix=".tmp-")
+        try:
+            _compativel_parquet(df_analistas).to_parquet(os.path.join(temporario, "analistas.parquet"), index=False)
+            _compativel_parquet(gdf_kml).to_parquet(os.path.join(temporario, "fazendas.parquet"), index=False)
+            os.replace(temporario, destino)
+        except Exception:
+            shutil.rmtree(temporario, ignore_errors=True)
+            raise
+    ponteiro = os.path.join(base, ARQUIVO_ATUAL)
+    with open(ponteiro + ".tmp", "w") as f:
+        f.write(versao)
+    os.replace(ponteiro + ".tmp", ponteiro)
+    logger.info(f"Dataset preparado salvo: {versao[:12]}")
+
+
+def versao_atual(diretorio=None):
+    """Hash da versão preparada mais recente, ou None."""
+    try:
+        with open(os.path.join(_diretorio(diretorio), ARQUIVO_ATUAL)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def carregar_preparados(versao, diretorio=None):
+    """Lê (df_analistas, gdf_kml) de uma versão preparada, ou None se não existir ou for de um formato anterior."""
+    pasta = os.path.join(_diretorio(diretorio), versao)
+    if not os.path.isdir(pasta):
+        return None
+    import geopandas as gpd
+
+    df_analistas = pd.read_parquet(os.path.join(pasta, "analistas.parquet"))
+    gdf_kml = gpd.read_parquet(os.path.join(pasta, "fazendas.parquet"))
+    if "ZONA_UTM" not in gdf_kml:
+        logger.info(f"Dataset preparado {versao[:12]} em formato anterior; ignorado.")
+        return None
+    return df_analistas, gdf_kml
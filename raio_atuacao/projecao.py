@@ -0,0 +1,69 @@
+"""Zonas UTM por fazenda e reprojeções em lote com transformadores reaproveitados."""
+import functools
+
+import numpy as np
+import shapely
+
+WGS84 = "EPSG:4326"
+# Largura (graus de longitude) de cada uma das 60 zonas UTM
+LARGURA_ZONA_GRAUS = 6
+# Transformadores pyproj mantidos em memória (um por par de CRS)
+MAX_TRANSFORMADORES = 128
+
+
+def zonas_utm(lon, lat):
+    """Código EPSG da zona UTM de cada ponto em graus (326xx no hemisfério norte, 327xx no sul)."""
+    lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    zona = np.clip(np.floor((np.nan_to_num(lon) + 180) / LARGURA_ZONA_GRAUS).astype(np.int64) + 1, 1, 60)
+    return np.where(lat < 0, 32700, 32600) + zona
+
+
+def zona_predominante(zonas):
+    """A zona (EPSG) com mais fazendas; no empate, a de menor código."""
+    valores, contagens = np.unique(np.asarray(zonas), return_counts=True)
+    return int(valores[np.argmax(contagens)])
+
+
+def _codigo(crs):
+    """CRS (int EPSG, texto ou pyproj.CRS) como texto "EPSG:xxxx" quando possível, para a chave do cache."""
+    if isinstance(crs, (int, np.integer)):
+        return f"EPSG:{crs}"
+    if isinstance(crs, str):
+        return crs.upper()
+    epsg = crs.to_epsg()
+    return f"EPSG:{epsg}" if epsg else crs.to_wkt()
+
+
+@functools.lru_cache(maxsize=MAX_TRANSFORMADORES)
+def _transformador(origem, destino):
+    from pyproj import Transformer
+
+    return Transformer.from_crs(origem, destino, always_xy=True)
+
+
+def transformador(origem, destino):
+    """pyproj.Transformer (x = longitude) de `origem` para `destino`, criado uma vez por par de CRS."""
+    return _transformador(_codigo(origem), _codigo(destino))
+
+
+def transformar(geometrias, origem, destino):
+    """Array de geometrias shapely reprojetado de `origem` para `destino` em uma só chamada."""
+    geometrias = np.asarray(geometrias, dtype=object)
+    origem, destino = _codigo(origem), _codigo(destino)
+    if origem == destino or not geometrias.size:
+        return geometrias
+    proj = _transformador(origem, destino)
+    return shapely.transform(geometrias, lambda xy: np.column_stack(proj.transform(xy[:, 0], xy[:, 1])))
+
+
+def projetar_por_zona(geometrias, zonas, inverso=False):
+    """Geometrias em graus levadas cada uma à sua zona UTM (`zonas`, EPSG), uma transformação por zona.
+
+    Com `inverso=True` faz o caminho contrário: de cada zona para EPSG:4326.
+    """
+    geometrias, zonas = np.asarray(geometrias, dtype=object), np.asarray(zonas)
+    resultado = np.empty(geometrias.size, dtype=object)
+    for zona in np.unique(zonas):
+        sel = zonas == zona
+        resultado[sel] = transformar(geometrias[sel], zona, WGS84) if inverso else transformar(geometrias[sel], WGS84, zona)
+    return resultado
@@ -0,0 +1,144 @@
+"""Rotas rodoviárias via API compatível com OSRM, com cache persistente e busca concorrente."""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+# Servidor público por padrão; RAIO_OSRM_URL aponta para um OSRM local ou um substituto em testes
+URL_OSRM_PADRAO = "http://router.project-osrm.org"
+CAMINHO_CACHE = "rotas_cache.db"
+
+# 5 casas decimais ≈ 1 m: origens/destinos praticamente iguais compartilham a rota
+CASAS_DECIMAIS = 5
+MAX_ENTRADAS = 50_000
+VALIDADE_DIAS = 30
+MAX_CONEXOES = 8
+TIMEOUT_S = 5
+# Limite de parâmetros por consulta SQLite
+LOTE_SQL = 500
+
+
+def chave_rota(start_lon, start_lat, end_lon, end_lat, casas=CASAS_DECIMAIS):
+    """Chave do cache: origem e destino arredondados, no formato de coordenadas do OSRM."""
+    return f"{start_lon:.{casas}f},{start_lat:.{casas}f};{end_lon:.{casas}f},{end_lat:.{casas}f}"
+
+
+class CacheRotas:
+    """Cache de rotas em SQLite com validade e despejo LRU por número de entradas."""
+
+    def __init__(self, caminho=None, max_entradas=MAX_ENTRADAS, validade_dias=VALIDADE_DIAS):
+        self.caminho = caminho or os.environ.get("RAIO_ROTAS_CACHE", CAMINHO_CACHE)
+        self.max_entradas = max_entradas
+        self.validade_s = validade_dias * 86400
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.caminho, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS rotas (
+                chave TEXT PRIMARY KEY, rota TEXT NOT NULL,
+                criado REAL NOT NULL, acessado REAL NOT NULL
+            )''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_rotas_acessado ON rotas (acessado)")
+        self.conn.commit()
+
+    def obter(self, chaves):
+        """Rotas válidas em cache para as chaves informadas, como {chave: [(lat, lon), ...]}."""
+        agora = time.time()
+        encontradas = {}
+        with self._lock, self.conn:
+            for i in range(0, len(chaves), LOTE_SQL):
+                lote = chaves[i:i + LOTE_SQL]
+                marcadores = ",".join("?" * len(lote))
+                linhas = self.conn.execute(
+                    f"SELECT chave, rota FROM rotas WHERE chave IN ({marcadores}) AND criado >= ?",
+                    (*lote, agora - self.validade_s),
+                ).fetchall()
+                encontradas.update((chave, [tuple(p) for p in json.loads(rota)]) for chave, rota in linhas)
+            self.conn.executemany("UPDATE rotas SET acessado = ? WHERE chave = ?", ((agora, c) for c in encontradas))
+        return encontradas
+
+    def gravar(self, rotas):
+        """Grava {chave: rota} e aplica a política de despejo."""
+        if not rotas:
+            return
+        agora = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rotas (chave, rota, criado, acessado) VALUES (?, ?, ?, ?)",
+                ((chave, json.dumps(rota), agora, agora) for chave, rota in rotas.items()),
+            )
+            self.conn.execute("DELETE FROM rotas WHERE criado < ?", (agora - self.validade_s,))
+            excesso = self.conn.execute("SELECT COUNT(*) FROM rotas").fetchone()[0] - self.max_entradas
+            if excesso > 0:
+                self.conn.execute(
+                    "DELETE FROM rotas WHERE chave IN (SELECT chave FROM rotas ORDER BY acessado LIMIT ?)",
+                    (excesso,),
+                )
+
+
+class ClienteRotas:
+    """Cliente de rotas com sessão HTTP compartilhada, pool limitado de threads e cache opcional."""
+
+    def __init__(self, url_base=None, cache=None, max_conexoes=MAX_CONEXOES, timeout=TIMEOUT_S):
+        self.url_base = (url_base or os.environ.get("RAIO_OSRM_URL", URL_OSRM_PADRAO)).rstrip("/")
+        self.cache = cache
+        self.max_conexoes = max_conexoes
+        self.timeout = timeout
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_conexoes)
+        self.sessao.mount("http://", adaptador)
+        self.sessao.mount("https://", adaptador)
+
+    def _buscar(self, chave):
+        """Consulta uma rota no servidor; retorna lista de (lat, lon) ou None."""
+        try:
+            url = f"{self.url_base}/route/v1/driving/{chave}?overview=full&geometries=geojson"
+            response = self.sessao.get(url, timeout=self.timeout)
+            if response.status_code != 200:
+                logger.error(f"Erro na API OSRM: status {response.status_code}")
+                return None
+            routes = response.json().get("routes", [])
+            if not routes:
+                logger.error("Nenhuma rota encontrada pela API OSRM.")
+                return None
+            return [(point[1], point[0]) for point in routes[0]["geometry"]["coordinates"]]
+        except Exception as e:
+            logger.error(f"Erro ao obter rota: {e}")
+            return None
+
+    def rotas_em_lote(self, pares):
+        """Rotas para uma lista de (start_lon, start_lat, end_lon, end_lat), na mesma ordem.
+
+        Pares repetidos são consultados uma única vez; acertos vêm do cache e as
+        faltas são buscadas em paralelo. Rotas não encontradas retornam None.
+        """
+        chaves = [chave_rota(*par) for par in pares]
+        unicas = list(dict.fromkeys(chaves))
+        rotas = self.cache.obter(unicas) if self.cache is not None else {}
+        faltando = [chave for chave in unicas if chave not in rotas]
+        metricas.registrar_cache("rotas", acertos=len(unicas) - len(faltando), falhas=len(faltando))
+        if faltando:
+            with metricas.span("rotas.buscar", linhas=len(faltando)):
+                with ThreadPoolExecutor(max_workers=min(self.max_conexoes, len(faltando))) as pool:
+                    novas = dict(zip(faltando, pool.map(self._buscar, faltando)))
+            novas = {chave: rota for chave, rota in novas.items() if rota}
+            if self.cache is not None:
+                self.cache.gravar(novas)
+            rotas.update(novas)
+        logger.info(f"Rotas: {len(pares)} pedidas, {len(unicas)} únicas, {len(unicas) - len(faltando)} do cache.")
+        return [rotas.get(chave) for chave in chaves]
+
+    def rota(self, start_lon, start_lat, end_lon, end_lat):
+        """Rota entre dois pontos como lista de (lat, lon), ou None."""
+        return self.rotas_em_lote([(start_lon, start_lat, end_lon, end_lat)])[0]
@@ -0,0 +1,22 @@
+"""Normalização de textos usados como chave entre Excel e KML."""
+import functools
+
+import pandas as pd
+
+# Valores distintos memorizados por normalize_str (nomes de gestores, especialistas e fazendas)
+MAX_MEMORIZADOS = 65536
+
+
+@functools.lru_cache(maxsize=MAX_MEMORIZADOS)
+def normalize_str(s):
+    """Normaliza strings, preservando acentos para consistência."""
+    try:
+        return str(s).strip().upper() if pd.notna(s) else "DESCONHECIDO"
+    except Exception:
+        return "DESCONHECIDO"
+
+
+def normalizar_serie(serie):
+    """Versão vetorizada de normalize_str para uma Series inteira."""
+    serie = pd.Series(serie, dtype=object)
+    return serie.astype(str).str.strip().str.upper().where(serie.notna(), "DESCONHECIDO")
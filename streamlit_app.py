@@ -1,22 +1,19 @@
 import streamlit as st
 import pandas as pd
-import geopandas as gpd
-import folium
-from folium.plugins import MarkerCluster
-from unidecode import unidecode
-import xml.etree.ElementTree as ET
-from shapely.geometry import Polygon, LineString, Point, MultiPolygon
-from shapely.ops import unary_union
-import requests
 import time
 import math
 import json
-from shapely.geometry import shape
-from fuzzywuzzy import fuzz
-from streamlit_folium import st_folium
-import sqlite3
+import hashlib
+import os
+import tempfile
 import logging
 
+# Só o núcleo leve entra no import; geopandas, shapely, folium e requests são importados sob demanda
+from raio_atuacao import metricas
+from raio_atuacao.correspondencia import LIMIAR_PADRAO
+from raio_atuacao.preparados import versao_atual, versao_entradas
+from raio_atuacao.texto import normalize_str, normalizar_serie
+
 # Configuração do logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,6 +21,10 @@ logger = logging.getLogger(__name__)
 # Configuração da página
 st.set_page_config(page_title="Raio de Atuação dos Analistas", layout="wide")
 
+# Spans deste rerun ficam agrupados; com RAIO_METRICAS_LOG os eventos vão em JSON para arquivo
+metricas.configurar_log_json()
+metricas.iniciar_execucao()
+
 # Carregar CSS externo
 try:
     with open("styles.css") as f:
@@ -56,336 +57,240 @@ except FileNotFoundError:
         </style>
     """, unsafe_allow_html=True)
 
-# Mapeamento de códigos IBGE para UFs
-UF_MAP = {
-    "11": "RO", "12": "AC", "13": "AM", "14": "RR", "15": "PA", "16": "AP", "17": "TO",
-    "21": "MA", "22": "PI", "23": "CE", "24": "RN", "25": "PB", "26": "PE", "27": "AL",
-    "28": "SE", "29": "BA", "31": "MG", "32": "ES", "33": "RJ", "35": "SP", "41": "PR",
-    "42": "SC", "43": "RS", "50": "MS", "51": "MT", "52": "GO", "53": "DF"
-}
-
-@st.cache_data
-def normalize_str(s):
-    """Normaliza strings, preservando acentos para consistência."""
-    try:
-        return str(s).strip().upper() if pd.notna(s) else "DESCONHECIDO"
-    except Exception:
-        logger.error(f"Erro ao normalizar string: {s}")
-        return "DESCONHECIDO"
-
-@st.cache_data
-def haversine_m(lon1, lat1, lon2, lat2):
-    """Calcula distância em metros usando a fórmula de Haversine."""
-    try:
-        R = 6371000  # Raio da Terra em metros
-        lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-        dlon, dlat = lon2 - lon1, lat2 - lat1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        return R * c
-    except Exception as e:
-        logger.error(f"Erro no cálculo de Haversine: {e}")
-        return None
-
-@st.cache_data
-def extrair_dados_kml(kml_bytes):
-    """Extrai dados de um arquivo KML e retorna um GeoDataFrame."""
-    try:
-        if not kml_bytes:
-            st.error("Arquivo KML vazio ou inválido.")
-            logger.error("Arquivo KML vazio ou inválido.")
-            return gpd.GeoDataFrame(columns=['Name', 'geometry', 'UNIDADE_normalized'], crs="EPSG:4326")
-
-        kml_string = kml_bytes.decode("utf-8")
-        tree = ET.fromstring(kml_string)
-        ns = {"kml": "http://www.opengis.net/kml/2.2"}
-        dados = {}
-
-        for placemark in tree.findall(".//kml:Placemark", ns):
-            props = {sd.get("name"): sd.text for sd in placemark.findall(".//kml:SimpleData", ns)}
-            props["Name"] = placemark.find("kml:name", ns).text if placemark.find("kml:name", ns) is not None else "Sem Nome"
-            nome_faz = props.get("NOME_FAZ", props["Name"])
-            props["UNIDADE_normalized"] = normalize_str(nome_faz)
-
-            geometry = None
-            for geom_type, tag in [
-                ("Polygon", ".//kml:Polygon/kml:outerBoundaryIs/kml:LinearRing/kml:coordinates"),
-                ("LineString", ".//kml:LineString/kml:coordinates"),
-                ("Point", ".//kml:Point/kml:coordinates")
-            ]:
-                elem = placemark.find(tag, ns)
-                if elem is not None:
-                    coords = [tuple(map(float, c.split(","))) for c in elem.text.strip().split()]
-                    try:
-                        geometry = {
-                            "Polygon": Polygon([(c[0], c[1]) for c in coords]),
-                            "LineString": LineString([(c[0], c[1]) for c in coords]),
-                            "Point": Point(coords[0])
-                        }[geom_type]
-                        break
-                    except Exception as e:
-                        st.warning(f"Erro ao criar geometria para {props['Name']}: {e}")
-                        logger.error(f"Erro ao criar geometria para {props['Name']}: {e}")
-                        continue
-
-            if geometry:
-                unidade = props["UNIDADE_normalized"]
-                dados.setdefault(unidade, {"geometries": [], "props": {}})["geometries"].append(geometry)
-                dados[unidade]["props"].update(props)
-
-        if not dados:
-            st.error("Nenhuma geometria válida encontrada no KML.")
-            logger.error("Nenhuma geometria válida encontrada no KML.")
-            return gpd.GeoDataFrame(columns=['Name', 'geometry', 'UNIDADE_normalized'], crs="EPSG:4326")
-
-        gdf_data = [
-            {
-                "Name": unidade,
-                "geometry": unary_union(info["geometries"]),
-                "NOME_FAZ": info["props"].get("NOME_FAZ", info["props"].get("Name", "Desconhecida")),
-                "UNIDADE_normalized": info["props"]["UNIDADE_normalized"],
-                **info["props"]
-            } for unidade, info in dados.items()
-        ]
-        gdf = gpd.GeoDataFrame(gdf_data, crs="EPSG:4326")
-
-        # Reprojetar para UTM
-        if not gdf.empty:
-            gdf_temp = gdf.to_crs(epsg=3857)
-            lon_mean = gdf_temp.geometry.centroid.x.mean()
-            utm_zone = int((lon_mean / 111320 + 180) / 6) + 1
-            utm_crs = f"EPSG:327{utm_zone}" if gdf_temp.geometry.centroid.y.mean() < 0 else f"EPSG:326{utm_zone}"
-            gdf = gdf.to_crs(utm_crs)
-            st.write(f"Geometrias reprojetadas para CRS: {utm_crs}")
-            logger.info(f"Geometrias reprojetadas para CRS: {utm_crs}")
-
-        st.write("Valores de UNIDADE_normalized no KML:", gdf["UNIDADE_normalized"].unique().tolist())
-        logger.info(f"Valores de UNIDADE_normalized no KML: {gdf['UNIDADE_normalized'].unique().tolist()}")
-        return gdf
-    except Exception as e:
-        st.error(f"Erro ao processar KML: {e}")
-        logger.error(f"Erro ao processar KML: {e}")
-        return gpd.GeoDataFrame(columns=['Name', 'geometry', 'UNIDADE_normalized'], crs="EPSG:4326")
-
-@st.cache_data
+@metricas.instrumentar_cache(st.cache_data)
 def criar_banco():
     """Cria o banco de dados SQLite e suas tabelas."""
+    from raio_atuacao.banco import conectar, criar_tabelas
+
     try:
-        conn = sqlite3.connect('mapa_dados.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS especialistas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome TEXT UNIQUE, gestor TEXT, cidade_base TEXT,
-                latitude_base REAL, longitude_base REAL
-            )''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS fazendas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome_fazenda TEXT, especialista_id INTEGER,
-                geometria_json TEXT, latitude_centroide REAL, longitude_centroide REAL,
-                FOREIGN KEY (especialista_id) REFERENCES especialistas (id)
-            )''')
-        conn.commit()
+        conn = conectar()
+        criar_tabelas(conn)
         conn.close()
         return "Banco de dados criado com sucesso!"
     except Exception as e:
         logger.error(f"Erro ao criar banco: {e}")
         return f"Erro ao criar banco: {e}"
 
-@st.cache_data
-def migrar(kml_file, xlsx_file):
-    """Migra dados de KML e Excel para o banco SQLite."""
+def versao_upload(kml_files, xlsx_file, limiar_correspondencia=LIMIAR_PADRAO):
+    """Versão do dataset preparado para os arquivos enviados e o limiar da correspondência."""
+    return versao_entradas([(f.name, f.getvalue()) for f in kml_files], xlsx_file.getvalue(), limiar_correspondencia)
+
+def migrar(kml_files, xlsx_file, limiar_correspondencia=LIMIAR_PADRAO):
+    """Migra dados de KMLs e Excel para o banco SQLite, processando só o que mudou desde a última migração.
+
+    Retorna (df_analistas, gdf_kml, versão do dataset preparado salvo ou None, mensagem).
+    """
+    from raio_atuacao.migracao import migrar_incremental
+
     try:
-        conn = sqlite3.connect('mapa_dados.db')
-        cursor = conn.cursor()
-
-        # Processar Excel
-        df_analistas = pd.read_excel(xlsx_file)
-        expected_cols = ["GESTOR", "ESPECIALISTA", "CIDADE_BASE", "UNIDADE", "COORDENADAS_CIDADE"]
-        if not all(col in df_analistas.columns for col in expected_cols):
-            missing = [col for col in expected_cols if col not in df_analistas.columns]
-            st.error(f"Colunas faltando no Excel: {missing}")
-            logger.error(f"Colunas faltando no Excel: {missing}")
-            conn.close()
-            return None, None, f"Erro: Colunas faltando no Excel: {missing}"
-
-        df_analistas["LAT_BASE"] = pd.to_numeric(df_analistas["COORDENADAS_CIDADE"].astype(str).str.split(",", expand=True)[0], errors="coerce")
-        df_analistas["LON_BASE"] = pd.to_numeric(df_analistas["COORDENADAS_CIDADE"].astype(str).str.split(",", expand=True)[1], errors="coerce")
-        df_analistas["UNIDADE_normalized"] = df_analistas["UNIDADE"].apply(normalize_str)
-        st.write("Valores de UNIDADE_normalized no Excel:", df_analistas["UNIDADE_normalized"].unique().tolist())
-        logger.info(f"Valores de UNIDADE_normalized no Excel: {df_analistas['UNIDADE_normalized'].unique().tolist()}")
-
-        for _, row in df_analistas.drop_duplicates(subset=["ESPECIALISTA"]).iterrows():
-            cursor.execute(
-                "INSERT OR IGNORE INTO especialistas (nome, gestor, cidade_base, latitude_base, longitude_base) VALUES (?, ?, ?, ?, ?)",
-                (normalize_str(row["ESPECIALISTA"]), normalize_str(row["GESTOR"]), normalize_str(row["CIDADE_BASE"]), row["LAT_BASE"], row["LON_BASE"])
-            )
-        conn.commit()
-
-        # Processar KML
-        gdf_kml = extrair_dados_kml(kml_file.read())
-        if gdf_kml.empty:
-            conn.close()
-            return df_analistas, gdf_kml, "Erro: Nenhum dado válido extraído do KML."
-
-        df_merged = pd.merge(df_analistas, gdf_kml, left_on="UNIDADE_normalized", right_on="UNIDADE_normalized", how="inner")
-        if df_merged.empty:
-            st.error("Nenhuma correspondência entre Excel e KML. Verifique os nomes em UNIDADE e NOME_FAZ.")
-            logger.error("Merge vazio entre Excel e KML.")
-            conn.close()
-            return df_analistas, gdf_kml, "Erro: Nenhuma correspondência encontrada."
-
-        for _, row in df_merged.iterrows():
-            cursor.execute("SELECT id FROM especialistas WHERE nome = ?", (normalize_str(row["ESPECIALISTA"]),))
-            result = cursor.fetchone()
-            if result:
-                especialista_id = result[0]
-                geometry = gpd.GeoSeries([row["geometry"]], crs=gdf_kml.crs).to_crs("EPSG:4326").iloc[0]
-                cursor.execute(
-                    "INSERT INTO fazendas (nome_fazenda, especialista_id, geometria_json, latitude_centroide, longitude_centroide) VALUES (?, ?, ?, ?, ?)",
-                    (row["NOME_FAZ"], especialista_id, geometry.to_json(), geometry.centroid.y, geometry.centroid.x)
-                )
-        conn.commit()
-        conn.close()
-        return df_analistas, gdf_kml, f"{len(df_analistas.drop_duplicates('ESPECIALISTA'))} especialistas e {len(df_merged)} fazendas inseridos!"
+        resultado = migrar_incremental(
+            [(f.name, f.getvalue()) for f in kml_files], xlsx_file.getvalue(), limiar_correspondencia,
+            versao=versao_upload(kml_files, xlsx_file, limiar_correspondencia)
+        )
+    except ValueError as e:
+        st.error(str(e))
+        logger.error(str(e))
+        return None, None, None, f"Erro: {e}"
     except Exception as e:
         st.error(f"Erro ao migrar dados: {e}")
         logger.error(f"Erro ao migrar dados: {e}")
-        return None, None, f"Erro ao migrar dados: {e}"
+        return None, None, None, f"Erro ao migrar dados: {e}"
+
+    df_analistas, gdf_kml = resultado["df_analistas"], resultado["gdf_kml"]
+    st.write("Valores de UNIDADE_normalized no Excel:", df_analistas["UNIDADE_EXCEL"].unique().tolist())
+    logger.info(f"Valores de UNIDADE_normalized no Excel: {df_analistas['UNIDADE_EXCEL'].unique().tolist()}")
+    if resultado["arquivos_kml"] is not None:
+        st.write("Leitura dos arquivos KML:")
+        st.dataframe(resultado["arquivos_kml"], use_container_width=True)
+        logger.info(f"Arquivos KML lidos: {resultado['arquivos_kml'][['arquivo', 'fazendas', 'segundos']].to_dict('records')}")
+    st.write(f"Geometrias reprojetadas para CRS: {resultado['crs']}")
+    logger.info(f"Geometrias reprojetadas para CRS: {resultado['crs']}")
+    st.write("Valores de UNIDADE_normalized no KML:", gdf_kml["UNIDADE_normalized"].unique().tolist())
+    logger.info(f"Valores de UNIDADE_normalized no KML: {gdf_kml['UNIDADE_normalized'].unique().tolist()}")
+    correspondencias, nao_encontrados = resultado["correspondencias"], resultado["nao_encontrados"]
+    aproximadas = correspondencias[correspondencias["metodo"] == "aproximada"]
+    st.write(
+        f"Correspondência de unidades: {len(correspondencias) - len(aproximadas)} exatas, "
+        f"{len(aproximadas)} aproximadas, {len(nao_encontrados)} sem correspondência."
+    )
+    logger.info(f"Correspondência: {len(correspondencias)} unidades casadas ({len(aproximadas)} aproximadas), {len(nao_encontrados)} sem correspondência.")
+    if not aproximadas.empty:
+        st.dataframe(aproximadas.rename(columns={"esquerda": "UNIDADE (Excel)", "direita": "NOME_FAZ (KML)", "score": "Similaridade"}), use_container_width=True)
+    if not nao_encontrados.empty:
+        st.warning("Unidades do Excel sem correspondência no KML:")
+        st.dataframe(nao_encontrados.rename(columns={"esquerda": "UNIDADE (Excel)", "melhor_candidato": "Melhor candidato", "score": "Similaridade"}), use_container_width=True)
+
+    gravacao = resultado["gravacao"]
+    if gravacao is None:
+        st.error("Nenhuma correspondência entre Excel e KML. Verifique os nomes em UNIDADE e NOME_FAZ.")
+        logger.error("Merge vazio entre Excel e KML.")
+        return df_analistas, gdf_kml, None, "Erro: Nenhuma correspondência encontrada."
+    delta = resultado["delta"]
+    st.write(f"Mudanças desde a última migração ({delta['modo']}, {delta['segundos']:.2f} s):")
+    st.dataframe(pd.DataFrame(
+        [list(delta["fazendas"].values()), list(delta["especialistas"].values())],
+        index=["Fazendas", "Especialistas"], columns=["Novos", "Alterados", "Removidos", "Iguais"],
+    ), use_container_width=True)
+    return df_analistas, gdf_kml, resultado["versao"], (
+        f"{gravacao['especialistas']} especialistas e {gravacao['fazendas']} fazendas gravados e "
+        f"{delta['vinculos_removidos']} removidos em {gravacao['segundos']:.2f} s "
+        f"({gravacao['linhas_por_segundo']:.0f} linhas/s)!"
+    )
+
+@metricas.instrumentar_cache(st.cache_resource)
+def cliente_rotas():
+    """Cliente de rotas compartilhado entre sessões, com cache persistente em disco."""
+    from raio_atuacao.rotas import CacheRotas, ClienteRotas
+
+    return ClienteRotas(cache=CacheRotas())
 
-@st.cache_data
 def get_route(start_lon, start_lat, end_lon, end_lat):
     """Obtém rota entre dois pontos usando a API OSRM."""
-    try:
-        url = f"http://router.project-osrm.org/route/v1/driving/{start_lon},{start_lat};{end_lon},{end_lat}?overview=full&geometries=geojson"
-        response = requests.get(url, timeout=5)
-        if response.status_code != 200:
-            logger.error(f"Erro na API OSRM: status {response.status_code}")
-            return None
-        routes = response.json().get("routes", [])
-        if not routes:
-            logger.error("Nenhuma rota encontrada pela API OSRM.")
-            return None
-        return [(point[1], point[0]) for point in routes[0]["geometry"]["coordinates"]]
-    except Exception as e:
-        logger.error(f"Erro ao obter rota: {e}")
-        return None
+    return cliente_rotas().rota(start_lon, start_lat, end_lon, end_lat)
 
-def criar_mapa_analistas(df_analistas, gdf_kml, gestor, especialista, mostrar_rotas):
-    """Cria mapa interativo com analistas e fazendas."""
-    if gdf_kml.empty or df_analistas.empty:
-        st.error("Dados de fazendas ou analistas vazios.")
-        logger.error("Dados de fazendas ou analistas vazios.")
-        return None
+@metricas.instrumentar_cache(st.cache_resource(max_entries=4))
+def carregar_cidades(conteudo_hash, _conteudo):
+    """Lê a camada de cidades uma vez por conteúdo e indexa os centróides."""
+    import io
+    import geopandas as gpd
+    from raio_atuacao.indice import IndicePontos, preparar_cidades
 
-    df_analistas = df_analistas.copy()
-    df_analistas["UNIDADE_normalized"] = df_analistas["UNIDADE"].apply(normalize_str)
-    gdf_kml["Longitude_Unidade"] = gdf_kml.geometry.centroid.x
-    gdf_kml["Latitude_Unidade"] = gdf_kml.geometry.centroid.y
+    cidades_gdf = preparar_cidades(gpd.read_file(io.BytesIO(_conteudo)))
+    return cidades_gdf, IndicePontos(cidades_gdf["LON_CENTROIDE"], cidades_gdf["LAT_CENTROIDE"])
 
-    df_merged = pd.merge(
-        df_analistas,
-        gdf_kml[["UNIDADE_normalized", "Latitude_Unidade", "Longitude_Unidade", "geometry", "NOME_FAZ"]],
-        on="UNIDADE_normalized",
-        how="inner"
-    )
-    if df_merged.empty:
-        st.error("Nenhuma correspondência entre analistas e fazendas.")
-        logger.error("Nenhuma correspondência entre analistas e fazendas.")
-        return None
+@metricas.instrumentar_cache(st.cache_resource(max_entries=4))
+def indice_especialistas(chave, _df_analistas):
+    """Índice espacial das cidades base dos especialistas."""
+    from raio_atuacao.indice import IndicePontos
 
-    df_merged["DISTANCIA_KM"] = df_merged.apply(
-        lambda row: haversine_m(row["LON_BASE"], row["LAT_BASE"], row["Longitude_Unidade"], row["Latitude_Unidade"]) / 1000,
-        axis=1
-    )
+    return IndicePontos(_df_analistas["LON_BASE"], _df_analistas["LAT_BASE"])
+
+@metricas.instrumentar_cache(st.cache_resource(max_entries=2))
+def carregar_dataset_preparado(versao):
+    """Carrega uma versão preparada uma única vez por processo (compartilhada entre sessões)."""
+    from raio_atuacao.preparados import carregar_preparados
+
+    return carregar_preparados(versao)
+
+@metricas.instrumentar_cache(st.cache_resource(max_entries=2))
+def base_mapa(versao, _df_analistas, _gdf_kml):
+    """Merge analistas × fazendas com distâncias e cores, uma vez por versão do dataset."""
+    from raio_atuacao.mapa import base_mapa_analistas
+
+    return base_mapa_analistas(_df_analistas, _gdf_kml)
+
+@metricas.instrumentar_cache(st.cache_resource)
+def cache_mapas():
+    """Mapas já renderizados, compartilhados entre sessões e com despejo LRU."""
+    from raio_atuacao.mapa import CacheMapas
 
-    cores = ["#E6194B", "#3CB44B", "#FFE119", "#4363D8", "#F58231", "#911EB4", "#46F0F0", "#F032E6"]
-    cor_especialista = {esp: cores[i % len(cores)] for i, esp in enumerate(df_merged["ESPECIALISTA"].unique())}
-    df_merged["COR"] = df_merged["ESPECIALISTA"].map(cor_especialista)
+    return CacheMapas()
 
-    df_filtrado = df_merged[df_merged["GESTOR"].eq(gestor) if gestor != "Todos" else slice(None)]
-    df_filtrado = df_filtrado[df_filtrado["ESPECIALISTA"].eq(especialista) if especialista != "Todos" else slice(None)]
+@metricas.instrumentar_cache(st.cache_resource)
+def carregar_malha(caminho):
+    """Grafo da malha viária offline (arrays em mmap), aberto uma vez por processo."""
+    from raio_atuacao.malha import GrafoViario
 
-    if df_filtrado.empty:
+    return GrafoViario.carregar(caminho)
+
+@metricas.instrumentar_cache(st.cache_resource(max_entries=2))
+def isocronas_especialistas(versao, caminho_malha, _base):
+    """Tempo máximo por estrada e isócrona de cada especialista, uma vez por dataset e malha."""
+    from raio_atuacao.malha import isocronas_especialistas as calcular
+
+    return calcular(carregar_malha(caminho_malha), _base)
+
+def criar_mapa_analistas(versao, df_analistas, gdf_kml, gestor, especialista, mostrar_rotas, modo_leve=False, raios_propostos=None,
+                         caminho_malha=None):
+    """(mapa renderizado com HTML e tempos, se veio do cache) para os filtros.
+
+    Sem versão do dataset (dados postos na sessão por fora) nada é guardado em
+    cache. Erros e filtros vazios viram mensagens na tela e retornam (None, False).
+    """
+    from raio_atuacao.mapa import base_mapa_analistas, chave_mapa, construir_mapa_analistas, renderizar_mapa
+
+    chave = chave_mapa(versao, gestor, especialista, mostrar_rotas, modo_leve, raios_propostos, caminho_malha)
+    renderizado = cache_mapas().obter(chave) if versao else None
+    if renderizado is not None:
+        return renderizado, True
+
+    inicio = time.perf_counter()
+    try:
+        base = base_mapa(versao, df_analistas, gdf_kml) if versao else base_mapa_analistas(df_analistas, gdf_kml)
+        isocronas = None
+        if caminho_malha:
+            from raio_atuacao.malha import isocronas_especialistas as calcular_isocronas
+
+            with st.spinner("Calculando isócronas pela malha viária..."):
+                isocronas = (isocronas_especialistas(versao, caminho_malha, base) if versao
+                             else calcular_isocronas(carregar_malha(caminho_malha), base))
+        with metricas.span("mapa.construir", modo="leve" if modo_leve else "completo"):
+            mapa = construir_mapa_analistas(
+                df_analistas, gdf_kml, gestor, especialista,
+                cliente_rotas().rotas_em_lote if mostrar_rotas else None, modo_leve, raios_propostos,
+                base=base, isocronas=isocronas
+            )
+    except ValueError as e:
+        st.error(str(e))
+        logger.error(str(e))
+        return None, False
+    if mapa is None:
         st.warning("Nenhum resultado para os filtros selecionados.")
         logger.warning("Nenhum resultado para os filtros selecionados.")
+        return None, False
+    tempo_construcao = time.perf_counter() - inicio
+    with metricas.span("mapa.serializar") as registro:
+        html, tempo_render = renderizar_mapa(mapa)
+        registro["bytes"] = len(html)
+    if not versao:
+        return {"html": html, "bytes": len(html.encode("utf-8")), "construcao_s": tempo_construcao, "render_s": tempo_render}, False
+    return cache_mapas().gravar(chave, html, construcao_s=tempo_construcao, render_s=tempo_render), False
+
+@metricas.instrumentar_cache(st.cache_resource(max_entries=8))
+def grade_hexagonal(versao, gestor, especialista, _base, _gdf_kml):
+    """Grade hexagonal com os agregados de todas as resoluções, uma vez por dataset e filtro."""
+    from raio_atuacao.hexagonos import GradeHexagonal
+    from raio_atuacao.mapa import filtrar_base
+
+    return GradeHexagonal(filtrar_base(_base, gestor, especialista), _gdf_kml)
+
+def grade_densidade(versao, df_analistas, gdf_kml, gestor, especialista):
+    """GradeHexagonal dos filtros, ou None (com a mensagem na tela) se não houver dados."""
+    from raio_atuacao.hexagonos import GradeHexagonal
+    from raio_atuacao.mapa import base_mapa_analistas, filtrar_base
+
+    try:
+        if versao:
+            return grade_hexagonal(versao, gestor, especialista, base_mapa(versao, df_analistas, gdf_kml), gdf_kml)
+        return GradeHexagonal(filtrar_base(base_mapa_analistas(df_analistas, gdf_kml), gestor, especialista), gdf_kml)
+    except ValueError as e:
+        st.error(str(e))
+        logger.error(str(e))
         return None
 
-    mapa = folium.Map(location=[df_filtrado["Latitude_Unidade"].mean(), df_filtrado["Longitude_Unidade"].mean()], zoom_start=7, tiles="openstreetmap")
-    colaboradores_cluster = MarkerCluster(name="Colaboradores").add_to(mapa)
-    fazendas_group = folium.FeatureGroup(name="Fazendas").add_to(mapa)
-    rotas_group = folium.FeatureGroup(name="Rotas").add_to(mapa)
+def criar_mapa_densidade(versao, grade, gestor, especialista, recorte=None):
+    """(mapa de densidade renderizado com HTML e tempos, se veio do cache), guardado em cache_mapas como os demais."""
+    from raio_atuacao.mapa import construir_mapa_densidade, renderizar_mapa
 
-    popup_css = """
-    <style>
-        .leaflet-popup-content { font-family: Arial, sans-serif; font-size: 14px; padding: 10px; }
-        .leaflet-popup-content b { color: #00497a; }
-    </style>
-    """
-    mapa.get_root().html.add_child(folium.Element(popup_css))
-
-    for _, row in df_filtrado.groupby(["ESPECIALISTA", "CIDADE_BASE", "LAT_BASE", "LON_BASE", "COR"]).agg(
-        RAIO_MAXIMO_KM=("DISTANCIA_KM", "max"),
-        DIST_MEDIA_KM=("DISTANCIA_KM", "mean"),
-        UNIDADES=("UNIDADE", lambda x: list(x.unique()))
-    ).reset_index().iterrows():
-        popup_html = (
-            f"<b>Especialista:</b> {row['ESPECIALISTA'].title()}<br>"
-            f"<b>Cidade Base:</b> {row['CIDADE_BASE'].title()}<br>"
-            f"<b>Raio Máximo:</b> {row['RAIO_MAXIMO_KM']:.1f} km<br>"
-            f"<b>Distância Média:</b> {row['DIST_MEDIA_KM']:.1f} km<br>"
-            f"<b>Unidades:</b> {', '.join(row['UNIDADES'][:5]) + ('...' if len(row['UNIDADES']) > 5 else '')}"
-        )
-        folium.Circle(
-            location=[row["LAT_BASE"], row["LON_BASE"]],
-            radius=row["RAIO_MAXIMO_KM"] * 1000,
-            color=row["COR"],
-            fill=True,
-            fill_opacity=0.15
-        ).add_to(mapa)
-        folium.Marker(
-            location=[row["LAT_BASE"], row["LON_BASE"]],
-            popup=folium.Popup(popup_html, max_width=300),
-            icon=folium.Icon(color="white", icon_color=row["COR"], icon="user", prefix="fa")
-        ).add_to(colaboradores_cluster)
-
-    for _, row in df_filtrado.iterrows():
-        if isinstance(row["geometry"], (Polygon, MultiPolygon)):
-            coords = [list(row["geometry"].exterior.coords)] if isinstance(row["geometry"], Polygon) else [list(poly.exterior.coords) for poly in row["geometry"].geoms]
-            for coord in coords:
-                folium.Polygon(
-                    locations=[(lat, lon) for lon, lat in coord],
-                    color=row["COR"],
-                    fill=True,
-                    fill_opacity=0.3,
-                    popup=f"<b>Fazenda:</b> {row['NOME_FAZ'].title()}<br><b>Atendida por:</b> {row['ESPECIALISTA'].title()}"
-                ).add_to(fazendas_group)
-
-        popup_html = (
-            f"<b>Fazenda:</b> {row['NOME_FAZ'].title()}<br>"
-            f"<b>Cidade:</b> {row['CIDADE_BASE'].title()}<br>"
-            f"<b>Especialista:</b> {row['ESPECIALISTA'].title()}<br>"
-            f"<b>Distância:</b> {row['DISTANCIA_KM']:.1f} km"
-        )
-        folium.Marker(
-            location=[row["Latitude_Unidade"], row["Longitude_Unidade"]],
-            popup=folium.Popup(popup_html, max_width=300),
-            icon=folium.Icon(color="white", icon_color=row["COR"], icon="home", prefix="fa")
-        ).add_to(fazendas_group)
-
-        if mostrar_rotas:
-            route = get_route(row["LON_BASE"], row["LAT_BASE"], row["Longitude_Unidade"], row["Latitude_Unidade"])
-            if route:
-                folium.PolyLine(route, color=row["COR"], weight=2.5).add_to(rotas_group)
-
-    legenda_html = '<div style="position: fixed; bottom: 10px; left: 10px; background: white; padding: 10px; border-radius: 8px;">' \
-                   '<b>Legenda</b><br>' + \
-                   ''.join(f'<i class="fa fa-circle" style="color:{cor}"></i> {esp.title()}<br>' for esp, cor in cor_especialista.items() if esp in df_filtrado["ESPECIALISTA"].unique()) + \
-                   '</div>'
-    mapa.get_root().html.add_child(folium.Element(legenda_html))
-    folium.LayerControl().add_to(mapa)
-    return mapa
+    chave = ("densidade", versao, gestor, especialista, recorte)
+    renderizado = cache_mapas().obter(chave) if versao else None
+    if renderizado is not None:
+        return renderizado, True
+
+    inicio = time.perf_counter()
+    with metricas.span("mapa.construir", modo="densidade"):
+        mapa = construir_mapa_densidade(grade, recorte)
+    if mapa is None:
+        st.warning("Nenhum resultado para os filtros selecionados.")
+        logger.warning("Nenhum resultado para os filtros selecionados.")
+        return None, False
+    tempo_construcao = time.perf_counter() - inicio
+    with metricas.span("mapa.serializar") as registro:
+        html, tempo_render = renderizar_mapa(mapa)
+        registro["bytes"] = len(html)
+    if not versao:
+        return {"html": html, "bytes": len(html.encode("utf-8")), "construcao_s": tempo_construcao, "render_s": tempo_render}, False
+    return cache_mapas().gravar(chave, html, construcao_s=tempo_construcao, render_s=tempo_render), False
 
 # Título
 st.title("📍 Raio de Atuação dos Analistas")
@@ -394,20 +299,43 @@ st.markdown("Visualize o raio de atuação de analistas, fazendas e cidades pró
 # Abas
 tab1, tab2, tab3 = st.tabs(["📤 Upload e Migração", "🗺️ Mapa de Analistas", "🏙️ Cidades Próximas"])
 
+# Sessões novas abrem com o último dataset preparado, sem novo upload
+if 'df_analistas' not in st.session_state:
+    versao = versao_atual()
+    preparados = carregar_dataset_preparado(versao) if versao else None
+    if preparados is not None:
+        st.session_state['df_analistas'], st.session_state['gdf_kml'] = preparados
+        st.session_state['versao_dataset'] = versao
+        logger.info(f"Dataset preparado {versao[:12]} carregado.")
+
 # Aba 1: Upload e Migração
 with tab1:
     st.header("📤 Upload e Migração de Dados")
-    kml_file = st.file_uploader("📍 Arquivo KML", type=["kml"], key="kml_upload")
+    kml_files = st.file_uploader(
+        "📍 Arquivos KML/KMZ (ou .zip com vários)", type=["kml", "kmz", "zip"], key="kml_upload",
+        accept_multiple_files=True, help="Fazendas repetidas entre arquivos são unidas numa só unidade."
+    )
     xlsx_file = st.file_uploader("📊 Arquivo Excel", type=["xlsx"], key="xlsx_upload")
+    limiar_correspondencia = st.slider(
+        "🔤 Similaridade mínima entre UNIDADE e NOME_FAZ (%)", 70, 100, LIMIAR_PADRAO,
+        help="Nomes com acentos ou erros de digitação são casados quando a similaridade atinge este valor."
+    )
     if st.button("🚀 Migrar Dados"):
-        if kml_file and xlsx_file:
+        if kml_files and xlsx_file:
             with st.spinner("Migrando dados..."):
                 result = criar_banco()
                 st.success(result)
-                df_analistas, gdf_kml, msg = migrar(kml_file, xlsx_file)
+                df_analistas, gdf_kml, versao, msg = migrar(kml_files, xlsx_file, limiar_correspondencia)
                 if df_analistas is not None:
                     st.session_state['df_analistas'] = df_analistas
                     st.session_state['gdf_kml'] = gdf_kml
+                    # Sem versão salva os caches por versão não valem: os mapas são montados sem cache
+                    if versao:
+                        st.session_state['versao_dataset'] = versao
+                    else:
+                        st.session_state.pop('versao_dataset', None)
+                    st.session_state.pop('atribuicao', None)
+                    st.session_state.pop('cidades_lote', None)
                     st.success(msg)
         else:
             st.error("Faça upload dos arquivos KML e Excel.")
@@ -416,20 +344,107 @@ with tab1:
 with tab2:
     st.header("🗺️ Mapa de Analistas")
     if 'df_analistas' in st.session_state and 'gdf_kml' in st.session_state:
+        import streamlit.components.v1 as components
+        from raio_atuacao.mapa import LIMITE_MODO_LEVE
+
         df_analistas = st.session_state['df_analistas']
         gdf_kml = st.session_state['gdf_kml']
         col1, col2, col3 = st.columns(3)
         with col1:
-            gestores = ["Todos"] + sorted(df_analistas["GESTOR"].apply(normalize_str).unique())
+            gestores = ["Todos"] + sorted(normalizar_serie(df_analistas["GESTOR"]).unique())
             gestor = st.selectbox("Gestor", gestores, format_func=lambda x: x.title())
         with col2:
-            especialistas = ["Todos"] + sorted(df_analistas["ESPECIALISTA"].apply(normalize_str).unique())
+            especialistas = ["Todos"] + sorted(normalizar_serie(df_analistas["ESPECIALISTA"]).unique())
             especialista = st.selectbox("Especialista", especialistas, format_func=lambda x: x.title())
         with col3:
             mostrar_rotas = st.checkbox("Mostrar Rotas")
-        mapa = criar_mapa_analistas(df_analistas, gdf_kml, gestor, especialista, mostrar_rotas)
-        if mapa:
-            st_folium(mapa, height=600, use_container_width=True)
+            caminho_malha = os.environ.get("RAIO_MALHA")
+            mostrar_isocronas = bool(caminho_malha) and st.checkbox(
+                "Isócronas", help="Área alcançável por estrada no tempo máximo de cada especialista (malha viária offline)."
+            )
+            modo_leve = st.checkbox("Modo Leve", value=len(gdf_kml) > LIMITE_MODO_LEVE,
+                                    help="Uma camada GeoJSON simplificada e marcadores agrupados no navegador, para muitas fazendas.")
+            densidade = st.checkbox("Densidade", help="Fazendas, área, distâncias e carga dos especialistas agregadas em hexágonos.")
+        with st.expander("⚖️ Atribuição Otimizada"):
+            n_fazendas = df_analistas["UNIDADE_normalized"].nunique()
+            n_especialistas = max(1, df_analistas["ESPECIALISTA"].nunique())
+            col_cap, col_raio = st.columns(2)
+            with col_cap:
+                capacidade = st.number_input("Máximo de fazendas por especialista", min_value=1,
+                                             value=math.ceil(1.2 * n_fazendas / n_especialistas))
+            with col_raio:
+                raio_max = st.number_input("Raio máximo (km, 0 = sem limite)", min_value=0, value=0, step=50)
+            if st.button("Calcular Atribuição"):
+                from raio_atuacao.atribuicao import propor_atribuicao
+                from raio_atuacao.preparados import adicionar_centroides
+
+                with st.spinner("Otimizando atribuição..."):
+                    gdf_centroides = gdf_kml if "Longitude_Unidade" in gdf_kml else adicionar_centroides(gdf_kml)
+                    st.session_state['atribuicao'] = propor_atribuicao(
+                        df_analistas, gdf_centroides, int(capacidade), raio_max or None
+                    )
+            if 'atribuicao' in st.session_state:
+                fazendas_atrib, resumo_atrib = st.session_state['atribuicao']
+                sem_especialista = fazendas_atrib["ESPECIALISTA_PROPOSTO"].isna().sum()
+                # Só fazendas com distância nas duas atribuições entram na comparação dos totais
+                comparaveis = fazendas_atrib[["DISTANCIA_ATUAL_KM", "DISTANCIA_PROPOSTA_KM"]].dropna()
+                total_atual, total_proposto = comparaveis.sum()
+                diferenca = total_proposto - total_atual
+                st.caption(
+                    f"Distância total nas {len(comparaveis)} fazendas atribuídas nas duas: {total_atual:,.0f} km atual, "
+                    f"{total_proposto:,.0f} km proposta ({abs(diferenca):,.0f} km a {'mais' if diferenca > 0 else 'menos'}); "
+                    f"{sem_especialista} fazendas sem especialista no raio/capacidade, fora dos totais."
+                )
+                st.dataframe(resumo_atrib, use_container_width=True)
+                st.download_button(
+                    label="📥 Baixar Atribuição (CSV)",
+                    data=fazendas_atrib.to_csv(index=False),
+                    file_name="atribuicao_proposta.csv",
+                    mime="text/csv"
+                )
+        raios_propostos = None
+        if 'atribuicao' in st.session_state:
+            raios_propostos = st.session_state['atribuicao'][1].set_index("ESPECIALISTA")["RAIO_PROPOSTO_KM"]
+        inicio = time.perf_counter()
+        versao = st.session_state.get('versao_dataset')
+        if densidade:
+            from raio_atuacao.hexagonos import RESOLUCOES, centros_hexagonos
+
+            nome_modo = "densidade"
+            renderizado, em_cache = None, False
+            grade = grade_densidade(versao, df_analistas, gdf_kml, gestor, especialista)
+            if grade is not None:
+                # Detalhamento sob demanda: as resoluções finas de um hexágono da resolução mais grossa
+                regioes = grade.agregados[grade.agregados["RESOLUCAO"] == RESOLUCOES[0][0]].sort_values("FAZENDAS", ascending=False)
+                lon_regioes, lat_regioes = centros_hexagonos(regioes["HEXAGONO"], RESOLUCOES[0][1])
+                rotulos = {
+                    hexagono: f"{fazendas} fazendas, {especialistas_hex} especialistas ({lat:.1f}, {lon:.1f})"
+                    for hexagono, fazendas, especialistas_hex, lon, lat in zip(
+                        regioes["HEXAGONO"], regioes["FAZENDAS"], regioes["ESPECIALISTAS"], lon_regioes, lat_regioes
+                    )
+                }
+                regiao = st.selectbox("🔎 Detalhar região", [None] + list(rotulos),
+                                      format_func=lambda h: "Todas (visão geral)" if h is None else rotulos[h])
+                renderizado, em_cache = criar_mapa_densidade(
+                    versao, grade, gestor, especialista, None if regiao is None else (RESOLUCOES[0][0], regiao)
+                )
+        else:
+            nome_modo = "leve" if modo_leve else "completo"
+            renderizado, em_cache = criar_mapa_analistas(
+                versao, df_analistas, gdf_kml, gestor, especialista,
+                mostrar_rotas, modo_leve, raios_propostos, caminho_malha if mostrar_isocronas else None
+            )
+        if renderizado:
+            with metricas.span("mapa.exibir", bytes=renderizado["bytes"]):
+                components.html(renderizado["html"], height=600)
+            tempo_total = time.perf_counter() - inicio
+            st.caption(
+                f"Modo {nome_modo}: mapa construído em {renderizado['construcao_s']:.2f} s, "
+                f"HTML de {renderizado['bytes'] / 1e6:.2f} MB renderizado em {renderizado['render_s']:.2f} s"
+                f"{' (em cache)' if em_cache else ''}; exibido em {tempo_total:.2f} s."
+            )
+            logger.info(f"Mapa ({nome_modo}): {renderizado['bytes']} bytes, construção {renderizado['construcao_s']:.2f} s, "
+                        f"render {renderizado['render_s']:.2f} s, exibido em {tempo_total:.2f} s")
     else:
         st.info("Faça upload e migração na Aba 1 para visualizar o mapa.")
 
@@ -439,9 +454,46 @@ with tab3:
     debug_mode = st.checkbox("Modo Depuração", value=False)
     geojson_file = st.file_uploader("🌎 GeoJSON de Cidades", type=["geojson"])
     if 'df_analistas' in st.session_state and 'gdf_kml' in st.session_state and geojson_file:
+        import folium
+        from streamlit_folium import st_folium
+        from raio_atuacao.cidades import N_PADRAO, UF_MAP, exportar_cidades_proximas
+        from raio_atuacao.distancia import haversine_m
+        from raio_atuacao.preparados import adicionar_centroides
+        from raio_atuacao.projecao import WGS84, transformar
+
         df_analistas = st.session_state['df_analistas']
         gdf_kml = st.session_state['gdf_kml']
-        cidades_gdf = gpd.read_file(geojson_file)
+        conteudo = geojson_file.getvalue()
+        hash_cidades = hashlib.sha256(conteudo).hexdigest()
+        cidades_gdf, indice_cidades = carregar_cidades(hash_cidades, conteudo)
+
+        with st.expander("📑 Cidades Próximas de Todas as Fazendas"):
+            col_n, col_raio, col_formato = st.columns(3)
+            with col_n:
+                n_cidades = st.number_input("Cidades mais próximas por fazenda", 1, 50, N_PADRAO)
+            with col_raio:
+                raio_lote_km = st.number_input("E todas a até (km)", 0, 500, 50, step=5)
+            with col_formato:
+                formato_lote = st.selectbox("Formato", ["csv", "parquet"])
+            if st.button("Gerar Tabela de Todas as Fazendas"):
+                with st.spinner(f"Calculando cidades próximas de {len(gdf_kml)} fazendas..."):
+                    with tempfile.TemporaryDirectory() as pasta:
+                        caminho = os.path.join(pasta, f"cidades_proximas.{formato_lote}")
+                        with metricas.span("cidades.lote", linhas=len(gdf_kml)) as registro:
+                            registro["linhas_saida"] = exportar_cidades_proximas(
+                                gdf_kml, cidades_gdf, caminho, formato_lote, n=int(n_cidades), raio_km=raio_lote_km
+                            )
+                        with open(caminho, "rb") as f:
+                            st.session_state['cidades_lote'] = (hash_cidades, f.read(), formato_lote, registro["linhas_saida"])
+            # Só oferece a tabela gerada para o GeoJSON carregado agora
+            if st.session_state.get('cidades_lote', (None,))[0] == hash_cidades:
+                _, dados_lote, formato_salvo, linhas_lote = st.session_state['cidades_lote']
+                st.download_button(
+                    label=f"📥 Baixar Tabela ({linhas_lote} linhas, {formato_salvo.upper()})",
+                    data=dados_lote,
+                    file_name=f"cidades_proximas.{formato_salvo}",
+                    mime="text/csv" if formato_salvo == "csv" else "application/octet-stream"
+                )
 
         if debug_mode:
             st.write("Colunas em cidades_gdf:", cidades_gdf.columns.tolist())
@@ -459,36 +511,47 @@ with tab3:
                 st.write("UNIDADE_normalized em gdf_kml:", gdf_kml["UNIDADE_normalized"].unique().tolist())
             st.stop()
 
-        fazenda_geom = selected_fazenda.geometry.iloc[0]
-        centroid_4326 = selected_fazenda.to_crs("EPSG:4326").geometry.centroid.iloc[0]
-        fazenda_lat, fazenda_lon = centroid_4326.y, centroid_4326.x
+        # Geometria na zona UTM da própria fazenda e em graus, materializadas uma vez por dataset
+        if "ZONA_UTM" not in selected_fazenda:
+            selected_fazenda = adicionar_centroides(selected_fazenda)
+        fazenda_geom = selected_fazenda["geometry_utm"].iloc[0]
+        fazenda_crs = int(selected_fazenda["ZONA_UTM"].iloc[0])
+        fazenda_lat, fazenda_lon = selected_fazenda["Latitude_Unidade"].iloc[0], selected_fazenda["Longitude_Unidade"].iloc[0]
 
         buffer_km = st.slider("📏 Raio de Busca (km)", 10, 100, 50, step=5)
         buffer_projected = fazenda_geom.buffer(buffer_km * 1000)
-        buffer_4326 = gpd.GeoSeries([buffer_projected], crs=gdf_kml.crs).to_crs("EPSG:4326").iloc[0]
+        buffer_4326 = transformar([buffer_projected], fazenda_crs, WGS84)[0]
 
-        cidades_proximas = cidades_gdf.to_crs("EPSG:4326")[cidades_gdf.geometry.centroid.within(buffer_4326)]
-        especialistas_gdf = gpd.GeoDataFrame(df_analistas, geometry=gpd.points_from_xy(df_analistas["LON_BASE"], df_analistas["LAT_BASE"]), crs="EPSG:4326")
-        especialistas_proximos = especialistas_gdf[
-            (especialistas_gdf["UNIDADE_normalized"] == fazenda_norm) & (especialistas_gdf.geometry.within(buffer_4326))
-        ]
+        # Pré-filtro por bbox no índice e checagem exata da distância à fazenda
+        with metricas.span("cidades.consulta", raio_km=buffer_km) as registro:
+            cidades_proximas = cidades_gdf.iloc[indice_cidades.perto_da_geometria(fazenda_geom, fazenda_crs, buffer_km)]
+            indice_esp = indice_especialistas(pd.util.hash_pandas_object(df_analistas[["LON_BASE", "LAT_BASE"]]).sum(), df_analistas)
+            especialistas_proximos = df_analistas.iloc[indice_esp.perto_da_geometria(fazenda_geom, fazenda_crs, buffer_km)]
+            especialistas_proximos = especialistas_proximos[especialistas_proximos["UNIDADE_normalized"] == fazenda_norm]
+            registro["linhas"] = len(cidades_proximas) + len(especialistas_proximos)
 
         if debug_mode:
             st.write(f"Cidades próximas: {len(cidades_proximas)}")
             st.write(f"Especialistas próximos: {len(especialistas_proximos)}")
 
         mapa = folium.Map(location=[fazenda_lat, fazenda_lon], zoom_start=9, tiles="cartodbpositron")
-        folium.GeoJson(selected_fazenda.to_crs("EPSG:4326").geometry, style_function=lambda x: {"color": "green", "fillOpacity": 0.15}, name="Fazenda").add_to(mapa)
+        folium.GeoJson(selected_fazenda["geometry_4326"].iloc[0], style_function=lambda x: {"color": "green", "fillOpacity": 0.15}, name="Fazenda").add_to(mapa)
         folium.GeoJson(buffer_4326, style_function=lambda x: {"color": "blue", "fillOpacity": 0.1}, name="Raio").add_to(mapa)
 
+        # Distâncias calculadas de uma vez para todas as cidades e especialistas do raio
+        lon_cidades, lat_cidades = cidades_proximas["LON_CENTROIDE"].to_numpy(), cidades_proximas["LAT_CENTROIDE"].to_numpy()
+        dist_cidades_km = haversine_m(fazenda_lon, fazenda_lat, lon_cidades, lat_cidades) / 1000
+        dist_especialistas_km = haversine_m(
+            fazenda_lon, fazenda_lat, especialistas_proximos["LON_BASE"].to_numpy(), especialistas_proximos["LAT_BASE"].to_numpy()
+        ) / 1000
+
         tabela_dados = []
-        for idx, cidade in cidades_proximas.iterrows():
+        for (idx, cidade), lon_cidade, lat_cidade, distancia_km in zip(cidades_proximas.iterrows(), lon_cidades, lat_cidades, dist_cidades_km):
             cidade_nome = cidade.get("nome", "Desconhecida")
             geocodigo = str(cidade.get("geocodigo", ""))
             cidade_uf = UF_MAP.get(geocodigo[:2], "Desconhecida")
-            distancia_km = haversine_m(fazenda_lon, fazenda_lat, cidade.geometry.centroid.x, cidade.geometry.centroid.y) / 1000
             folium.Marker(
-                [cidade.geometry.centroid.y, cidade.geometry.centroid.x],
+                [lat_cidade, lon_cidade],
                 popup=f"<b>Cidade:</b> {cidade_nome} ({cidade_uf})<br><b>Distância:</b> {distancia_km:.1f} km",
                 icon=folium.Icon(color="blue", icon="star" if idx == cidades_proximas.index[0] else "circle", prefix="fa")
             ).add_to(mapa)
@@ -500,10 +563,9 @@ with tab3:
                 "Tipo": "Cidade Próxima"
             })
 
-        for _, esp in especialistas_proximos.iterrows():
-            distancia_km = haversine_m(fazenda_lon, fazenda_lat, esp.geometry.x, esp.geometry.y) / 1000
+        for (_, esp), distancia_km in zip(especialistas_proximos.iterrows(), dist_especialistas_km):
             folium.Marker(
-                [esp.geometry.y, esp.geometry.x],
+                [esp["LAT_BASE"], esp["LON_BASE"]],
                 popup=f"<b>Especialista:</b> {esp['ESPECIALISTA'].title()}<br><b>Gestor:</b> {esp['GESTOR'].title()}<br><b>Cidade:</b> {esp['CIDADE_BASE'].title()}<br><b>Distância:</b> {distancia_km:.1f} km",
                 icon=folium.Icon(color="red" if distancia_km > 200 else "purple", icon="user", prefix="fa")
             ).add_to(mapa)
@@ -516,7 +578,8 @@ with tab3:
             })
 
         folium.LayerControl().add_to(mapa)
-        st_folium(mapa, height=500, use_container_width=True)
+        with metricas.span("cidades.st_folium"):
+            st_folium(mapa, height=500, use_container_width=True)
 
         if tabela_dados:
             df_tabela = pd.DataFrame(tabela_dados)
@@ -531,3 +594,21 @@ with tab3:
             st.info("Nenhuma cidade ou especialista encontrado no raio informado.")
     else:
         st.info("Faça upload dos arquivos e migração na Aba 1.")
+
+    if debug_mode:
+        with st.expander("⏱️ Desempenho", expanded=True):
+            spans_execucao = metricas.spans(metricas.execucao_atual())
+            if spans_execucao:
+                df_spans = pd.DataFrame(spans_execucao).drop(columns=["evento", "execucao", "inicio"])
+                st.write(f"Etapas desta execução: {df_spans.loc[df_spans['pai'].isna(), 'segundos'].sum():.2f} s no total")
+                st.dataframe(df_spans, use_container_width=True)
+            contadores = metricas.caches()
+            if contadores:
+                st.write("Caches (desde o início do processo):")
+                st.dataframe(pd.DataFrame.from_dict(contadores, orient="index"), use_container_width=True)
+            st.download_button(
+                label="📥 Baixar Métricas (JSON)",
+                data=json.dumps({"spans": metricas.spans(), "caches": contadores}, ensure_ascii=False, default=str),
+                file_name="metricas.json",
+                mime="application/json"
+            )
@@ -0,0 +1,52 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from raio_atuacao.atribuicao import SEM_ATRIBUICAO, transporte_min_custo
+
+
+def custo_total(indices, custos, penalidade, escolha):
+    return sum(penalidade if c == len(indices[i]) else custos[i, c] for i, c in enumerate(escolha))
+
+
+def forca_bruta(indices, custos, capacidade, penalidade):
+    """Menor custo total testando, para cada fazenda, cada candidato ou nenhum."""
+    melhor = np.inf
+    for escolha in itertools.product(range(indices.shape[1] + 1), repeat=indices.shape[0]):
+        carga = np.zeros(len(capacidade), dtype=int)
+        for i, c in enumerate(escolha):
+            if c < indices.shape[1]:
+                carga[indices[i, c]] += 1
+        if (carga <= capacidade).all():
+            melhor = min(melhor, custo_total(indices, custos, penalidade, escolha))
+    return melhor
+
+
+@pytest.mark.parametrize("inteiros", [False, True])
+@pytest.mark.parametrize("seed", range(10))
+def test_transporte_igual_a_forca_bruta(seed, inteiros):
+    rng = np.random.default_rng(seed)
+    n_faz, n_esp, k = 7, 4, 3
+    indices = np.array([rng.choice(n_esp, k, replace=False) for _ in range(n_faz)])
+    # Custos inteiros produzem empates (ex.: centróides coincidentes)
+    custos = rng.integers(1, 8, (n_faz, k)).astype(float) if inteiros else rng.uniform(1, 100, (n_faz, k))
+    custos[rng.random((n_faz, k)) < 0.15] = np.inf
+    capacidade = rng.integers(0, 4, n_esp)
+    penalidade = 150.0
+
+    classe, _ = transporte_min_custo(indices, custos, capacidade, penalidade)
+
+    assert (np.bincount(classe[classe != SEM_ATRIBUICAO], minlength=n_esp) <= capacidade).all()
+    escolha = [k if c == SEM_ATRIBUICAO else int(np.flatnonzero(indices[i] == c)[0]) for i, c in enumerate(classe)]
+    assert custo_total(indices, custos, penalidade, escolha) == pytest.approx(
+        forca_bruta(indices, custos, capacidade, penalidade))
+
+
+def test_empate_nao_esvazia_especialista():
+    indices = np.array([[0], [0], [1], [1], [1], [0], [0]])
+    custos = np.array([[5.0], [5.0], [2.0], [8.0], [2.0], [5.0], [6.0]])
+    classe, _ = transporte_min_custo(indices, custos, np.array([3, 1]), 100.0)
+    escolha = [1 if c == SEM_ATRIBUICAO else 0 for c in classe]
+    assert custo_total(indices, custos, 100.0, escolha) == pytest.approx(317.0)
+    assert (classe == 1).sum() == 1
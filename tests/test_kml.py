@@ -0,0 +1,19 @@
+import gc
+import warnings
+
+import pytest
+
+from raio_atuacao.kml import ler_kml
+from sinteticos import gerar_kml
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnraisableExceptionWarning")
+@pytest.mark.parametrize("kmz", [False, True])
+def test_ler_kml_de_caminho_fecha_o_arquivo(tmp_path, kmz):
+    caminho = tmp_path / ("fazendas.kmz" if kmz else "fazendas.kml")
+    caminho.write_bytes(gerar_kml(20, kmz=kmz))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", ResourceWarning)
+        gdf = ler_kml(str(caminho))
+        gc.collect()
+    assert len(gdf) == 20
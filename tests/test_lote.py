@@ -0,0 +1,33 @@
+import os
+
+import pandas as pd
+
+from raio_atuacao.lote import processar
+from sinteticos import gerar_analistas, gerar_kml
+
+
+def test_snapshot_com_erro_nao_derruba_o_lote(tmp_path):
+    snapshots = {}
+    for nome in ("2016-01", "2016-02", "2016-03"):
+        pasta = tmp_path / "historico" / nome
+        pasta.mkdir(parents=True)
+        df = gerar_analistas(50)
+        kml = gerar_kml(50)
+        if nome == "2016-02":
+            df = df.drop(columns="GESTOR")
+        if nome == "2016-03":
+            kml = b""
+        (pasta / "fazendas.kml").write_bytes(kml)
+        df.to_excel(pasta / "analistas.xlsx", index=False)
+        snapshots[nome] = (str(pasta / "fazendas.kml"), str(pasta / "analistas.xlsx"))
+
+    saida = tmp_path / "relatorios"
+    resumo = processar(snapshots, str(saida), processos=1).set_index("snapshot")
+
+    assert list(resumo.index) == ["2016-01", "2016-02", "2016-03"]
+    assert pd.isna(resumo.loc["2016-01", "erro"]) and resumo.loc["2016-01", "fazendas"] == 50
+    assert "GESTOR" in resumo.loc["2016-02", "erro"]
+    assert pd.notna(resumo.loc["2016-03", "erro"])
+    assert os.path.exists(saida / "2016-01" / "fazendas.csv")
+    assert not os.path.exists(saida / "2016-02")
+    assert pd.read_csv(saida / "resumo.csv")["erro"].notna().sum() == 2
@@ -0,0 +1,96 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from raio_atuacao.malha import GrafoViario, isocronas_especialistas, tempos_ate_fazendas
+from sinteticos import CAIXA, gerar_malha
+
+
+@pytest.fixture(scope="module")
+def grafo():
+    return GrafoViario.de_linhas(gerar_malha(20))
+
+
+def test_mais_proximos_sem_coordenadas(grafo):
+    nos, distancia = grafo.mais_proximos([CAIXA[0], np.nan], [CAIXA[1], CAIXA[1]])
+    assert nos[0] >= 0 and np.isfinite(distancia[0])
+    assert nos[1] == -1 and np.isnan(distancia[1])
+
+
+def test_tempo_inicial_nao_finito(grafo):
+    with pytest.raises(ValueError):
+        grafo.tempos_a_partir([0], [np.nan])
+    with pytest.raises(ValueError):
+        grafo.tempos_a_partir([-1])
+
+
+def test_base_sem_coordenadas(grafo):
+    lon, lat = (CAIXA[0] + CAIXA[2]) / 2, (CAIXA[1] + CAIXA[3]) / 2
+    minutos = tempos_ate_fazendas(grafo, [lon, np.nan, lon], [lat, np.nan, lat], [lon, lon, np.nan], [lat, lat, lat])
+    assert np.isfinite(minutos[0]) and np.isnan(minutos[1:]).all()
+
+    fazendas = pd.DataFrame({
+        "ESPECIALISTA": ["A", "B"], "LON_BASE": [lon, np.nan], "LAT_BASE": [lat, np.nan],
+        "Longitude_Unidade": [lon + 0.01, lon], "Latitude_Unidade": [lat, lat],
+        "DISTANCIA_KM": [1.0, 1.0],
+    })
+    assert list(isocronas_especialistas(grafo, fazendas)) == ["A"]
+
+
+def test_isocronas_especialistas_tempo_maximo(grafo):
+    rng = np.random.default_rng(0)
+    lon_base, lat_base = rng.uniform(CAIXA[0], CAIXA[2], 3), rng.uniform(CAIXA[1], CAIXA[3], 3)
+    fazendas = pd.DataFrame({
+        "ESPECIALISTA": np.repeat(["A", "B", "C"], 5), "LON_BASE": np.repeat(lon_base, 5), "LAT_BASE": np.repeat(lat_base, 5),
+        "Longitude_Unidade": rng.uniform(CAIXA[0], CAIXA[2], 15), "Latitude_Unidade": rng.uniform(CAIXA[1], CAIXA[3], 15),
+    })
+    minutos = tempos_ate_fazendas(grafo, fazendas["LON_BASE"], fazendas["LAT_BASE"],
+                                  fazendas["Longitude_Unidade"], fazendas["Latitude_Unidade"])
+    esperado = pd.Series(minutos).groupby(fazendas["ESPECIALISTA"]).max()
+    resultado = isocronas_especialistas(grafo, fazendas)
+    assert {nome: tempo for nome, (_, tempo) in resultado.items()} == pytest.approx(esperado.to_dict())
+
+
+def dijkstra(grafo, origem, inicial=0.0, limite_s=np.inf):
+    dist = np.full(len(grafo), np.inf)
+    dist[origem] = inicial
+    fila = [(inicial, origem)]
+    while fila:
+        d, no = heapq.heappop(fila)
+        if d > dist[no]:
+            continue
+        for aresta in range(grafo.indptr[no], grafo.indptr[no + 1]):
+            vizinho, novo = grafo.destinos[aresta], d + float(grafo.tempos[aresta])
+            if novo <= limite_s and novo < dist[vizinho]:
+                dist[vizinho] = novo
+                heapq.heappush(fila, (novo, vizinho))
+    return dist
+
+
+@pytest.mark.parametrize("limite_s", [None, 1800.0])
+def test_tempos_a_partir_igual_a_dijkstra(grafo, limite_s):
+    rng = np.random.default_rng(1)
+    origens = rng.choice(len(grafo), 5, replace=False)
+    iniciais = rng.uniform(0, 300, 5)
+    dist = grafo.tempos_a_partir(origens, iniciais, limite_s, delta_s=120.0)
+    for coluna, (origem, inicial) in enumerate(zip(origens, iniciais)):
+        esperado = dijkstra(grafo, origem, inicial, np.inf if limite_s is None else limite_s)
+        np.testing.assert_array_equal(np.isinf(dist[:, coluna]), np.isinf(esperado))
+        finitos = np.isfinite(esperado)
+        np.testing.assert_allclose(dist[finitos, coluna], esperado[finitos], rtol=1e-4)
+
+
+def test_tempos_a_partir_grafo_dirigido():
+    rng = np.random.default_rng(2)
+    n = 300
+    origem, destino = rng.integers(0, n, 1500), rng.integers(0, n, 1500)
+    ordem = np.argsort(origem, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(origem, minlength=n), out=indptr[1:])
+    grafo = GrafoViario(indptr, destino[ordem].astype(np.int32), rng.uniform(1, 100, 1500).astype(np.float32),
+                        rng.uniform(-50, -49, n), rng.uniform(-10, -9, n))
+    dist = grafo.tempos_a_partir([0, 7], delta_s=25.0)
+    for coluna, origem in enumerate([0, 7]):
+        np.testing.assert_allclose(dist[:, coluna], dijkstra(grafo, origem), rtol=1e-4)
@@ -0,0 +1,100 @@
+import io
+import sqlite3
+
+import pytest
+
+from raio_atuacao.migracao import migrar_incremental
+from raio_atuacao.preparados import carregar_preparados, versao_atual
+from sinteticos import atualizar_entradas, dividir_kml, gerar_analistas, gerar_kml
+
+CHAVE = ["ESPECIALISTA", "UNIDADE", "UNIDADE_normalized"]
+SQL_VINCULOS = """
+    SELECT f.nome_fazenda, e.nome, e.gestor, e.latitude_base, e.longitude_base,
+           f.latitude_centroide, f.longitude_centroide, f.geometria_wkb
+    FROM fazendas f JOIN especialistas e ON e.id = f.especialista_id
+    ORDER BY f.nome_fazenda, e.nome
+"""
+
+
+def para_excel(df):
+    saida = io.BytesIO()
+    df.to_excel(saida, index=False)
+    return saida.getvalue()
+
+
+def vinculos(caminho):
+    conn = sqlite3.connect(caminho)
+    try:
+        return conn.execute(SQL_VINCULOS).fetchall()
+    finally:
+        conn.close()
+
+
+def resumo(resultado):
+    df = resultado["df_analistas"].sort_values(CHAVE)
+    return df[CHAVE + ["DISTANCIA_KM"]].reset_index(drop=True)
+
+
+@pytest.fixture
+def entradas():
+    kml_1, df_1 = gerar_kml(200), gerar_analistas(200)
+    kml_2, df_2 = atualizar_entradas(kml_1, df_1, 0.05)
+    return (kml_1, para_excel(df_1)), (kml_2, para_excel(df_2))
+
+
+@pytest.fixture(autouse=True)
+def preparados(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAIO_DADOS_PREPARADOS", str(tmp_path / "preparados"))
+
+
+def test_incremental_igual_a_completa(tmp_path, entradas):
+    anterior, atual = entradas
+    completa = migrar_incremental(*atual, caminho_banco=str(tmp_path / "completa.db"))
+    migrar_incremental(*anterior, caminho_banco=str(tmp_path / "incremental.db"))
+    incremental = migrar_incremental(*atual, caminho_banco=str(tmp_path / "incremental.db"))
+
+    assert incremental["delta"]["modo"] == "incremental"
+    assert incremental["delta"]["fazendas"]["alteradas"] > 0
+    assert vinculos(tmp_path / "incremental.db") == vinculos(tmp_path / "completa.db")
+    assert resumo(incremental).equals(resumo(completa))
+
+
+def test_mudanca_de_limiar(tmp_path, entradas):
+    _, atual = entradas
+    completa = migrar_incremental(*atual, limiar=80, caminho_banco=str(tmp_path / "completa.db"))
+    migrar_incremental(*atual, limiar=100, caminho_banco=str(tmp_path / "incremental.db"))
+    incremental = migrar_incremental(*atual, limiar=80, caminho_banco=str(tmp_path / "incremental.db"))
+
+    assert len(incremental["correspondencias"]) == len(completa["correspondencias"])
+    assert vinculos(tmp_path / "incremental.db") == vinculos(tmp_path / "completa.db")
+    assert resumo(incremental).equals(resumo(completa))
+    # O dataset preparado salvo é o do limiar novo, não o da migração anterior
+    assert versao_atual() == incremental["versao"]
+    df_salvo, _ = carregar_preparados(incremental["versao"])
+    assert df_salvo["UNIDADE_normalized"].equals(incremental["df_analistas"]["UNIDADE_normalized"])
+
+
+def test_unidade_dividida_entre_arquivos(tmp_path, monkeypatch):
+    from raio_atuacao import migracao
+
+    kml, xlsx = gerar_kml(200), para_excel(gerar_analistas(200))
+    arquivos = dividir_kml(kml, 4)
+    # Fazenda partida entre o 1º e o 2º arquivo: muda só a parte do 2º
+    nome = arquivos[1][1].decode("utf-8").split("<name>", 1)[1].split("</name>", 1)[0]
+    assert f"<name>{nome}</name>".encode() in arquivos[0][1]
+    parte = arquivos[1][1].decode("utf-8").split("</Placemark>", 1)
+    area = parte[0].split('"AREA_HA">', 1)[1].split("<", 1)[0]
+    alterados = list(arquivos)
+    alterados[1] = (arquivos[1][0], (parte[0].replace(area, "999.9") + "</Placemark>" + parte[1]).encode("utf-8"))
+
+    completa = migrar_incremental(alterados, xlsx, caminho_banco=str(tmp_path / "completa.db"))
+    migrar_incremental(arquivos, xlsx, caminho_banco=str(tmp_path / "incremental.db"), processos=2)
+    relidos = []
+    ler_kmls = migracao.ler_kmls
+    monkeypatch.setattr(migracao, "ler_kmls", lambda arquivos, **kwargs: relidos.append(arquivos) or ler_kmls(arquivos, **kwargs))
+    incremental = migrar_incremental(alterados, xlsx, caminho_banco=str(tmp_path / "incremental.db"), processos=2)
+
+    assert incremental["delta"]["fazendas"]["alteradas"] == 1
+    assert [[nome for nome, _ in lista] for lista in relidos] == [[alterados[0][0], alterados[1][0]]]
+    assert vinculos(tmp_path / "incremental.db") == vinculos(tmp_path / "completa.db")
+    assert resumo(incremental).equals(resumo(completa))